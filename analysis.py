@@ -1,50 +1,202 @@
 # Core analysis functions for calculating betting probabilities
 
 import pandas as pd
-from scipy.stats import poisson
+import numpy as np
+import functools
+import heapq
 import math
-from collections import defaultdict
+import os
+import threading
+from collections import OrderedDict, defaultdict
 import logging
 
+import corners
+import metrics
+import odds
+import score_models
+
 # Setup basic logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# --- Helper Function to get Poisson Matrix ---
-
-def _get_poisson_matrix(lambda_casa, lambda_fora, max_goals=10):
-    """Calculates the matrix of probabilities for each exact scoreline (i, j)."""
+# --- Configuration ---
+MAX_GOALS = 10
+OVER_UNDER_LIMITS = [0.5, 1.5, 2.5, 3.5, 4.5]
+HANDICAP_LINES = [-1.5, -1.0, -0.5, 0.0, 0.5, 1.0, 1.5]
+TOP_PLACARES = 6
+CORNER_LIMITS = [7.5, 8.5, 9.5, 10.5, 11.5, 12.5]
+HT_FACTOR = 0.45 # Share of the full-time goal expectation scored before half-time
+HT_MAX_GOALS = 5
+SEGUNDO_TEMPO_MAX_GOALS = 7 # Allow more goals in 2H
+# Lambdas are rounded to this step before the goals markets are computed/memoized (0 = exact values, memo keyed
+# on the exact floats). 0.01 shares buckets between nearby fixtures at up to ~0.5 pp of drift (verificar_precisao_memo).
+LAMBDA_QUANT_STEP = float(os.getenv("LAMBDA_QUANT_STEP", "0"))
+MARKET_MEMO_SIZE = int(os.getenv("MARKET_MEMO_SIZE", "4096")) # Memoized lambda buckets (0 disables)
+# Same key order the HT/FT dict always had, so ties in the report keep sorting the same way
+HT_FT_KEYS = ["X/X", "X/2", "X/1", "2/2", "2/X", "2/1", "1/1", "1/X", "1/2"]
+
+# --- Helper Functions for the Score Matrix ---
+
+def _lambdas_validos(lambda_casa, lambda_fora):
+    """Checks that both lambdas are positive numbers."""
+    return (isinstance(lambda_casa, (int, float)) and lambda_casa > 0 and
+            isinstance(lambda_fora, (int, float)) and lambda_fora > 0)
+
+def _get_score_matrices(lambdas_casa, lambdas_fora, max_goals=MAX_GOALS, modelos=None, parametros=None):
+    """Builds normalized score matrices for N fixtures at once as an (N, G, G) tensor (G = max_goals + 1).
+
+    `modelos`/`parametros` pick a score_models backend per fixture (independent Poisson when omitted). Also
+    returns a boolean mask of fixtures whose raw matrix had positive total probability (the others are NaN).
+    """
+    return score_models.score_matrices(lambdas_casa, lambdas_fora, max_goals, modelos, parametros)
+
+def _get_score_matrix(lambda_casa, lambda_fora, max_goals=MAX_GOALS):
+    """Builds the normalized (max_goals+1)x(max_goals+1) scoreline matrix as a dense NumPy array.
+
+    Rows are home goals and columns away goals; the matrix is the outer product of the two Poisson pmf
+    vectors. Returns None for invalid lambdas.
+    """
+    if not _lambdas_validos(lambda_casa, lambda_fora):
+        logging.error(f"Lambdas inválidos para _get_score_matrix: casa={lambda_casa}, fora={lambda_fora}")
+        return None
+
+    matrices, valid = _get_score_matrices([lambda_casa], [lambda_fora], max_goals)
+    if not valid[0]:
+        logging.warning(f"Probabilidade total bruta na matriz Poisson é zero ou inválida (casa={lambda_casa}, fora={lambda_fora}).")
+        return None
+    return matrices[0]
+
+def _matrix_to_dict(score_matrix):
+    """Converts a dense score matrix into the legacy {(i, j): prob} dict."""
     matrix = defaultdict(float)
-    total_prob_raw = 0
-    # Ensure lambdas are valid numbers > 0
-    if not (isinstance(lambda_casa, (int, float)) and lambda_casa > 0 and 
-            isinstance(lambda_fora, (int, float)) and lambda_fora > 0):
-        logging.error(f"Lambdas inválidos para _get_poisson_matrix: casa={lambda_casa}, fora={lambda_fora}")
-        return defaultdict(float)
-        
-    for i in range(max_goals + 1):
-        for j in range(max_goals + 1):
-            try:
-                prob = poisson.pmf(i, lambda_casa) * poisson.pmf(j, lambda_fora)
-                matrix[(i, j)] = prob
-                total_prob_raw += prob
-            except ValueError as e:
-                logging.error(f"Erro no cálculo de Poisson PMF para ({i},{j}) com lambdas ({lambda_casa},{lambda_fora}): {e}")
-                return defaultdict(float) # Return empty on error
-            
-    if total_prob_raw <= 0:
-        logging.warning(f"Probabilidade total bruta na matriz Poisson é zero ou negativa ({total_prob_raw}). Retornando matriz vazia.")
-        return defaultdict(float)
-        
-    # Normalize the matrix probabilities
-    try:
-        for score in matrix:
-            matrix[score] = matrix[score] / total_prob_raw
-    except ZeroDivisionError:
-        logging.error("Erro de divisão por zero ao normalizar a matriz Poisson.")
-        return defaultdict(float)
-        
+    rows, cols = score_matrix.shape
+    for i in range(rows):
+        for j in range(cols):
+            matrix[(i, j)] = float(score_matrix[i, j])
+    return matrix
+
+def _as_score_array(poisson_matrix):
+    """Accepts either a dense score matrix or the legacy dict and returns a dense array (None if empty)."""
+    if isinstance(poisson_matrix, np.ndarray):
+        return poisson_matrix if poisson_matrix.size else None
+    if not poisson_matrix:
+        return None
+    size = max(max(i, j) for i, j in poisson_matrix) + 1
+    matrix = np.zeros((size, size))
+    for (i, j), prob in poisson_matrix.items():
+        matrix[i, j] = prob
     return matrix
 
+def _get_poisson_matrix(lambda_casa, lambda_fora, max_goals=MAX_GOALS):
+    """Calculates the matrix of probabilities for each exact scoreline (i, j) as a dict (legacy interface)."""
+    score_matrix = _get_score_matrix(lambda_casa, lambda_fora, max_goals)
+    if score_matrix is None:
+        return defaultdict(float)
+    return _matrix_to_dict(score_matrix)
+
+@functools.lru_cache(maxsize=16)
+def _score_projections(size):
+    """Returns 0/1 matrices projecting a flattened score matrix onto goal-difference and total-goals pmfs."""
+    goals = np.arange(size)
+    cells = np.arange(size * size)
+    diff_index = (goals[:, None] - goals[None, :]).ravel() + (size - 1)
+    total_index = (goals[:, None] + goals[None, :]).ravel()
+    diff_proj = np.zeros((size * size, 2 * size - 1))
+    diff_proj[cells, diff_index] = 1.0
+    total_proj = np.zeros((size * size, 2 * size - 1))
+    total_proj[cells, total_index] = 1.0
+    return diff_proj, total_proj
+
+def _calcular_mercados_arrays(score_matrix, limits=OVER_UNDER_LIMITS, handicap_lines=HANDICAP_LINES):
+    """Computes every goals market from a score matrix in one pass, as arrays (no rounding/formatting).
+
+    All markets are masked sums over the goal-difference and total-goals distributions, which are
+    obtained from the matrix with a single projection each.
+    """
+    size = score_matrix.shape[-1]
+    diff_proj, total_proj = _score_projections(size)
+    flat = score_matrix.reshape(score_matrix.shape[:-2] + (size * size,))
+    diff_pmf = flat @ diff_proj # P(home - away = d), d = -(size-1)..(size-1)
+    total_pmf = flat @ total_proj # P(home + away = t), t = 0..2(size-1)
+
+    diffs = np.arange(-(size - 1), size)
+    totals = np.arange(2 * size - 1)
+
+    lines = np.asarray(handicap_lines, dtype=float)[:, None]
+    adjusted = diffs[None, :] + lines
+    is_whole_line = lines == np.floor(lines)
+
+    limits_arr = np.asarray(limits, dtype=float)[:, None]
+
+    return {
+        "casa": diff_pmf[..., diffs > 0].sum(axis=-1),
+        "empate": diff_pmf[..., size - 1],
+        "fora": diff_pmf[..., diffs < 0].sum(axis=-1),
+        "ah_casa": diff_pmf @ (adjusted > 0).T,
+        "ah_fora": diff_pmf @ (adjusted < 0).T,
+        "ah_push": diff_pmf @ ((adjusted == 0) & is_whole_line).T,
+        "over": total_pmf @ (totals[None, :] > limits_arr).T,
+        "under": total_pmf @ (totals[None, :] < limits_arr).T,
+        "gg": score_matrix[..., 1:, 1:].sum(axis=(-2, -1)),
+    }
+
+def _formatar_1x2(arrays):
+    """Formats 1X2 market arrays into the percentage dict used in previsoes."""
+    return {
+        "casa": round(float(arrays["casa"]) * 100, 1),
+        "empate": round(float(arrays["empate"]) * 100, 1),
+        "fora": round(float(arrays["fora"]) * 100, 1)
+    }
+
+def _formatar_handicaps(arrays, handicap_lines):
+    """Formats Asian Handicap arrays into one dict per line (push only on whole lines)."""
+    results = []
+    for k, line in enumerate(handicap_lines):
+        result_line = {
+            "linha": f"{line:+.1f}",
+            "casa": round(float(arrays["ah_casa"][k]) * 100, 1),
+            "fora": round(float(arrays["ah_fora"][k]) * 100, 1)
+        }
+        prob_push = float(arrays["ah_push"][k])
+        if prob_push > 0:
+             result_line["push"] = round(prob_push * 100, 1)
+        results.append(result_line)
+    return results
+
+def _formatar_over_under(arrays, limits):
+    """Formats Over/Under arrays into one dict per limit."""
+    return [{
+        "limite": limit,
+        "over": round(float(arrays["over"][k]) * 100, 1),
+        "under": round(float(arrays["under"][k]) * 100, 1)
+    } for k, limit in enumerate(limits)]
+
+def _formatar_ambas_marcam(arrays):
+    """Formats the BTTS probability into the Sim/Não dict."""
+    prob_gg = float(arrays["gg"])
+    return {
+        "sim": round(prob_gg * 100, 1),
+        "nao": round((1.0 - prob_gg) * 100, 1)
+    }
+
+def _formatar_placar_exato(score_matrix, top_n):
+    """Returns the top N scorelines of a score matrix as {"placar", "prob"} dicts."""
+    size = score_matrix.shape[-1]
+    flat = score_matrix.ravel()
+    # Stable sort keeps row-major order among ties, matching the legacy dict-based ranking
+    order = np.argsort(-flat, kind="stable")[:top_n]
+    return [{"placar": f"{idx // size}-{idx % size}", "prob": round(float(flat[idx]) * 100, 1)} for idx in order]
+
+def calcular_mercados(score_matrix, limits=OVER_UNDER_LIMITS, handicap_lines=HANDICAP_LINES, top_n=TOP_PLACARES):
+    """Calculates 1X2, Asian Handicap, Over/Under, BTTS and Correct Score from one dense score matrix."""
+    arrays = _calcular_mercados_arrays(score_matrix, limits, handicap_lines)
+    return {
+        "1X2": _formatar_1x2(arrays),
+        "handicap_asiatico": _formatar_handicaps(arrays, handicap_lines),
+        "over_under_gols": _formatar_over_under(arrays, limits),
+        "ambos_marcam": _formatar_ambas_marcam(arrays),
+        "placar_exato": _formatar_placar_exato(score_matrix, top_n),
+    }
+
 # --- Probability Calculation Functions ---
 
 def _calculate_lambda(api_data):
@@ -62,247 +214,184 @@ def _calculate_lambda(api_data):
         return 1.5, 1.2
 
 def calcular_1x2(poisson_matrix):
-    """Calculates Win/Draw/Loss (1X2) probabilities from the Poisson matrix."""
-    prob_vitoria_casa = 0
-    prob_empate = 0
-    prob_vitoria_fora = 0
-
-    if not poisson_matrix:
+    """Calculates Win/Draw/Loss (1X2) probabilities from the Poisson matrix (dense array or legacy dict)."""
+    score_matrix = _as_score_array(poisson_matrix)
+    if score_matrix is None:
         logging.error("Matriz Poisson vazia em calcular_1x2. Retornando padrão.")
         return {"casa": 33.3, "empate": 33.3, "fora": 33.3}
-        
-    for (i, j), prob in poisson_matrix.items():
-        if i > j:
-            prob_vitoria_casa += prob
-        elif i == j:
-            prob_empate += prob
-        else:
-            prob_vitoria_fora += prob
-            
-    return {
-        "casa": round(prob_vitoria_casa * 100, 1),
-        "empate": round(prob_empate * 100, 1),
-        "fora": round(prob_vitoria_fora * 100, 1)
-    }
+    return _formatar_1x2(_calcular_mercados_arrays(score_matrix, limits=[], handicap_lines=[]))
 
-def calcular_handicaps(poisson_matrix, handicap_lines=[-1.5, -1.0, -0.5, 0.0, 0.5, 1.0, 1.5]):
+def calcular_handicaps(poisson_matrix, handicap_lines=HANDICAP_LINES):
     """Calculates Asian Handicap (AH) probabilities for various lines."""
-    results = []
-    if not poisson_matrix:
+    score_matrix = _as_score_array(poisson_matrix)
+    if score_matrix is None:
         logging.error("Matriz Poisson vazia em calcular_handicaps. Retornando lista vazia.")
         return []
+    arrays = _calcular_mercados_arrays(score_matrix, limits=[], handicap_lines=handicap_lines)
+    return _formatar_handicaps(arrays, handicap_lines)
 
-    for line in handicap_lines:
-        prob_casa_ah = 0
-        prob_fora_ah = 0
-        prob_push = 0
-
-        for (i, j), prob in poisson_matrix.items():
-            diff = i - j
-            if diff + line > 0:
-                prob_casa_ah += prob
-            elif diff + line < 0:
-                prob_fora_ah += prob
-            elif diff + line == 0 and line == int(line):
-                 prob_push += prob
-
-        result_line = {
-            "linha": f"{line:+.1f}",
-            "casa": round(prob_casa_ah * 100, 1),
-            "fora": round(prob_fora_ah * 100, 1)
-        }
-        if prob_push > 0:
-             result_line["push"] = round(prob_push * 100, 1)
-             
-        results.append(result_line)
-        
-    return results
-
-def calcular_over_under(poisson_matrix, limits=[0.5, 1.5, 2.5, 3.5, 4.5]):
+def calcular_over_under(poisson_matrix, limits=OVER_UNDER_LIMITS):
     """Calculates Over/Under goals probabilities for various limits."""
-    results = []
-    if not poisson_matrix:
+    score_matrix = _as_score_array(poisson_matrix)
+    if score_matrix is None:
         logging.error("Matriz Poisson vazia em calcular_over_under. Retornando lista vazia.")
         return []
-        
-    for limit in limits:
-        prob_over = 0
-        prob_under = 0
-        for (i, j), prob in poisson_matrix.items():
-            total_goals = i + j
-            if total_goals > limit:
-                prob_over += prob
-            elif total_goals < limit:
-                prob_under += prob
-            
-        results.append({
-            "limite": limit,
-            "over": round(prob_over * 100, 1),
-            "under": round(prob_under * 100, 1)
-        })
-    return results
+    arrays = _calcular_mercados_arrays(score_matrix, limits=limits, handicap_lines=[])
+    return _formatar_over_under(arrays, limits)
 
 def calcular_ambas_marcam(poisson_matrix):
     """Calculates Both Teams To Score (BTTS) probabilities (GG/NG)."""
-    prob_gg = 0
-    if not poisson_matrix:
+    score_matrix = _as_score_array(poisson_matrix)
+    if score_matrix is None:
         logging.error("Matriz Poisson vazia em calcular_ambas_marcam. Retornando padrão.")
         return {"sim": 50.0, "nao": 50.0}
-        
-    for (i, j), prob in poisson_matrix.items():
-        if i > 0 and j > 0:
-            prob_gg += prob
-            
-    prob_ng = 1.0 - prob_gg
-    
-    return {
-        "sim": round(prob_gg * 100, 1),
-        "nao": round(prob_ng * 100, 1)
-    }
-
-def calcular_ht_ft(api_data, ht_factor=0.45):
-    """Calculates Half-Time/Full-Time probabilities using a refined (but still approximate) model."""
+    return _formatar_ambas_marcam(_calcular_mercados_arrays(score_matrix, limits=[], handicap_lines=[]))
+
+def _calcular_ht_ft_arrays(lambdas_casa, lambdas_fora, ht_factor=HT_FACTOR):
+    """Computes P(HT result, FT result) for N fixtures as an (N, 3, 3) array (axis order: 1, X, 2).
+
+    Works on goal-difference distributions: the HT difference pmf is split by HT state and convolved with
+    the 2nd-half difference pmf, giving the FT difference pmf per HT state. Also returns a validity mask.
+    """
+    lambdas_casa = np.asarray(lambdas_casa, dtype=float)
+    lambdas_fora = np.asarray(lambdas_fora, dtype=float)
+    lambdas_casa_ht = lambdas_casa * ht_factor
+    lambdas_fora_ht = lambdas_fora * ht_factor
+    lambdas_casa_2h = np.maximum(0.01, lambdas_casa - lambdas_casa_ht)
+    lambdas_fora_2h = np.maximum(0.01, lambdas_fora - lambdas_fora_ht)
+
+    ht_matrices, ht_valid = _get_score_matrices(lambdas_casa_ht, lambdas_fora_ht, HT_MAX_GOALS)
+    matrices_2h, valid_2h = _get_score_matrices(lambdas_casa_2h, lambdas_fora_2h, SEGUNDO_TEMPO_MAX_GOALS)
+
+    ht_size, size_2h = HT_MAX_GOALS + 1, SEGUNDO_TEMPO_MAX_GOALS + 1
+    ht_diff_pmf = ht_matrices.reshape(-1, ht_size * ht_size) @ _score_projections(ht_size)[0]
+    diff_pmf_2h = matrices_2h.reshape(-1, size_2h * size_2h) @ _score_projections(size_2h)[0]
+
+    # HT difference pmf split by HT state: (N, 3, D_ht)
+    ht_diffs = np.arange(-(ht_size - 1), ht_size)
+    state_masks = np.stack([ht_diffs > 0, ht_diffs == 0, ht_diffs < 0]).astype(float)
+    ht_by_state = ht_diff_pmf[:, None, :] * state_masks[None, :, :]
+
+    # FT difference = HT difference + 2H difference, so its pmf is the convolution of the two pmfs
+    n_2h = diff_pmf_2h.shape[-1]
+    ft_by_state = np.zeros(ht_by_state.shape[:2] + (ht_by_state.shape[-1] + n_2h - 1,))
+    for k in range(n_2h):
+        ft_by_state[:, :, k:k + ht_by_state.shape[-1]] += ht_by_state * diff_pmf_2h[:, None, k:k + 1]
+
+    ft_diffs = np.arange(-(ht_size - 1) - (size_2h - 1), ht_size + size_2h - 1)
+    ft_masks = np.stack([ft_diffs > 0, ft_diffs == 0, ft_diffs < 0]).astype(float)
+    ht_ft = ft_by_state @ ft_masks.T
+
+    totals = ht_ft.sum(axis=(-2, -1))
+    valid = ht_valid & valid_2h & (totals > 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ht_ft = ht_ft / totals[:, None, None]
+    return ht_ft, valid
+
+def _formatar_ht_ft(ht_ft):
+    """Formats one fixture's (3, 3) HT/FT array into the {"1/X": prob, ...} dict."""
+    states = {"1": 0, "X": 1, "2": 2}
+    return {key: round(float(ht_ft[states[key[0]], states[key[2]]]) * 100, 1) for key in HT_FT_KEYS}
+
+def calcular_ht_ft(api_data, ht_factor=HT_FACTOR, lambdas=None):
+    """Calculates Half-Time/Full-Time probabilities using a refined (but still approximate) model.
+
+    `lambdas` may carry precomputed (lambda_casa, lambda_fora) full-time values to skip re-deriving them.
+    """
     logging.info(f"Calculando HT/FT usando fator HT={ht_factor}")
-    lambda_casa_ft, lambda_fora_ft = _calculate_lambda(api_data)
-    
-    # Calculate HT lambdas
-    lambda_casa_ht = lambda_casa_ft * ht_factor
-    lambda_fora_ht = lambda_fora_ft * ht_factor
-    
-    # Calculate 2nd Half lambdas (ensure non-negative)
-    lambda_casa_2h = max(0.01, lambda_casa_ft - lambda_casa_ht)
-    lambda_fora_2h = max(0.01, lambda_fora_ft - lambda_fora_ht)
-    
-    # Get Poisson matrices for HT and 2H
-    ht_matrix = _get_poisson_matrix(lambda_casa_ht, lambda_fora_ht, max_goals=5) 
-    matrix_2h = _get_poisson_matrix(lambda_casa_2h, lambda_fora_2h, max_goals=7) # Allow more goals in 2H
-    
-    if not ht_matrix or not matrix_2h:
-        logging.warning("Não foi possível calcular matrizes HT ou 2H para HT/FT. Retornando não implementado.")
-        return {"status": "Não implementado", "motivo": "Erro no cálculo das matrizes HT/2H."}
-
-    results = defaultdict(float)
-    total_prob_calculated = 0
-    
-    # Iterate through HT scores and 2H scores
-    for (i_ht, j_ht), prob_ht in ht_matrix.items():
-        for (i_2h, j_2h), prob_2h in matrix_2h.items():
-            # Final score
-            i_ft = i_ht + i_2h
-            j_ft = j_ht + j_2h
-            
-            # Determine HT result (1, X, 2)
-            if i_ht > j_ht: ht_res = "1"
-            elif i_ht == j_ht: ht_res = "X"
-            else: ht_res = "2"
-            
-            # Determine FT result (1, X, 2)
-            if i_ft > j_ft: ft_res = "1"
-            elif i_ft == j_ft: ft_res = "X"
-            else: ft_res = "2"
-            
-            ht_ft_key = f"{ht_res}/{ft_res}"
-            
-            # Probability of this path (assuming HT and 2H are independent given their lambdas)
-            prob_path = prob_ht * prob_2h
-            results[ht_ft_key] += prob_path
-            total_prob_calculated += prob_path
-
-    # Normalize results
-    if total_prob_calculated > 0:
-        final_results = {key: round((prob / total_prob_calculated) * 100, 1) for key, prob in results.items()}
-        logging.info(f"Probabilidades HT/FT (Modelo Refinado): {final_results}")
-        return final_results
-    else:
-        logging.warning("Probabilidade total HT/FT calculada foi zero. Retornando não implementado.")
-        return {"status": "Não implementado", "motivo": "Probabilidade total zero no modelo HT/FT."}
+    lambda_casa_ft, lambda_fora_ft = lambdas if lambdas is not None else _calculate_lambda(api_data)
+    resultados = calcular_ht_ft_lote([lambda_casa_ft], [lambda_fora_ft], ht_factor)
+    logging.info(f"Probabilidades HT/FT (Modelo Refinado): {resultados[0]}")
+    return resultados[0]
+
+def calcular_ht_ft_lote(lambdas_casa, lambdas_fora, ht_factor=HT_FACTOR):
+    """Calculates HT/FT probabilities for a batch of fixtures from their full-time lambdas."""
+    ht_ft, valid = _calcular_ht_ft_arrays(lambdas_casa, lambdas_fora, ht_factor)
+    resultados = []
+    for n in range(len(valid)):
+        if valid[n]:
+            resultados.append(_formatar_ht_ft(ht_ft[n]))
+        else:
+            logging.warning("Não foi possível calcular matrizes HT ou 2H para HT/FT. Retornando não implementado.")
+            resultados.append({"status": "Não implementado", "motivo": "Erro no cálculo das matrizes HT/2H."})
+    return resultados
 
-def calcular_placar_exato(poisson_matrix, top_n=6):
+def calcular_placar_exato(poisson_matrix, top_n=TOP_PLACARES):
     """Calculates Correct Score probabilities and returns the top N most likely."""
-    if not poisson_matrix:
+    score_matrix = _as_score_array(poisson_matrix)
+    if score_matrix is None:
         logging.error("Matriz Poisson vazia em calcular_placar_exato. Retornando lista vazia.")
         return []
-        
-    sorted_scores = sorted(poisson_matrix.items(), key=lambda item: item[1], reverse=True)
+    return _formatar_placar_exato(score_matrix, top_n)
+
+def _extrair_medias_cantos(api_data):
+    """Reads and validates the average corners of both teams from api_data (falling back to 6.0/5.0)."""
+    avg_corners_home = api_data.get("avg_corners_home", 6.0)
+    avg_corners_away = api_data.get("avg_corners_away", 5.0)
     
+    if not isinstance(avg_corners_home, (int, float)) or avg_corners_home < 0:
+         logging.warning(f"avg_corners_home inválido ({avg_corners_home}). Usando padrão 6.0")
+         avg_corners_home = 6.0
+    if not isinstance(avg_corners_away, (int, float)) or avg_corners_away < 0:
+         logging.warning(f"avg_corners_away inválido ({avg_corners_away}). Usando padrão 5.0")
+         avg_corners_away = 5.0
+    return avg_corners_home, avg_corners_away
+
+def _extrair_cantos_sofridos(api_data):
+    """Reads the average corners conceded by both teams from api_data (NaN when unknown)."""
+    sofridos = []
+    for key in ("avg_corners_against_home", "avg_corners_against_away"):
+        value = api_data.get(key)
+        sofridos.append(float(value) if isinstance(value, (int, float)) and value >= 0 else np.nan)
+    return tuple(sofridos)
+
+def _parametros_cantos(lista_api_data):
+    """Expected total corners and league dispersion for N fixtures, as arrays."""
+    medias = np.array([_extrair_medias_cantos(api_data) + _extrair_cantos_sofridos(api_data) for api_data in lista_api_data], dtype=float).reshape(-1, 4)
+    dispersions = [corners.LEAGUE_DISPERSIONS.get(api_data.get("league_id")) for api_data in lista_api_data]
+    return corners.expected_total(medias[:, 0], medias[:, 1], medias[:, 2], medias[:, 3]), dispersions
+
+def _calcular_cantos_arrays(lambdas_cantos, corner_limits, dispersions=None):
+    """Computes Over/Under corner probabilities for N fixtures as (N, L) arrays from the cached CDF tables.
+
+    Fixtures are negative binomial with their league's dispersion (corners.CORNERS_DISPERSION if not given).
+    """
+    prob_over, prob_under = corners.over_under(lambdas_cantos, corner_limits, dispersions)
+    return prob_over, prob_under, np.ones(len(prob_over), dtype=bool)
+
+def _formatar_cantos(prob_over, prob_under, corner_limits):
+    """Formats one fixture's corner probabilities, making sure rounded Over + Under never exceeds 100%."""
     results = []
-    for (i, j), prob in sorted_scores[:top_n]:
+    for k, limit in enumerate(corner_limits):
+        over, under = float(prob_over[k]), float(prob_under[k])
+        if round(over * 100, 1) + round(under * 100, 1) > 100.0:
+            # Simple adjustment: slightly reduce the larger probability
+            if over > under:
+                over = 1.0 - under
+            else:
+                under = 1.0 - over
         results.append({
-            "placar": f"{i}-{j}",
-            "prob": round(prob * 100, 1)
+            "limite": limit,
+            "over": round(over * 100, 1),
+            "under": round(under * 100, 1)
         })
     return results
 
-def calcular_total_cantos(api_data, corner_limits=[7.5, 8.5, 9.5, 10.5, 11.5, 12.5]):
-    """Calculates Total Corners Over/Under probabilities using a Poisson model."""
-    # Model refinement: Could potentially use Negative Binomial or adjust lambda based on H2H/recent form.
-    # For now, keeping the Poisson model but ensuring data input is robust.
-    results = []
+def calcular_total_cantos(api_data, corner_limits=CORNER_LIMITS):
+    """Calculates Total Corners Over/Under probabilities using a negative binomial model."""
     try:
-        avg_corners_home = api_data.get("avg_corners_home", 6.0)
-        avg_corners_away = api_data.get("avg_corners_away", 5.0)
-        
-        if not isinstance(avg_corners_home, (int, float)) or avg_corners_home < 0:
-             logging.warning(f"avg_corners_home inválido ({avg_corners_home}). Usando padrão 6.0")
-             avg_corners_home = 6.0
-        if not isinstance(avg_corners_away, (int, float)) or avg_corners_away < 0:
-             logging.warning(f"avg_corners_away inválido ({avg_corners_away}). Usando padrão 5.0")
-             avg_corners_away = 5.0
-             
-        lambda_cantos = avg_corners_home + avg_corners_away
-        lambda_cantos = max(0.1, lambda_cantos)
-        
-        logging.info(f"Calculando probabilidades de Cantos Totais usando lambda = {lambda_cantos:.2f}")
+        lambdas_cantos, dispersions = _parametros_cantos([api_data])
+        logging.info(f"Calculando probabilidades de Cantos Totais usando média = {lambdas_cantos[0]:.2f} (r = {dispersions[0]:.1f})")
 
-        # Determine reasonable max corners to calculate up to
-        max_corners_calc = int(lambda_cantos + 4 * math.sqrt(lambda_cantos)) 
-        max_corners_calc = max(max_corners_calc, int(max(corner_limits) + 5)) # Ensure we cover limits
-        max_corners_calc = min(max_corners_calc, 30) # Add a practical upper limit
-        
-        prob_over = defaultdict(float)
-        prob_under = defaultdict(float)
-        total_prob = 0
-
-        for k in range(max_corners_calc + 1):
-            prob_k = poisson.pmf(k, lambda_cantos)
-            total_prob += prob_k
-            for limit in corner_limits:
-                if k > limit:
-                    prob_over[limit] += prob_k
-                elif k < limit:
-                    prob_under[limit] += prob_k
-        
-        # Normalize probabilities 
-        if total_prob > 0:
-             # Adjust probs based on calculated total (might be slightly < 1 due to max_corners_calc)
-             norm_factor = 1.0 / total_prob 
-             for limit in corner_limits:
-                 prob_over[limit] *= norm_factor
-                 prob_under[limit] *= norm_factor
-                 # Ensure Over + Under doesn't exceed 100 due to rounding
-                 if round(prob_over[limit] * 100, 1) + round(prob_under[limit] * 100, 1) > 100.0:
-                     # Simple adjustment: slightly reduce the larger probability
-                     if prob_over[limit] > prob_under[limit]:
-                         prob_over[limit] = 1.0 - prob_under[limit]
-                     else:
-                         prob_under[limit] = 1.0 - prob_over[limit]
-                         
-        else:
+        prob_over, prob_under, valid = _calcular_cantos_arrays(lambdas_cantos, corner_limits, dispersions)
+        if not valid[0]:
              logging.warning("Probabilidade total para cantos foi zero. Não é possível calcular Over/Under.")
              return []
-
-        for limit in corner_limits:
-            results.append({
-                "limite": limit,
-                "over": round(prob_over[limit] * 100, 1),
-                "under": round(prob_under[limit] * 100, 1)
-            })
+        return _formatar_cantos(prob_over[0], prob_under[0], corner_limits)
             
     except Exception as e:
         logging.error(f"Erro ao calcular cantos totais: {e}", exc_info=True)
         return []
-        
-    return results
 
 # --- Value Bet Detection ---
 
@@ -324,228 +413,374 @@ def detectar_value_bet(prob_calculada, odd_mercado):
 # --- Best Bet Selection ---
 
 def _parse_odds(raw_odds_data):
-    """Parses the raw odds data from the API into a structured dictionary."""
-    parsed = {
-        "1X2": {},
-        "OverUnderGols": {},
-        "BTTS": {},
-        "AH": {},
-        "OverUnderCantos": {}
-    }
-    if not raw_odds_data or not isinstance(raw_odds_data, dict):
-        logging.warning("Dados brutos de odds ausentes ou inválidos para parse.")
-        return parsed
-
-    bets = raw_odds_data.get("bets", [])
-    for bet in bets:
-        if not isinstance(bet, dict):
-            continue
-        bet_id = bet.get("id")
-        bet_name = bet.get("name", "").lower()
-        values = bet.get("values", [])
-
-        try:
-            # Match Result (1X2)
-            if bet_id == 1 or "match winner" in bet_name or "resultado final" in bet_name:
-                for v in values:
-                    if v.get("value") == "Home": parsed["1X2"]["casa"] = float(v["odd"])
-                    elif v.get("value") == "Draw": parsed["1X2"]["empate"] = float(v["odd"])
-                    elif v.get("value") == "Away": parsed["1X2"]["fora"] = float(v["odd"])
-            
-            # Over/Under Goals
-            elif bet_id == 5 or "over/under" in bet_name and "corners" not in bet_name: # Avoid matching corners OU
-                for v in values:
-                    val_str = v.get("value", "")
-                    if "Over " in val_str:
-                        limit = float(val_str.replace("Over ", ""))
-                        parsed["OverUnderGols"][f"Over{limit}"] = float(v["odd"])
-                    elif "Under " in val_str:
-                        limit = float(val_str.replace("Under ", ""))
-                        parsed["OverUnderGols"][f"Under{limit}"] = float(v["odd"])
-                        
-            # Both Teams To Score
-            elif bet_id == 8 or "both teams score" in bet_name or "ambas marcam" in bet_name:
-                for v in values:
-                    if v.get("value") == "Yes": parsed["BTTS"]["Sim"] = float(v["odd"])
-                    elif v.get("value") == "No": parsed["BTTS"]["Nao"] = float(v["odd"])
-                    
-            # Asian Handicap
-            elif bet_id == 4 or "asian handicap" in bet_name:
-                 for v in values:
-                     parts = v.get("value", "").split(" ")
-                     if len(parts) == 2:
-                         team = parts[0].lower()
-                         line = float(parts[1])
-                         key = f"{line:+.1f}_{team}" 
-                         parsed["AH"][key] = float(v["odd"])
-                         
-            # Corners Over/Under
-            elif "corners over/under" in bet_name or "total corners" in bet_name: 
-                 for v in values:
-                    val_str = v.get("value", "")
-                    if "Over " in val_str:
-                        limit = float(val_str.replace("Over ", ""))
-                        parsed["OverUnderCantos"][f"Over{limit}"] = float(v["odd"])
-                    elif "Under " in val_str:
-                        limit = float(val_str.replace("Under ", ""))
-                        parsed["OverUnderCantos"][f"Under{limit}"] = float(v["odd"])
-                        
-        except (ValueError, TypeError, AttributeError) as e:
-            logging.warning(f"Erro ao parsear odd para {bet_name} - value: {v}: {e}")
-            continue
-            
+    """Parses the raw odds data from the API into {market: {selection: best price across bookmakers}}."""
+    parsed = odds.parse_odds_table(raw_odds_data).melhores_odds()
     logging.info(f"Odds Parseadas: {parsed}")
     return parsed
 
+# Value-bet market registry: (display name, odds market, extractor). The extractor yields
+# (selection label, odds key, probability in %) for every selection the predictions cover.
+MERCADOS_VALOR = []
+
+def registrar_mercado_valor(nome, mercado_odds):
+    """Registers an extractor so the value-bet scanner also prices this market (decorator)."""
+    def decorator(extrator):
+        MERCADOS_VALOR.append((nome, mercado_odds, extrator))
+        return extrator
+    return decorator
+
+@registrar_mercado_valor("1X2", odds.MERCADO_1X2)
+def _selecoes_1x2(previsoes):
+    probs = previsoes.get("1X2") or {}
+    for outcome in ["casa", "empate", "fora"]:
+        yield outcome.capitalize(), outcome, probs.get(outcome)
+
+def _selecoes_over_under(linhas):
+    for prob_item in linhas or []:
+        limit = prob_item.get("limite")
+        if limit is not None:
+            yield f"Over {limit}", f"Over{limit}", prob_item.get("over")
+            yield f"Under {limit}", f"Under{limit}", prob_item.get("under")
+
+@registrar_mercado_valor("Over/Under Gols", odds.MERCADO_OU_GOLS)
+def _selecoes_ou_gols(previsoes):
+    return _selecoes_over_under(previsoes.get("over_under_gols"))
+
+@registrar_mercado_valor("Ambas Marcam", odds.MERCADO_BTTS)
+def _selecoes_btts(previsoes):
+    probs = previsoes.get("ambos_marcam") or {}
+    for outcome in ["Sim", "Nao"]:
+        yield outcome, outcome, probs.get(outcome.lower())
+
+@registrar_mercado_valor("Handicap Asiático", odds.MERCADO_AH)
+def _selecoes_ah(previsoes):
+    for prob_item in previsoes.get("handicap_asiatico") or []:
+        line_str = prob_item.get("linha") # e.g., "-1.5"
+        if line_str is not None:
+            yield f"Casa {line_str}", f"{line_str}_home", prob_item.get("casa")
+            yield f"Fora {line_str}", f"{line_str}_away", prob_item.get("fora")
+
+@registrar_mercado_valor("Over/Under Cantos", odds.MERCADO_OU_CANTOS)
+def _selecoes_ou_cantos(previsoes):
+    return _selecoes_over_under(previsoes.get("over_under_cantos"))
+
+def escanear_value_bets(previsoes, odds_mercado, top_k=None):
+    """Returns the +EV bets (EV = probability x best odd > 1), ranked by EV, for every registered market.
+
+    Probabilities and prices of all selections are aligned into parallel arrays and EV is computed in one
+    vectorized pass; only the top_k bets (all when None) are ranked, via a heap. odds_mercado is an
+    odds.OddsTable or a parsed-odds dict. Each bet has mercado, selecao, odd, prob, ev, chave, casa and
+    prob_consenso (None when unknown).
+    """
+    tabela = odds_mercado if isinstance(odds_mercado, odds.OddsTable) else odds.tabela_de_dict(odds_mercado)
+    if not len(tabela) or not previsoes:
+        return []
+
+    rotulos = []
+    chaves = []
+    probs = []
+    for nome, mercado_odds, extrator in MERCADOS_VALOR:
+        for selecao, key, prob in extrator(previsoes):
+            if prob is None:
+                continue
+            try:
+                probs.append(float(prob))
+            except (TypeError, ValueError) as e:
+                logging.warning(f"Probabilidade inválida para {nome} {selecao} ({prob}): {e}")
+                continue
+            rotulos.append((nome, selecao))
+            chaves.append((mercado_odds, key))
+    if not chaves:
+        return []
+
+    linhas = tabela.alinhar(chaves)
+    cotado = linhas >= 0
+    precos = np.where(cotado, tabela.melhor_preco[linhas], np.nan)
+    prob_decimal = np.array(probs) / 100.0
+    with np.errstate(invalid="ignore"):
+        valido = cotado & (precos > 1.0) & (prob_decimal >= 0) & (prob_decimal <= 1.0)
+        ev = prob_decimal * precos
+        candidatos = np.flatnonzero(valido & (ev > 1.0))
+
+    ev_arredondado = {int(i): round(float(ev[i]), 3) for i in candidatos}
+    # nlargest is stable, so ties keep registry order
+    ordem = heapq.nlargest(top_k if top_k is not None else len(candidatos), ev_arredondado, key=ev_arredondado.get)
+    value_bets = []
+    for i in ordem:
+        linha = linhas[i]
+        consenso = tabela.prob_consenso[linha]
+        value_bets.append({
+            "mercado": rotulos[i][0], "selecao": rotulos[i][1], "odd": float(precos[i]), "prob": probs[i],
+            "ev": ev_arredondado[i], "chave": chaves[i], "casa": tabela.casas[tabela.melhor_casa[linha]],
+            "prob_consenso": None if np.isnan(consenso) else round(float(consenso) * 100, 1),
+        })
+    return value_bets
+
 def determinar_melhor_aposta(previsoes, odds_mercado):
-    """Determines the best bet based on calculated probabilities and market odds."""
-    if not odds_mercado or not isinstance(odds_mercado, dict):
+    """Determines the best bet based on calculated probabilities and market odds.
+
+    odds_mercado is either the parsed-odds dict or an odds.OddsTable; with a table every selection is priced
+    at the best odd across bookmakers and the pick also reports the book and the no-vig consensus probability.
+    """
+    if isinstance(odds_mercado, odds.OddsTable):
+        disponivel = len(odds_mercado) > 0
+    else:
+        disponivel = bool(odds_mercado) and isinstance(odds_mercado, dict)
+    if not disponivel:
         logging.warning("Odds de mercado não disponíveis ou inválidas para determinar melhor aposta.")
         return "N/A (Odds não disponíveis)"
-        
-    value_bets = []
-
-    # 1. Check 1X2
-    probs_1x2 = previsoes.get("1X2", {})
-    odds_1x2 = odds_mercado.get("1X2", {})
-    if probs_1x2 and odds_1x2:
-        for outcome in ["casa", "empate", "fora"]:
-            prob = probs_1x2.get(outcome)
-            odd = odds_1x2.get(outcome)
-            if prob is not None and odd is not None:
-                is_value, ev = detectar_value_bet(prob, odd)
-                if is_value:
-                    value_bets.append({"mercado": "1X2", "selecao": outcome.capitalize(), "odd": odd, "prob": prob, "ev": ev})
-
-    # 2. Check Over/Under Goals
-    probs_ou_gols = previsoes.get("over_under_gols", [])
-    odds_ou_gols = odds_mercado.get("OverUnderGols", {})
-    if probs_ou_gols and odds_ou_gols:
-        for prob_item in probs_ou_gols:
-            limit = prob_item.get("limite")
-            prob_over = prob_item.get("over")
-            prob_under = prob_item.get("under")
-            odd_over = odds_ou_gols.get(f"Over{limit}")
-            odd_under = odds_ou_gols.get(f"Under{limit}")
-            if limit is not None:
-                if prob_over is not None and odd_over is not None:
-                    is_value, ev = detectar_value_bet(prob_over, odd_over)
-                    if is_value:
-                        value_bets.append({"mercado": "Over/Under Gols", "selecao": f"Over {limit}", "odd": odd_over, "prob": prob_over, "ev": ev})
-                if prob_under is not None and odd_under is not None:
-                    is_value, ev = detectar_value_bet(prob_under, odd_under)
-                    if is_value:
-                        value_bets.append({"mercado": "Over/Under Gols", "selecao": f"Under {limit}", "odd": odd_under, "prob": prob_under, "ev": ev})
-
-    # 3. Check BTTS
-    probs_btts = previsoes.get("ambos_marcam", {})
-    odds_btts = odds_mercado.get("BTTS", {})
-    if probs_btts and odds_btts:
-        for outcome in ["Sim", "Nao"]:
-            prob = probs_btts.get(outcome.lower())
-            odd = odds_btts.get(outcome)
-            if prob is not None and odd is not None:
-                is_value, ev = detectar_value_bet(prob, odd)
-                if is_value:
-                    value_bets.append({"mercado": "Ambas Marcam", "selecao": outcome, "odd": odd, "prob": prob, "ev": ev})
-                    
-    # 4. Check Asian Handicap
-    probs_ah = previsoes.get("handicap_asiatico", [])
-    odds_ah = odds_mercado.get("AH", {})
-    if probs_ah and odds_ah:
-        for prob_item in probs_ah:
-            line_str = prob_item.get("linha") # e.g., "-1.5"
-            prob_casa = prob_item.get("casa")
-            prob_fora = prob_item.get("fora")
-            odd_casa_key = f"{line_str}_home"
-            odd_fora_key = f"{line_str}_away"
-            odd_casa = odds_ah.get(odd_casa_key)
-            odd_fora = odds_ah.get(odd_fora_key)
-            
-            if line_str is not None:
-                if prob_casa is not None and odd_casa is not None:
-                    is_value, ev = detectar_value_bet(prob_casa, odd_casa)
-                    if is_value:
-                        value_bets.append({"mercado": "Handicap Asiático", "selecao": f"Casa {line_str}", "odd": odd_casa, "prob": prob_casa, "ev": ev})
-                if prob_fora is not None and odd_fora is not None:
-                    is_value, ev = detectar_value_bet(prob_fora, odd_fora)
-                    if is_value:
-                        value_bets.append({"mercado": "Handicap Asiático", "selecao": f"Fora {line_str}", "odd": odd_fora, "prob": prob_fora, "ev": ev})
-                        
-    # 5. Check Over/Under Corners
-    probs_ou_cantos = previsoes.get("over_under_cantos", [])
-    odds_ou_cantos = odds_mercado.get("OverUnderCantos", {})
-    if probs_ou_cantos and odds_ou_cantos:
-        for prob_item in probs_ou_cantos:
-            limit = prob_item.get("limite")
-            prob_over = prob_item.get("over")
-            prob_under = prob_item.get("under")
-            odd_over = odds_ou_cantos.get(f"Over{limit}")
-            odd_under = odds_ou_cantos.get(f"Under{limit}")
-            if limit is not None:
-                if prob_over is not None and odd_over is not None:
-                    is_value, ev = detectar_value_bet(prob_over, odd_over)
-                    if is_value:
-                        value_bets.append({"mercado": "Over/Under Cantos", "selecao": f"Over {limit}", "odd": odd_over, "prob": prob_over, "ev": ev})
-                if prob_under is not None and odd_under is not None:
-                    is_value, ev = detectar_value_bet(prob_under, odd_under)
-                    if is_value:
-                        value_bets.append({"mercado": "Over/Under Cantos", "selecao": f"Under {limit}", "odd": odd_under, "prob": prob_under, "ev": ev})
 
+    value_bets = escanear_value_bets(previsoes, odds_mercado, top_k=1)
     if not value_bets:
         logging.info("Nenhuma aposta de valor encontrada.")
         return "Nenhuma aposta de valor encontrada."
 
-    # Sort by Expected Value (EV) descending
-    value_bets.sort(key=lambda x: x["ev"], reverse=True)
-    
     best_bet = value_bets[0]
     logging.info(f"Melhor Aposta Encontrada: {best_bet}")
     
     # Format the output string
-    best_bet_str = f"{best_bet['mercado']} - {best_bet['selecao']} @ {best_bet['odd']:.2f} (Prob: {best_bet['prob']:.1f}%, EV: {best_bet['ev']:.3f})"
+    if isinstance(odds_mercado, odds.OddsTable):
+        consenso_str = f", Consenso: {best_bet['prob_consenso']:.1f}%" if best_bet["prob_consenso"] is not None else ""
+        best_bet_str = f"{best_bet['mercado']} - {best_bet['selecao']} @ {best_bet['odd']:.2f} ({best_bet['casa']}) (Prob: {best_bet['prob']:.1f}%{consenso_str}, EV: {best_bet['ev']:.3f})"
+    else:
+        best_bet_str = f"{best_bet['mercado']} - {best_bet['selecao']} @ {best_bet['odd']:.2f} (Prob: {best_bet['prob']:.1f}%, EV: {best_bet['ev']:.3f})"
     return best_bet_str
 
-# --- Main Analysis Orchestrator (Updated) ---
+# --- Market Memoization ---
+
+def _quantizar_lambda(valor, step=None):
+    """Rounds a lambda to its quantization bucket (step <= 0 keeps the exact value)."""
+    step = LAMBDA_QUANT_STEP if step is None else step
+    if step <= 0:
+        return float(valor)
+    return max(step, round(round(valor / step) * step, 10))
+
+def _chave_mercados(lambda_casa, lambda_fora, step=None, modelo="poisson", parametro=0.0):
+    """Memo key for the goals markets of a fixture: its quantized (lambda_casa, lambda_fora) and score model."""
+    return (_quantizar_lambda(lambda_casa, step), _quantizar_lambda(lambda_fora, step), modelo, parametro)
+
+def _copiar_mercados(mercados):
+    """Returns a copy of a memoized market dict so callers can't mutate the cached entry."""
+    return {name: [dict(item) for item in value] if isinstance(value, list) else dict(value)
+            for name, value in mercados.items()}
+
+def _calcular_mercados_gols_lote(lambdas_casa, lambdas_fora, modelos=None, parametros=None):
+    """Computes 1X2, AH, O/U, BTTS, correct score and HT/FT for a batch of lambdas (None where it fails).
+
+    The score model only shapes the full-time matrix; HT/FT keeps independent halves from the same lambdas.
+    """
+    with metrics.stage("matriz_placar"):
+        score_matrices, valid = _get_score_matrices(lambdas_casa, lambdas_fora, modelos=modelos, parametros=parametros)
+    with metrics.stage("mercados_gols"):
+        arrays_lote = _calcular_mercados_arrays(score_matrices)
+    with metrics.stage("ht_ft"):
+        ht_ft_lote = calcular_ht_ft_lote(lambdas_casa, lambdas_fora)
+
+    resultados = []
+    with metrics.stage("formatacao_mercados"):
+        for n in range(len(valid)):
+            if not valid[n]:
+                resultados.append(None)
+                continue
+            arrays = {name: values[n] for name, values in arrays_lote.items()}
+            resultados.append({
+                "1X2": _formatar_1x2(arrays),
+                "handicap_asiatico": _formatar_handicaps(arrays, HANDICAP_LINES),
+                "over_under_gols": _formatar_over_under(arrays, OVER_UNDER_LIMITS),
+                "ambos_marcam": _formatar_ambas_marcam(arrays),
+                "ht_ft": ht_ft_lote[n],
+                "placar_exato": _formatar_placar_exato(score_matrices[n], TOP_PLACARES),
+            })
+    return resultados
+
+class _MemoMercados:
+    """Thread-safe bounded LRU of goals-market outputs keyed on quantized lambdas."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            mercados = self._data.get(key)
+            if mercados is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return mercados
+
+    def set(self, key, mercados):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = mercados
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._data), "max_size": self.max_size}
+
+_memo_mercados = _MemoMercados(MARKET_MEMO_SIZE)
+
+def _obter_mercados_gols(lambdas_casa, lambdas_fora, modelos=None, parametros=None):
+    """Returns the goals markets for each (lambda_casa, lambda_fora), reusing memoized buckets.
+
+    Only the distinct buckets missing from the memo are computed, in one batch, from the quantized lambdas,
+    so a fixture's markets depend on its bucket (and score model) alone.
+    """
+    modelos = modelos or ["poisson"] * len(lambdas_casa)
+    parametros = parametros or [0.0] * len(lambdas_casa)
+    chaves = [_chave_mercados(lc, lf, modelo=m, parametro=p) for lc, lf, m, p in zip(lambdas_casa, lambdas_fora, modelos, parametros)]
+    encontrados = {}
+    faltantes = []
+    for chave in dict.fromkeys(chaves):
+        mercados = _memo_mercados.get(chave)
+        if mercados is None:
+            faltantes.append(chave)
+        else:
+            encontrados[chave] = mercados
+
+    if faltantes:
+        calculados = _calcular_mercados_gols_lote([c[0] for c in faltantes], [c[1] for c in faltantes],
+                                                  [c[2] for c in faltantes], [c[3] for c in faltantes])
+        for chave, mercados in zip(faltantes, calculados):
+            encontrados[chave] = mercados
+            if mercados is not None:
+                _memo_mercados.set(chave, mercados)
+
+    return [_copiar_mercados(encontrados[c]) if encontrados[c] is not None else None for c in chaves]
+
+def verificar_precisao_memo(quant_step=None, amostras=2000, lambda_min=0.1, lambda_max=4.0, seed=0):
+    """Measures how far quantized-lambda market outputs drift from the exact computation.
+
+    Draws random lambda pairs, computes every goals market both exactly and from the quantized bucket,
+    and returns the largest absolute difference (in percentage points) per market.
+    """
+    quant_step = LAMBDA_QUANT_STEP if quant_step is None else quant_step
+    rng = np.random.default_rng(seed)
+    lambdas = rng.uniform(lambda_min, lambda_max, size=(amostras, 2))
+    chaves = [_chave_mercados(lc, lf, quant_step) for lc, lf in lambdas]
+
+    exatos = _calcular_mercados_gols_lote(lambdas[:, 0], lambdas[:, 1])
+    quantizados = _calcular_mercados_gols_lote([c[0] for c in chaves], [c[1] for c in chaves])
+
+    def _valores(mercado):
+        if isinstance(mercado, list):
+            return [v for item in mercado for k, v in sorted(item.items()) if isinstance(v, (int, float)) and k != "limite"]
+        return [v for _, v in sorted(mercado.items()) if isinstance(v, (int, float))]
+
+    desvios = defaultdict(float)
+    for exato, quantizado in zip(exatos, quantizados):
+        if exato is None or quantizado is None:
+            continue
+        for nome in exato:
+            if nome == "placar_exato":
+                # Compare probabilities of the same scorelines; the top-N ranking itself may swap on ties
+                probs_q = {item["placar"]: item["prob"] for item in quantizado[nome]}
+                pares = [(item["prob"], probs_q[item["placar"]]) for item in exato[nome] if item["placar"] in probs_q]
+            else:
+                pares = zip(_valores(exato[nome]), _valores(quantizado[nome]))
+            for v_exato, v_quantizado in pares:
+                desvios[nome] = max(desvios[nome], round(abs(v_exato - v_quantizado), 1))
+
+    logging.info(f"Precisão da memoização (passo {quant_step}, {amostras} amostras): {dict(desvios)}")
+    return dict(desvios)
+
+@metrics.register_collector
+def _memo_metrics():
+    """Exports the goals-market memo counters on each scrape."""
+    memo = _memo_mercados.stats()
+    return [("palpitepro_market_memo_total", "counter", "Consultas ao memo de mercados de gols.",
+             [({"result": "hit"}, memo["hits"]), ({"result": "miss"}, memo["misses"])])]
+
+# --- Main Analysis Orchestrators ---
+
+def _melhor_aposta_para(api_data, previsoes):
+    """Parses the fixture's raw odds (if any) and picks the best value bet for the given predictions."""
+    raw_odds_data = api_data.get("raw_odds")
+    if raw_odds_data:
+        return determinar_melhor_aposta(previsoes, odds.parse_odds_table(raw_odds_data))
+    logging.warning("Dados de odds brutos não encontrados em api_data. Não é possível determinar a melhor aposta.")
+    return "N/A (Odds não disponíveis)"
+
+def analisar_lote(lista_api_data):
+    """Analyses N fixtures in one vectorized call, returning [(previsoes, melhor_aposta), ...] in input order.
+
+    Lambdas of all fixtures are stacked into arrays and a single (N, G, G) score tensor feeds every goals
+    market, with HT/FT and corners also computed for the whole batch. Each fixture's score model comes from
+    score_models (per league). Goals markets are memoized per lambda pair (quantized by LAMBDA_QUANT_STEP, exact
+    by default) and model. With exact lambdas, results match the per-fixture calcular_* functions
+    (test_analysis.py); analisar_jogo_completo is implemented on top of this function.
+    """
+    resultados = [None] * len(lista_api_data)
+    indices, lambdas_casa, lambdas_fora, modelos, parametros = [], [], [], [], []
+
+    for idx, api_data in enumerate(lista_api_data):
+        if not isinstance(api_data, dict):
+            logging.error("Formato api_data inválido. Esperado um dicionário.")
+            resultados[idx] = ({}, "Erro nos dados de entrada")
+            continue
+        if api_data.get("error"): 
+            error_msg = api_data.get("error_message", "Erro desconhecido na busca de dados.")
+            logging.error(f"Erro crítico na busca de dados: {error_msg}")
+            resultados[idx] = ({}, f"Erro API: {error_msg}")
+            continue
+
+        lambda_casa, lambda_fora = _calculate_lambda(api_data)
+        modelo, parametro = score_models.modelo_do_jogo(api_data)
+        indices.append(idx)
+        lambdas_casa.append(lambda_casa)
+        lambdas_fora.append(lambda_fora)
+        modelos.append(modelo)
+        parametros.append(parametro)
+
+    if not indices:
+        return resultados
+
+    logging.info(f"Iniciando análise em lote de {len(indices)} jogo(s)...")
+    mercados_gols = _obter_mercados_gols(lambdas_casa, lambdas_fora, modelos, parametros)
+    with metrics.stage("cantos"):
+        lambdas_cantos, dispersions = _parametros_cantos([lista_api_data[idx] for idx in indices])
+        cantos_over, cantos_under, cantos_valid = _calcular_cantos_arrays(lambdas_cantos, CORNER_LIMITS, dispersions)
+
+    for n, idx in enumerate(indices):
+        api_data = lista_api_data[idx]
+        mercados = mercados_gols[n]
+        if mercados is None:
+            logging.error("Falha ao gerar matriz Poisson. Não é possível realizar análise.")
+            resultados[idx] = ({}, "Erro no cálculo da matriz de Poisson")
+            continue
+
+        previsoes = {}
+        previsoes["1X2"] = mercados["1X2"]
+        previsoes["handicap_asiatico"] = mercados["handicap_asiatico"]
+        previsoes["over_under_gols"] = mercados["over_under_gols"]
+        previsoes["ambos_marcam"] = mercados["ambos_marcam"]
+        previsoes["ht_ft"] = mercados["ht_ft"]
+        previsoes["placar_exato"] = mercados["placar_exato"]
+        previsoes["over_under_cantos"] = _formatar_cantos(cantos_over[n], cantos_under[n], CORNER_LIMITS) if cantos_valid[n] else []
+
+        with metrics.stage("melhor_aposta"):
+            resultados[idx] = (previsoes, _melhor_aposta_para(api_data, previsoes))
+
+    logging.info("Análise em lote completa.")
+    return resultados
 
 def analisar_jogo_completo(api_data):
     """Orchestrates the calculation of all betting scenarios and finds the best bet."""
     logging.info("Iniciando análise completa do jogo...")
-    previsoes = {}
-    melhor_aposta = "N/A"
-    
-    if not isinstance(api_data, dict):
-        logging.error("Formato api_data inválido. Esperado um dicionário.")
-        return {}, "Erro nos dados de entrada"
-        
-    if api_data.get("error"): 
-        error_msg = api_data.get("error_message", "Erro desconhecido na busca de dados.")
-        logging.error(f"Erro crítico na busca de dados: {error_msg}")
-        return {}, f"Erro API: {error_msg}"
-        
-    lambda_casa, lambda_fora = _calculate_lambda(api_data)
-    poisson_matrix = _get_poisson_matrix(lambda_casa, lambda_fora)
-    
-    if not poisson_matrix:
-         logging.error("Falha ao gerar matriz Poisson. Não é possível realizar análise.")
-         return {}, "Erro no cálculo da matriz de Poisson"
-
-    previsoes["1X2"] = calcular_1x2(poisson_matrix)
-    previsoes["handicap_asiatico"] = calcular_handicaps(poisson_matrix)
-    previsoes["over_under_gols"] = calcular_over_under(poisson_matrix)
-    previsoes["ambos_marcam"] = calcular_ambas_marcam(poisson_matrix)
-    previsoes["ht_ft"] = calcular_ht_ft(api_data) # Uses refined model
-    previsoes["placar_exato"] = calcular_placar_exato(poisson_matrix)
-    previsoes["over_under_cantos"] = calcular_total_cantos(api_data)
-    
-    raw_odds_data = api_data.get("raw_odds")
-    if raw_odds_data:
-        parsed_odds = _parse_odds(raw_odds_data)
-        melhor_aposta = determinar_melhor_aposta(previsoes, parsed_odds)
-    else:
-        logging.warning("Dados de odds brutos não encontrados em api_data. Não é possível determinar a melhor aposta.")
-        melhor_aposta = "N/A (Odds não disponíveis)"
-    
+    previsoes, melhor_aposta = analisar_lote([api_data])[0]
     logging.info("Análise completa.")
     return previsoes, melhor_aposta
 
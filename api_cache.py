@@ -0,0 +1,167 @@
+# Persistent, TTL-aware response cache for API-Football calls
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+# --- Configuration ---
+CACHE_ENABLED = os.getenv("API_CACHE_ENABLED", "1") not in ("0", "false", "False")
+CACHE_PATH = os.getenv("API_CACHE_PATH", "api_cache.sqlite3")
+CACHE_MAX_ENTRIES = int(os.getenv("API_CACHE_MAX_ENTRIES", "20000"))
+
+# Time-to-live in seconds per endpoint. IDs barely change, statistics/H2H move once per round, odds move constantly.
+ENDPOINT_TTLS = {
+    "teams": 7 * 24 * 3600,
+    "leagues": 7 * 24 * 3600,
+    "teams/statistics": 6 * 3600,
+    "fixtures/headtohead": 6 * 3600,
+    "fixtures": 30 * 60,
+    "odds": 5 * 60,
+}
+DEFAULT_TTL = 10 * 60
+
+# Setup basic logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+class ApiCache:
+    """SQLite-backed cache of API responses keyed on endpoint+params, with per-endpoint TTLs and LRU eviction."""
+
+    def __init__(self, path=CACHE_PATH, max_entries=CACHE_MAX_ENTRIES, ttls=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttls = dict(ENDPOINT_TTLS if ttls is None else ttls)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " endpoint TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(endpoint, params):
+        """Builds a stable cache key from the endpoint and its query params."""
+        normalized = {str(k): str(v) for k, v in (params or {}).items()}
+        return endpoint + "?" + json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+
+    def ttl_for(self, endpoint):
+        """Returns the TTL (seconds) configured for an endpoint."""
+        return self.ttls.get(endpoint, DEFAULT_TTL)
+
+    def get(self, endpoint, params):
+        """Returns the cached response for endpoint+params, or None on a miss/expired entry."""
+        key = self.make_key(endpoint, params)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT payload, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses[endpoint] += 1
+                return None
+            payload, expires_at = row
+            if expires_at <= now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self._size -= 1
+                self.misses[endpoint] += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits[endpoint] += 1
+        return json.loads(payload)
+
+    def set(self, endpoint, params, value, ttl=None):
+        """Stores a response, evicting the least recently used entries when the cache is full."""
+        ttl = self.ttl_for(endpoint) if ttl is None else ttl
+        if ttl <= 0:
+            return
+        key = self.make_key(endpoint, params)
+        now = time.time()
+        payload = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            cursor = self._conn.execute("SELECT 1 FROM responses WHERE key = ?", (key,))
+            is_new = cursor.fetchone() is None
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, endpoint, payload, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, endpoint, payload, now + ttl, now),
+            )
+            if is_new:
+                self._size += 1
+            if self._size > self.max_entries:
+                self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        """Drops expired entries first, then the least recently used ones down to 90% of capacity."""
+        removed = self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,)).rowcount
+        self._size -= removed
+        excess = self._size - int(self.max_entries * 0.9)
+        if excess > 0:
+            removed_lru = self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                (excess,),
+            ).rowcount
+            self._size -= removed_lru
+            removed += removed_lru
+        self.evictions += removed
+        logging.info(f"Cache API: {removed} entradas removidas (tamanho atual {self._size}).")
+
+    def clear(self):
+        """Removes every cached response."""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._size = 0
+
+    def stats(self):
+        """Returns hit/miss counters (total and per endpoint), current size and evictions."""
+        with self._lock:
+            total_hits = sum(self.hits.values())
+            total_misses = sum(self.misses.values())
+            lookups = total_hits + total_misses
+            return {
+                "hits": total_hits,
+                "misses": total_misses,
+                "hit_ratio": round(total_hits / lookups, 3) if lookups else 0.0,
+                "size": self._size,
+                "max_entries": self.max_entries,
+                "evictions": self.evictions,
+                "hits_by_endpoint": dict(self.hits),
+                "misses_by_endpoint": dict(self.misses),
+            }
+
+# --- Shared Instance ---
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Returns the process-wide cache, or None if caching is disabled or the backend can't be opened."""
+    global _cache, CACHE_ENABLED
+    if not CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                try:
+                    _cache = ApiCache()
+                    logging.info(f"Cache API inicializado em {CACHE_PATH} ({_cache._size} entradas).")
+                except sqlite3.Error as e:
+                    logging.error(f"Falha ao abrir cache API em {CACHE_PATH}: {e}. Seguindo sem cache.")
+                    CACHE_ENABLED = False
+                    return None
+    return _cache
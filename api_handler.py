@@ -1,17 +1,45 @@
 # Handles interactions with the API-Football
 
 import requests
+from requests.adapters import HTTPAdapter
 import os
 import json
 import statistics # For calculating averages
 import logging
-from datetime import datetime, timedelta
+import threading
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import api_cache
+import api_transport
+import corners
+import h2h_index
+import history_store
+import league_model
+import metrics
+import rate_limiter
+from singleflight import SingleFlight
+from name_index import TEAM_INDEX, LEAGUE_INDEX
 
 # --- Configuration ---
 API_KEY = os.getenv("API_FOOTBALL_KEY", "0a61cabf9fe788a9ecd7c6c1d47eda2a") 
 API_HOST = "v3.football.api-sports.io"
 BASE_URL = f"https://{API_HOST}"
-DEFAULT_BOOKMAKER_ID = 8 # Default to Bet365
+ODDS_BOOKMAKER_ID = int(os.getenv("ODDS_BOOKMAKER_ID", "0")) or None # None = every bookmaker in one call (8 = Bet365 only)
+FETCH_WORKERS = int(os.getenv("API_FETCH_WORKERS", "8")) # Parallel API calls across all analyses
+API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", str(FETCH_WORKERS + 2))) # Keep-alive connections to API_HOST
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "5"))
+API_READ_TIMEOUT = float(os.getenv("API_READ_TIMEOUT", "25"))
+FINISHED_STATUSES = ("FT", "AET", "PEN")
+CORNERS_BACKFILL_CALLS = int(os.getenv("CORNERS_BACKFILL_CALLS", "1")) # Per league and refresh: 20 results' corners per call (0 disables)
+FIXTURE_IDS_PER_CALL = 20 # Max fixtures per `fixtures?ids=` request
+# Leagues whose teams are bulk-loaded into the local name index (Premier League, La Liga, Serie A, Bundesliga,
+# Ligue 1, Brasileirão A/B, Champions League, Libertadores)
+NAME_INDEX_LEAGUES = [int(x) for x in os.getenv("NAME_INDEX_LEAGUES", "39,140,135,78,61,71,72,2,13").split(",") if x.strip()]
+NAME_INDEX_SEASON = int(os.getenv("NAME_INDEX_SEASON", "2023"))
+NAME_INDEX_REFRESH_HOURS = float(os.getenv("NAME_INDEX_REFRESH_HOURS", "24"))
 
 HEADERS = {
     "x-rapidapi-key": API_KEY,
@@ -21,18 +49,132 @@ HEADERS = {
 # Setup basic logging - CORRECTED FORMAT STRING
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Shared pool for independent API calls fanned out by get_processed_fixture_data
+_fetch_executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="api-fetch")
+
+# Coalesces concurrent identical API calls
+_inflight_requests = SingleFlight()
+# Coalesces concurrent fits of the same league model
+_inflight_fits = SingleFlight()
+# league_id -> season flagged `current` by the API (filled with the league index)
+_current_seasons = {}
+
+def _submit(func, *args):
+    """Submits to the fetch pool, carrying the caller's context (priority override, metrics trace); timed as a stage."""
+    return _fetch_executor.submit(contextvars.copy_context().run, metrics.timed, f"api:{func.__name__}", func, *args)
+
+# --- HTTP Session ---
+
+_session = None
+_session_lock = threading.Lock()
+
+def _get_session():
+    """Returns the shared keep-alive session (created lazily) used for every API-Football call.
+
+    The adapter's urllib3 pool is thread-safe and blocks when all API_POOL_SIZE connections are busy,
+    so concurrent callers reuse warm TCP+TLS connections instead of opening throwaway ones.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=API_POOL_SIZE, pool_block=True)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update(HEADERS)
+                session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+                _session = session
+    return _session
+
+def get_connection_stats():
+    """Returns request/connection counters of the shared pool and the connection reuse ratio."""
+    if _session is None:
+        return {"requests": 0, "connections": 0, "reuse_ratio": 0.0}
+    num_requests = 0
+    num_connections = 0
+    for adapter in set(_session.adapters.values()):
+        for key in list(adapter.poolmanager.pools.keys()):
+            pool = adapter.poolmanager.pools.get(key)
+            if pool is not None:
+                num_requests += pool.num_requests
+                num_connections += pool.num_connections
+    reuse_ratio = 1.0 - num_connections / num_requests if num_requests else 0.0
+    return {"requests": num_requests, "connections": num_connections, "reuse_ratio": round(reuse_ratio, 3)}
+
 # --- Helper Function for API Calls ---
 
+def _is_rate_limited(response):
+    """True for a 429, or a 200 whose body carries API-Football's `rateLimit` error."""
+    if response.status_code == 429:
+        return True
+    if response.status_code != 200:
+        return False
+    try:
+        api_errors = response.json().get("errors")
+    except (ValueError, AttributeError):
+        return False
+    return isinstance(api_errors, dict) and "rateLimit" in api_errors
+
 def _make_api_request(endpoint, params={}):
     """Makes a request to the API-Football endpoint and handles basic errors."""
     url = f"{BASE_URL}/{endpoint}"
-    if API_KEY == "0a61cabf9fe788a9ecd7c6c1d47eda2a" or not API_KEY: # Check against actual key
+    if (API_KEY == "0a61cabf9fe788a9ecd7c6c1d47eda2a" or not API_KEY) and not api_transport.is_replaying(): # Check against actual key
         logging.error("API_FOOTBALL_KEY not set or is the example key. Please provide a valid key.")
         return {"error": True, "message": "API Key não configurada ou inválida."}
-        
+
+    # Recording must reach the network and replay must serve the recordings, so neither reads or fills the cache
+    cache = None if api_transport.is_recording() or api_transport.is_replaying() else api_cache.get_cache()
+    if cache is not None:
+        cached = cache.get(endpoint, params)
+        if cached is not None:
+            logging.info(f"Cache hit: {endpoint} com params: {params}")
+            return cached
+
+    # Identical concurrent calls (same endpoint+params) share one request to the API
+    result, shared = _inflight_requests.do(api_cache.ApiCache.make_key(endpoint, params), _request_api, endpoint, params, cache)
+    if shared:
+        logging.info(f"Requisição compartilhada com chamada em andamento: {endpoint} com params: {params}")
+    return result
+
+def _http_get(url, endpoint, params):
+    """Transport under _request_api: live GET (also written to the recordings in record mode) or replay."""
+    if api_transport.is_replaying():
+        return api_transport.get_store().replay(endpoint, params, url)
+    response = _get_session().get(url, params=params, timeout=(API_CONNECT_TIMEOUT, API_READ_TIMEOUT))
+    if api_transport.is_recording():
+        api_transport.get_store().record(endpoint, params, response)
+    return response
+
+def _request_api(endpoint, params, cache):
+    """Performs the actual HTTP call (rate limited, with retries), parses errors and fills the cache."""
+    url = f"{BASE_URL}/{endpoint}"
     try:
-        logging.info(f"Chamando API: {url} com params: {params}")
-        response = requests.get(url, headers=HEADERS, params=params, timeout=30) 
+        limiter = rate_limiter.get_limiter()
+        replaying = api_transport.is_replaying()
+        for attempt in range(rate_limiter.API_MAX_RETRIES + 1):
+            # Replayed calls never reach the network, so they don't consume the quota
+            if not replaying and not limiter.acquire(rate_limiter.endpoint_priority(endpoint)):
+                metrics.API_ERRORS_TOTAL.inc(status="cota_local")
+                return {"error": True, "message": "Limite de requisições API atingido (cota local esgotada). Tente novamente em instantes."}
+
+            logging.info(f"Chamando API: {url} com params: {params}")
+            with metrics.stage(f"http:{endpoint}"):
+                response = _http_get(url, endpoint, params)
+            if response is None:
+                metrics.API_ERRORS_TOTAL.inc(status="replay_ausente")
+                logging.error(f"Resposta não gravada para {endpoint} com params: {params} (modo replay).")
+                return {"error": True, "message": "Resposta não encontrada nas gravações (modo replay)."}
+            if not replaying:
+                limiter.sync_from_headers(response.headers)
+            if not _is_rate_limited(response) or attempt == rate_limiter.API_MAX_RETRIES:
+                break
+
+            metrics.API_ERRORS_TOTAL.inc(status=str(response.status_code))
+            delay = rate_limiter.backoff_delay(attempt, response.headers.get("Retry-After"))
+            logging.warning(f"API limitou requisições para {endpoint} (tentativa {attempt + 1}). Nova tentativa em {delay:.1f}s.")
+            limiter.penalize()
+            time.sleep(delay)
         response.raise_for_status()
         
         data = response.json()
@@ -40,11 +182,13 @@ def _make_api_request(endpoint, params={}):
         api_errors = data.get("errors")
         if isinstance(api_errors, list) and len(api_errors) > 0:
              logging.error(f"API Error List para {endpoint}: {api_errors}")
+             metrics.API_ERRORS_TOTAL.inc(status="api")
              # Try to extract a meaningful message
              msg = str(api_errors[0]) if isinstance(api_errors[0], (str, dict)) else str(api_errors)
              return {"error": True, "message": msg}
         if isinstance(api_errors, dict) and len(api_errors) > 0:
              logging.error(f"API Error Dict para {endpoint}: {api_errors}")
+             metrics.API_ERRORS_TOTAL.inc(status="api")
              msg = str(api_errors)
              if "plan" in msg.lower() or "limit" in msg.lower() or "quota" in msg.lower():
                  logging.warning(f"API Plan/Limit Error: {api_errors}")
@@ -68,14 +212,18 @@ def _make_api_request(endpoint, params={}):
                  return {"error": True, "message": api_message} # Treat as error for flow control
             logging.warning(f"Resposta vazia ou campo 'response' ausente para {endpoint} com params: {params}") # Use single quotes inside f-string
             return [] # Return empty list for consistency when no data found
-            
+
+        if cache is not None:
+            cache.set(endpoint, params, data["response"])
         return data["response"]
         
     except requests.exceptions.Timeout as e:
         logging.error(f"API Request Timeout para {url}: {e}")
+        metrics.API_ERRORS_TOTAL.inc(status="timeout")
         return {"error": True, "message": f"Timeout na comunicação com a API: {e}"}
     except requests.exceptions.HTTPError as e:
         logging.error(f"HTTP Error para {url}: {e.response.status_code} {e.response.text}")
+        metrics.API_ERRORS_TOTAL.inc(status=str(e.response.status_code))
         # Provide more specific feedback for common errors
         if e.response.status_code == 401 or e.response.status_code == 403:
             return {"error": True, "message": f"Erro de Autenticação API ({e.response.status_code}): Verifique sua chave."}
@@ -86,11 +234,37 @@ def _make_api_request(endpoint, params={}):
         return {"error": True, "message": f"Erro HTTP {e.response.status_code} na comunicação com a API."}
     except requests.exceptions.RequestException as e:
         logging.error(f"API Request Error para {url}: {e}")
+        metrics.API_ERRORS_TOTAL.inc(status="rede")
         return {"error": True, "message": f"Erro de Rede ao conectar com a API: {e}"}
     except json.JSONDecodeError as e:
         logging.error(f"Falha ao decodificar JSON de {url}: {e}")
+        metrics.API_ERRORS_TOTAL.inc(status="json")
         return {"error": True, "message": f"Erro ao processar resposta da API (JSON inválido): {e}"}
 
+# --- Local History ---
+
+# Last archived version per item, so repeated (cached) responses aren't appended again
+_archived = {}
+_archived_lock = threading.Lock()
+
+def _archive(table, league_id, season, item, version, build_rows):
+    """Appends API data to the local history store once per new version of an item (never fails the request)."""
+    if not history_store.HISTORY_STORE_ENABLED or api_transport.is_replaying() or league_id is None or season is None:
+        return
+    key = (table, league_id, season, item)
+    with _archived_lock:
+        if _archived.get(key) == version:
+            return
+        _archived[key] = version
+    try:
+        history_store.get_store().append(table, league_id, season, build_rows())
+    except Exception as e:
+        logging.warning(f"Falha ao gravar {table} no histórico local ({league_id}/{season}): {e}")
+
+def _snapshot_version(endpoint):
+    """Time bucket of the endpoint's cache TTL: one archived snapshot per item per TTL window."""
+    return int(time.time() // api_cache.ENDPOINT_TTLS.get(endpoint, api_cache.DEFAULT_TTL))
+
 # --- Data Processing Helper Functions ---
 
 def _get_average_from_stats(stats_data, category, sub_category, location="total"):
@@ -185,10 +359,24 @@ def _calculate_avg_corners(stats_data, location):
     logging.info(f"Média de Cantos ({location}): {avg_corners:.2f}")
     return avg_corners
 
+def _calculate_avg_corners_against(stats_data, location):
+    """Average corners conceded from stats data (location, then total); None if the API doesn't provide it."""
+    for loc in (location, "total"):
+        avg_against = _get_average_from_stats(stats_data, "corners", "against", loc)
+        if avg_against > 0:
+            return avg_against
+    return None
+
 # --- Core Data Fetching Functions ---
 
-def find_team_id(team_name):
-    """Finds the team ID based on the team name."""
+def find_team_id(team_name, country_name=None, season=None):
+    """Finds the team ID based on the team name, using the local name index before the live search."""
+    hit = TEAM_INDEX.lookup(team_name, country_name, season)
+    if hit:
+        found_id, found_name, match_type = hit
+        logging.info(f"ID {found_id} para {team_name} resolvido pelo índice local ({match_type}: {found_name})")
+        return found_id, None
+
     logging.info(f"Buscando ID para time: {team_name}")
     response_data = _make_api_request("teams", params={"search": team_name})
     
@@ -202,11 +390,13 @@ def find_team_id(team_name):
         if exact_matches:
              found_id = exact_matches[0]["team"]["id"]
              logging.info(f"Encontrado ID exato: {found_id} para {team_name}")
+             TEAM_INDEX.add(found_id, exact_matches[0]["team"]["name"], exact_matches[0]["team"].get("country"), season)
              return found_id, None
         elif len(response_data) > 0 and isinstance(response_data[0], dict) and "team" in response_data[0]:
              found_id = response_data[0]["team"]["id"]
              found_name = response_data[0]["team"]["name"]
              logging.warning(f"Sem correspondência exata para {team_name}. Usando primeiro resultado: {found_name} (ID: {found_id})")
+             TEAM_INDEX.add(found_id, found_name, response_data[0]["team"].get("country"), season)
              return found_id, None
         else:
              msg = f"Nenhum time encontrado ou estrutura inválida para \"{team_name}\""
@@ -218,7 +408,13 @@ def find_team_id(team_name):
         return None, msg
 
 def find_league_id(league_name, country_name=None, season=None):
-    """Finds the league ID based on the league name, optional country and season."""
+    """Finds the league ID based on the league name, optional country and season, using the local name index first."""
+    hit = LEAGUE_INDEX.lookup(league_name, country_name, season)
+    if hit:
+        found_id, found_name, match_type = hit
+        logging.info(f"ID {found_id} para liga {league_name} resolvido pelo índice local ({match_type}: {found_name})")
+        return found_id, None
+
     log_msg = f"Buscando ID para liga: {league_name}"
     params = {"search": league_name}
     if country_name:
@@ -241,11 +437,13 @@ def find_league_id(league_name, country_name=None, season=None):
         if exact_matches:
              found_id = exact_matches[0]["league"]["id"]
              logging.info(f"Encontrado ID exato: {found_id} para {league_name}")
+             _index_league_item(exact_matches[0])
              return found_id, None
         elif len(response_data) > 0 and isinstance(response_data[0], dict) and "league" in response_data[0]:
              found_id = response_data[0]["league"]["id"]
              found_name = response_data[0]["league"]["name"]
              logging.warning(f"Sem correspondência exata para {league_name}. Usando primeiro resultado: {found_name} (ID: {found_id})")
+             _index_league_item(response_data[0])
              return found_id, None
         else:
              msg = f"Nenhuma liga encontrada ou estrutura inválida para \"{league_name}\""
@@ -256,6 +454,76 @@ def find_league_id(league_name, country_name=None, season=None):
         logging.warning(msg)
         return None, msg
 
+def _league_index_records(league_item):
+    """Turns one item of the `leagues` response into (id, name, country, season) index records."""
+    if not isinstance(league_item, dict):
+        return []
+    league = league_item.get("league", {})
+    country = (league_item.get("country") or {}).get("name")
+    seasons = [s.get("year") for s in league_item.get("seasons", []) if isinstance(s, dict)]
+    return [(league.get("id"), league.get("name"), country, year) for year in (seasons or [None])]
+
+def _index_league_item(league_item):
+    """Adds a league found by the live search to the local index."""
+    for record in _league_index_records(league_item):
+        LEAGUE_INDEX.add(*record)
+    _record_current_season(league_item)
+
+def _record_current_season(league_item):
+    """Remembers the season the API flags as `current` for a league."""
+    if not isinstance(league_item, dict):
+        return
+    league_id = league_item.get("league", {}).get("id")
+    for season in league_item.get("seasons", []):
+        if isinstance(season, dict) and season.get("current") and league_id is not None:
+            _current_seasons[league_id] = season.get("year")
+
+def current_season(league_id):
+    """The league's current season according to the last league index load, or None if unknown."""
+    return _current_seasons.get(league_id)
+
+def refresh_name_indexes(league_ids=None, season=NAME_INDEX_SEASON):
+    """Bulk-loads all leagues and the teams of the followed leagues into the local name indexes."""
+    league_ids = NAME_INDEX_LEAGUES if league_ids is None else league_ids
+    logging.info(f"Atualizando índices de nomes (ligas + times de {len(league_ids)} ligas, temporada {season})")
+
+    leagues_response = _make_api_request("leagues")
+    if isinstance(leagues_response, list) and leagues_response:
+        records = [record for item in leagues_response for record in _league_index_records(item)]
+        LEAGUE_INDEX.replace_all(records)
+        for item in leagues_response:
+            _record_current_season(item)
+    else:
+        logging.warning("Não foi possível carregar ligas para o índice local. Mantendo índice atual.")
+
+    team_records = []
+    for league_id in league_ids:
+        teams_response = _make_api_request("teams", params={"league": league_id, "season": season})
+        if not isinstance(teams_response, list):
+            logging.warning(f"Não foi possível carregar times da liga {league_id} para o índice local.")
+            continue
+        for item in teams_response:
+            team = item.get("team", {}) if isinstance(item, dict) else {}
+            team_records.append((team.get("id"), team.get("name"), team.get("country"), season))
+    if team_records:
+        TEAM_INDEX.replace_all(team_records)
+
+def start_name_index_refresher(interval_hours=NAME_INDEX_REFRESH_HOURS):
+    """Fills the name indexes in a background thread and refreshes them periodically, at low queue priority."""
+    stop_event = threading.Event()
+
+    def _loop():
+        while not stop_event.is_set():
+            try:
+                with rate_limiter.prioridade(rate_limiter.PRIORIDADE_BAIXA): # Bulk load: user lookups go first
+                    refresh_name_indexes()
+            except Exception as e:
+                logging.error(f"Erro ao atualizar índices de nomes: {e}", exc_info=True)
+            stop_event.wait(interval_hours * 3600)
+
+    threading.Thread(target=_loop, name="name-index-refresher", daemon=True).start()
+    return stop_event
+
 def find_next_fixture_id(league_id, season, team_id_1, team_id_2):
     """Finds the fixture ID for the next match between two teams in a league/season."""
     logging.info(f"Buscando próximo fixture ID para {team_id_1} vs {team_id_2} na liga {league_id}, temporada {season}")
@@ -282,6 +550,174 @@ def find_next_fixture_id(league_id, season, team_id_1, team_id_2):
     logging.warning(msg)
     return None, msg
 
+def get_upcoming_fixtures(league_id, season, hours_ahead=48):
+    """Lists fixtures not yet started in a league/season within the next `hours_ahead` hours."""
+    now = datetime.now(timezone.utc)
+    params = {
+        "league": league_id,
+        "season": season,
+        "from": now.strftime("%Y-%m-%d"),
+        "to": (now + timedelta(hours=hours_ahead)).strftime("%Y-%m-%d"),
+        "status": "NS",
+    }
+    logging.info(f"Buscando próximos jogos da liga {league_id}, temporada {season} (próximas {hours_ahead}h)")
+    fixtures = _make_api_request("fixtures", params=params)
+    if fixtures is None or isinstance(fixtures, dict) and fixtures.get("error"):
+        msg = fixtures.get("message") if isinstance(fixtures, dict) else "Erro desconhecido"
+        logging.error(f"Erro API ao buscar próximos jogos da liga {league_id}: {msg}")
+        return [], msg
+
+    upcoming = []
+    limit = now + timedelta(hours=hours_ahead)
+    for item in fixtures if isinstance(fixtures, list) else []:
+        if not isinstance(item, dict):
+            continue
+        fixture = item.get("fixture", {})
+        teams = item.get("teams", {})
+        timestamp = fixture.get("timestamp")
+        if timestamp is not None and not (now <= datetime.fromtimestamp(timestamp, timezone.utc) <= limit):
+            continue
+        upcoming.append({
+            "fixture_id": fixture.get("id"),
+            "timestamp": timestamp,
+            "league_id": league_id,
+            "league_name": item.get("league", {}).get("name"),
+            "season": season,
+            "home_id": teams.get("home", {}).get("id"),
+            "home_name": teams.get("home", {}).get("name"),
+            "away_id": teams.get("away", {}).get("id"),
+            "away_name": teams.get("away", {}).get("name"),
+        })
+    upcoming.sort(key=lambda f: f["timestamp"] or 0)
+    return upcoming, None
+
+def _fixture_corners(item):
+    """(home, away) corner kicks from the statistics of a fixtures-endpoint item, or (None, None) if absent."""
+    home_id = item.get("teams", {}).get("home", {}).get("id")
+    by_team = {}
+    for team_stats in item.get("statistics") or []:
+        if not isinstance(team_stats, dict):
+            continue
+        for stat in team_stats.get("statistics") or []:
+            if isinstance(stat, dict) and stat.get("type") == "Corner Kicks":
+                by_team[team_stats.get("team", {}).get("id") == home_id] = stat.get("value") or 0
+    if len(by_team) < 2:
+        return None, None
+    return int(by_team[True]), int(by_team[False])
+
+def _finished_match(item):
+    """A fixtures-endpoint item as a flat result dict, or None if it isn't a finished match."""
+    if not isinstance(item, dict):
+        return None
+    teams = item.get("teams", {})
+    goals = item.get("goals", {})
+    home_id = teams.get("home", {}).get("id")
+    away_id = teams.get("away", {}).get("id")
+    if home_id is None or away_id is None or goals.get("home") is None or goals.get("away") is None:
+        return None
+    status = item.get("fixture", {}).get("status", {}).get("short")
+    if status is not None and status not in FINISHED_STATUSES:
+        return None # e.g. a live match in an H2H response
+    halftime = item.get("score", {}).get("halftime") or {}
+    if status in ("AET", "PEN"):
+        # Goals include extra time; the models are about 90 minutes
+        fulltime = item.get("score", {}).get("fulltime") or {}
+        if fulltime.get("home") is not None and fulltime.get("away") is not None:
+            goals = fulltime
+    corners_home, corners_away = _fixture_corners(item)
+    return {
+        "fixture_id": item.get("fixture", {}).get("id"),
+        "timestamp": item.get("fixture", {}).get("timestamp"),
+        "home_id": home_id,
+        "away_id": away_id,
+        "home_goals": int(goals["home"]),
+        "away_goals": int(goals["away"]),
+        "ht_home_goals": halftime.get("home"),
+        "ht_away_goals": halftime.get("away"),
+        "corners_home": corners_home,
+        "corners_away": corners_away,
+    }
+
+def get_finished_fixtures(league_id, season):
+    """Fetches every finished fixture of a league/season in one call, as flat result dicts."""
+    logging.info(f"Buscando jogos finalizados da liga {league_id}, temporada {season}")
+    fixtures = _make_api_request("fixtures", params={"league": league_id, "season": season, "status": "-".join(FINISHED_STATUSES)})
+    if fixtures is None or isinstance(fixtures, dict) and fixtures.get("error"):
+        msg = fixtures.get("message") if isinstance(fixtures, dict) else "Erro desconhecido"
+        logging.error(f"Erro API ao buscar jogos finalizados da liga {league_id}: {msg}")
+        return [], msg
+
+    matches = [m for m in map(_finished_match, fixtures if isinstance(fixtures, list) else []) if m is not None]
+    if h2h_index.H2H_ENABLED:
+        h2h_index.get_index().update(matches)
+    # Finished fixtures only grow, so the count identifies the version
+    _archive("fixtures", league_id, season, None, len(matches), lambda: history_store.fixture_rows(matches))
+    return matches, None
+
+def get_league_model(league_id, season):
+    """Returns the current strength model of a league/season, or None. A table lookup only: fits are refresh_league_models' job."""
+    if not league_model.LEAGUE_MODEL_ENABLED:
+        return None
+    return league_model.LEAGUE_MODELS.get(league_id, season)
+
+def refresh_league_model(league_id, season):
+    """Fetches the finished fixtures of a league/season and updates its model (only if new results came in)."""
+    if not league_model.LEAGUE_MODEL_ENABLED:
+        return None
+
+    def _fit():
+        matches, error_msg = get_finished_fixtures(league_id, season)
+        if error_msg and history_store.HISTORY_STORE_ENABLED:
+            # Without the API, results kept in the local history still fit (or update) the model
+            matches = history_store.get_store().finished_matches(league_id, season)
+            error_msg = None if matches else error_msg
+        if error_msg:
+            return league_model.LEAGUE_MODELS.get(league_id, season)
+        return league_model.LEAGUE_MODELS.update(league_id, season, matches)
+
+    model, _ = _inflight_fits.do((league_id, season), _fit)
+    return model
+
+def backfill_fixture_corners(league_id, season, max_calls=CORNERS_BACKFILL_CALLS):
+    """Fills the corners of stored results that lack them (newest first), FIXTURE_IDS_PER_CALL fixtures per call.
+
+    The season's fixtures listing carries no statistics; `fixtures?ids=` does. Returns how many results got corners.
+    """
+    if max_calls <= 0 or not history_store.HISTORY_STORE_ENABLED or api_transport.is_replaying():
+        return 0
+    store = history_store.get_store()
+    rows = store.read("fixtures", league_id, season)
+    rows = rows[(rows["home_goals"] >= 0) & (rows["corners_home"] < 0)]
+    newest_first = sorted(zip(rows["timestamp"].tolist(), rows["fixture_id"].tolist()), reverse=True)
+    missing = [fixture_id for _, fixture_id in newest_first[:max_calls * FIXTURE_IDS_PER_CALL]]
+    filled = 0
+    for start in range(0, len(missing), FIXTURE_IDS_PER_CALL):
+        ids = missing[start:start + FIXTURE_IDS_PER_CALL]
+        fixtures = _make_api_request("fixtures", params={"ids": "-".join(str(i) for i in ids)})
+        if not isinstance(fixtures, list):
+            logging.warning(f"Não foi possível buscar cantos dos jogos da liga {league_id}/{season}.")
+            break
+        matches = [m for m in map(_finished_match, fixtures) if m is not None and m["corners_home"] is not None]
+        store.append("fixtures", league_id, season, history_store.fixture_rows(matches))
+        filled += len(matches)
+    if filled:
+        logging.info(f"Cantos de {filled} jogos da liga {league_id}/{season} gravados no histórico local.")
+    return filled
+
+def refresh_league_models(league_ids=None, season=NAME_INDEX_SEASON):
+    """Brings the strength models of the followed leagues up to date with their latest finished fixtures."""
+    league_ids = NAME_INDEX_LEAGUES if league_ids is None else league_ids
+    started = time.perf_counter()
+    with rate_limiter.prioridade(rate_limiter.PRIORIDADE_BAIXA):
+        updated = 0
+        for league_id in league_ids:
+            updated += refresh_league_model(league_id, season) is not None
+            # Corner dispersion is fitted per league from stored results, refitted as their corners come in
+            if backfill_fixture_corners(league_id, season):
+                corners.LEAGUE_DISPERSIONS.refit(league_id)
+    logging.info(f"Modelos de liga atualizados: {updated} de {len(league_ids)} ligas em {time.perf_counter() - started:.1f}s.")
+    return updated
+
 def get_fixture_h2h(team_id_1, team_id_2, last_n=10):
     """Fetches head-to-head fixture data between two teams."""
     logging.info(f"Buscando H2H para times: {team_id_1} vs {team_id_2} (últimos {last_n})")
@@ -319,10 +755,12 @@ def get_team_statistics(team_id, league_id, season):
         
     return stats_response, None
 
-def get_fixture_odds(fixture_id, bookmaker_id=DEFAULT_BOOKMAKER_ID):
-    """Fetches odds for a specific fixture from a specific bookmaker."""
-    logging.info(f"Buscando odds para fixture: {fixture_id} do bookmaker: {bookmaker_id}")
-    params = {"fixture": fixture_id, "bookmaker": bookmaker_id}
+def get_fixture_odds(fixture_id, bookmaker_id=ODDS_BOOKMAKER_ID):
+    """Fetches odds for a fixture: every bookmaker in one call, or a single one when bookmaker_id is given."""
+    logging.info(f"Buscando odds para fixture: {fixture_id} do bookmaker: {bookmaker_id or 'todos'}")
+    params = {"fixture": fixture_id}
+    if bookmaker_id:
+        params["bookmaker"] = bookmaker_id
     odds_response = _make_api_request("odds", params=params)
     
     if odds_response is None or isinstance(odds_response, dict) and odds_response.get("error"):
@@ -331,7 +769,7 @@ def get_fixture_odds(fixture_id, bookmaker_id=DEFAULT_BOOKMAKER_ID):
         return None, msg
         
     if not odds_response:
-        msg = f"Nenhuma odd encontrada para fixture {fixture_id} no bookmaker {bookmaker_id}."
+        msg = f"Nenhuma odd encontrada para fixture {fixture_id} no bookmaker {bookmaker_id or 'algum'}."
         logging.warning(msg)
         return None, msg
         
@@ -342,12 +780,27 @@ def get_fixture_odds(fixture_id, bookmaker_id=DEFAULT_BOOKMAKER_ID):
         logging.warning(msg)
         return None, msg
 
+def _fetch_fixture_and_odds(league_id, season, home_id, away_id):
+    """Finds the next fixture between the teams and fetches its odds (a dependent chain of calls)."""
+    fixture_id, error_msg = find_next_fixture_id(league_id, season, home_id, away_id)
+    if error_msg and "Nenhum próximo fixture encontrado" not in error_msg:
+        logging.warning(f"Não foi possível encontrar fixture ID: {error_msg}")
+        return None, None
+    if not fixture_id:
+        return None, None
+
+    odds_data, error_msg_odds = get_fixture_odds(fixture_id)
+    if error_msg_odds:
+        logging.warning(f"Não foi possível obter odds para fixture {fixture_id}: {error_msg_odds}")
+        return fixture_id, None
+    _archive("odds", league_id, season, fixture_id, _snapshot_version("odds"), lambda: history_store.odds_rows(fixture_id, odds_data))
+    return fixture_id, odds_data
+
 # --- Main Orchestrator Function ---
 
-def get_processed_fixture_data(home_team_name, away_team_name, league_name, season, country_name=None):
-    """Orchestrates API calls to get all necessary data for analysis."""
-    logging.info(f"Iniciando busca de dados para: {home_team_name} vs {away_team_name} em {league_name} ({season})")
-    processed_data = {
+def _new_processed_data(home_team_name, away_team_name, league_name, season):
+    """Returns the processed-data dict with its defaults (used when statistics are missing)."""
+    return {
         "error": False,
         "error_message": None,
         "home_team_id": None,
@@ -362,65 +815,130 @@ def get_processed_fixture_data(home_team_name, away_team_name, league_name, seas
         "lambda_fora": 1.2,
         "avg_corners_home": 6.0,
         "avg_corners_away": 5.0,
+        "avg_corners_against_home": None,
+        "avg_corners_against_away": None,
         "raw_h2h": None,
         "raw_home_stats": None,
         "raw_away_stats": None,
-        "raw_odds": None
+        "raw_odds": None,
+        "lambda_source": None,
+        "rho": None,
+        "h2h_matches": 0
     }
 
-    league_id, error_msg = find_league_id(league_name, country_name, season)
+def get_processed_fixture_data(home_team_name, away_team_name, league_name, season, country_name=None):
+    """Orchestrates API calls to get all necessary data for analysis."""
+    logging.info(f"Iniciando busca de dados para: {home_team_name} vs {away_team_name} em {league_name} ({season})")
+    processed_data = _new_processed_data(home_team_name, away_team_name, league_name, season)
+
+    # Stage 1: league and both team lookups are independent of each other
+    league_future = _submit(find_league_id, league_name, country_name, season)
+    home_future = _submit(find_team_id, home_team_name, country_name, season)
+    away_future = _submit(find_team_id, away_team_name, country_name, season)
+
+    league_id, error_msg = league_future.result()
     if error_msg:
         processed_data["error"] = True
         processed_data["error_message"] = f"Erro ao buscar Liga: {error_msg}"
         return processed_data
     processed_data["league_id"] = league_id
 
-    home_id, error_msg = find_team_id(home_team_name)
+    home_id, error_msg = home_future.result()
     if error_msg:
         processed_data["error"] = True
         processed_data["error_message"] = f"Erro ao buscar Time Casa ({home_team_name}): {error_msg}"
         return processed_data
     processed_data["home_team_id"] = home_id
     
-    away_id, error_msg = find_team_id(away_team_name)
+    away_id, error_msg = away_future.result()
     if error_msg:
         processed_data["error"] = True
         processed_data["error_message"] = f"Erro ao buscar Time Fora ({away_team_name}): {error_msg}"
         return processed_data
     processed_data["away_team_id"] = away_id
 
-    fixture_id, error_msg = find_next_fixture_id(league_id, season, home_id, away_id)
-    if error_msg and "Nenhum próximo fixture encontrado" not in error_msg:
-        logging.warning(f"Não foi possível encontrar fixture ID: {error_msg}")
-    elif fixture_id:
+    return _fetch_fixture_details(processed_data)
+
+def get_processed_fixture_data_by_ids(home_id, away_id, league_id, season, home_team_name=None, away_team_name=None, league_name=None):
+    """Same as get_processed_fixture_data for already-resolved IDs (skips the name lookups)."""
+    processed_data = _new_processed_data(home_team_name or str(home_id), away_team_name or str(away_id), league_name or str(league_id), season)
+    processed_data["league_id"] = league_id
+    processed_data["home_team_id"] = home_id
+    processed_data["away_team_id"] = away_id
+    return _fetch_fixture_details(processed_data)
+
+def _fetch_fixture_details(processed_data):
+    """Stage 2: with IDs known, the fixture->odds chain, both statistics calls and H2H run together."""
+    home_id = processed_data["home_team_id"]
+    away_id = processed_data["away_team_id"]
+    league_id = processed_data["league_id"]
+    season = processed_data["season"]
+    home_team_name = processed_data["home_team_name"]
+    away_team_name = processed_data["away_team_name"]
+
+    fixture_future = _submit(_fetch_fixture_and_odds, league_id, season, home_id, away_id)
+    home_stats_future = _submit(get_team_statistics, home_id, league_id, season)
+    away_stats_future = _submit(get_team_statistics, away_id, league_id, season)
+    # H2H comes from the local pair index; the API is asked only to fill pairs with too few meetings indexed
+    h2h_future = None
+    if h2h_index.H2H_ENABLED and h2h_index.get_index().needs_sync(home_id, away_id):
+        h2h_future = _submit(get_fixture_h2h, home_id, away_id)
+
+    fixture_id, odds_data = fixture_future.result()
+    if fixture_id:
         processed_data["fixture_id"] = fixture_id
-        odds_data, error_msg_odds = get_fixture_odds(fixture_id)
-        if error_msg_odds:
-            logging.warning(f"Não foi possível obter odds para fixture {fixture_id}: {error_msg_odds}")
-        else:
-            processed_data["raw_odds"] = odds_data
+        processed_data["raw_odds"] = odds_data
 
-    home_stats, error_msg_h = get_team_statistics(home_id, league_id, season)
+    home_stats, error_msg_h = home_stats_future.result()
     if error_msg_h:
         processed_data["error"] = True
         processed_data["error_message"] = f"Erro ao buscar Estatísticas Casa ({home_team_name}): {error_msg_h}"
         return processed_data
     processed_data["raw_home_stats"] = home_stats
 
-    away_stats, error_msg_a = get_team_statistics(away_id, league_id, season)
+    away_stats, error_msg_a = away_stats_future.result()
     if error_msg_a:
         processed_data["error"] = True
         processed_data["error_message"] = f"Erro ao buscar Estatísticas Fora ({away_team_name}): {error_msg_a}"
         return processed_data
     processed_data["raw_away_stats"] = away_stats
-
-    h2h_data, error_msg_h2h = get_fixture_h2h(home_id, away_id)
-    if error_msg_h2h:
-        logging.warning(f"Não foi possível obter dados H2H: {error_msg_h2h}")
-    else:
-        processed_data["raw_h2h"] = h2h_data
-
-    lambda_casa, lambda_fora = _calculate_strengths(home_stats, away_stats)
+    stats_version = _snapshot_version("teams/statistics")
+    _archive("team_stats", league_id, season, home_id, stats_version, lambda: history_store.team_stats_rows(home_id, home_stats))
+    _archive("team_stats", league_id, season, away_id, stats_version, lambda: history_store.team_stats_rows(away_id, away_stats))
+
+    if h2h_future is not None:
+        h2h_data, error_msg_h2h = h2h_future.result()
+        if error_msg_h2h:
+            logging.warning(f"Não foi possível obter dados H2H: {error_msg_h2h}")
+        else:
+            processed_data["raw_h2h"] = h2h_data
+            index = h2h_index.get_index()
+            index.update(m for m in map(_finished_match, h2h_data if isinstance(h2h_data, list) else []) if m is not None)
+            index.mark_synced(home_id, away_id)
+
+    # Lambdas come from the league-wide fit when it covers both teams, otherwise from the two stat blobs
+    model = get_league_model(league_id, season)
+    with metrics.stage("forcas"):
+        lambdas = model.lambdas(home_id, away_id) if model is not None else None
+        if lambdas is not None:
+            # Early in the season the stats still carry part of the weight
+            team_matches = model.team_matches(home_id, away_id)
+            lambda_casa, lambda_fora = league_model.blend_lambdas(lambdas, _calculate_strengths(home_stats, away_stats), team_matches)
+            processed_data["lambda_source"] = "modelo_liga"
+            processed_data["rho"] = model.rho # Low-score dependence for the dixon_coles score model
+            logging.info(f"Lambdas do modelo da liga ({team_matches} jogos por time): Casa={lambda_casa:.2f}, Fora={lambda_fora:.2f}")
+        else:
+            lambda_casa, lambda_fora = _calculate_strengths(home_stats, away_stats)
+            processed_data["lambda_source"] = "estatisticas"
+        if h2h_index.H2H_ENABLED:
+            meetings = h2h_index.get_index().lookup(home_id, away_id)
+            if meetings:
+                reversed_lambdas = _calculate_strengths(away_stats, home_stats)
+                if lambdas is not None:
+                    reversed_lambdas = league_model.blend_lambdas(model.lambdas(away_id, home_id), reversed_lambdas, team_matches)
+                lambda_casa, lambda_fora, processed_data["h2h_matches"] = h2h_index.shrink_lambdas(
+                    lambda_casa, lambda_fora, meetings, home_id, reversed_lambdas)
+                logging.info(f"Lambdas ajustados por {len(meetings)} confronto(s) direto(s): Casa={lambda_casa:.2f}, Fora={lambda_fora:.2f}")
     processed_data["lambda_casa"] = lambda_casa
     processed_data["lambda_fora"] = lambda_fora
 
@@ -428,10 +946,38 @@ def get_processed_fixture_data(home_team_name, away_team_name, league_name, seas
     avg_corners_away = _calculate_avg_corners(away_stats, "away")
     processed_data["avg_corners_home"] = avg_corners_home
     processed_data["avg_corners_away"] = avg_corners_away
+    processed_data["avg_corners_against_home"] = _calculate_avg_corners_against(home_stats, "home")
+    processed_data["avg_corners_against_away"] = _calculate_avg_corners_against(away_stats, "away")
 
     logging.info(f"Busca de dados concluída para: {home_team_name} vs {away_team_name}")
     return processed_data
 
+# --- Metrics ---
+
+@metrics.register_collector
+def _api_metrics():
+    """Exports response-cache, quota, connection-pool and request-coalescing counters on each scrape."""
+    families = []
+    cache = api_cache.get_cache()
+    if cache is not None:
+        cache_stats = cache.stats()
+        families.append(("palpitepro_api_cache_hits_total", "counter", "Acertos do cache de respostas da API por endpoint.",
+                         [({"endpoint": e}, v) for e, v in cache_stats["hits_by_endpoint"].items()]))
+        families.append(("palpitepro_api_cache_misses_total", "counter", "Falhas do cache de respostas da API por endpoint.",
+                         [({"endpoint": e}, v) for e, v in cache_stats["misses_by_endpoint"].items()]))
+    quota = rate_limiter.get_limiter().stats()
+    families.append(("palpitepro_api_quota_remaining", "gauge", "Cota restante da API-Football (visão local).",
+                     [({"window": "minute"}, quota["minute_remaining"]), ({"window": "day"}, quota["day_remaining"])]))
+    families.append(("palpitepro_api_rate_limiter_total", "counter", "Eventos do limitador de requisições.",
+                     [({"event": k}, quota[k]) for k in ("granted", "throttled", "rejected", "server_rate_limited")]))
+    connections = get_connection_stats()
+    families.append(("palpitepro_api_connection_reuse_ratio", "gauge", "Fração de requisições que reaproveitaram conexões.",
+                     [({}, connections["reuse_ratio"])]))
+    coalesced = _inflight_requests.stats()
+    families.append(("palpitepro_api_requests_shared_total", "counter", "Chamadas à API atendidas por uma chamada idêntica em andamento.",
+                     [({}, coalesced["shared"])]))
+    return families
+
 # --- Test Block ---
 if __name__ == "__main__":
     logging.info("--- Executando Teste do API Handler ---")
@@ -0,0 +1,122 @@
+# Record/replay transport for API-Football responses (offline runs, load tests, incident reproduction)
+
+import gzip
+import json
+import logging
+import os
+import threading
+from collections import defaultdict
+
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+from api_cache import ApiCache
+
+# --- Configuration ---
+TRANSPORT_MODE = os.getenv("API_TRANSPORT", "live").lower() # live | record | replay
+RECORDINGS_PATH = os.getenv("API_RECORDINGS_PATH", "api_recordings.jsonl.gz")
+# Response headers worth keeping (quota/rate-limit state drives the limiter and the retry loop)
+RECORDED_HEADERS = (
+    "Content-Type", "Retry-After",
+    "x-ratelimit-requests-limit", "x-ratelimit-requests-remaining",
+    "X-RateLimit-Limit", "X-RateLimit-Remaining",
+)
+
+# Setup basic logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+class RecordingStore:
+    """Gzip-compressed JSON-lines file of raw HTTP responses, one line per recorded call.
+
+    Every call for the same endpoint+params is kept in order, so replay serves them in sequence (e.g. a 429
+    followed by the 200 of the retry) and then keeps serving the last one.
+    """
+
+    def __init__(self, path=RECORDINGS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._recordings = None # key -> [response dict, ...], loaded on first replay
+        self._cursor = defaultdict(int)
+        self.recorded = 0
+        self.replayed = 0
+        self.missing = 0
+
+    def _load(self):
+        recordings = defaultdict(list)
+        if os.path.exists(self.path):
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        recordings[entry["key"]].append(entry)
+        logging.info(f"Gravações API carregadas de {self.path}: {sum(len(v) for v in recordings.values())} respostas.")
+        return recordings
+
+    def record(self, endpoint, params, response):
+        """Appends a live response (status, relevant headers, raw body) to the store."""
+        entry = {
+            "key": ApiCache.make_key(endpoint, params),
+            "endpoint": endpoint,
+            "params": {str(k): str(v) for k, v in (params or {}).items()},
+            "status": response.status_code,
+            "headers": {h: response.headers[h] for h in RECORDED_HEADERS if h in response.headers},
+            "body": response.text,
+        }
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            # Each append is its own gzip member; gzip readers concatenate them transparently
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write(line)
+            if self._recordings is not None:
+                self._recordings[entry["key"]].append(entry)
+            self.recorded += 1
+
+    def replay(self, endpoint, params, url=None):
+        """Returns the next recorded response for endpoint+params as a requests.Response, or None if not recorded."""
+        key = ApiCache.make_key(endpoint, params)
+        with self._lock:
+            if self._recordings is None:
+                self._recordings = self._load()
+            entries = self._recordings.get(key)
+            if not entries:
+                self.missing += 1
+                return None
+            position = self._cursor[key]
+            entry = entries[min(position, len(entries) - 1)]
+            self._cursor[key] = position + 1
+            self.replayed += 1
+
+        response = Response()
+        response.status_code = entry["status"]
+        response.headers = CaseInsensitiveDict(entry.get("headers", {}))
+        response._content = entry["body"].encode("utf-8")
+        response.encoding = "utf-8"
+        response.url = url or key
+        return response
+
+    def stats(self):
+        """Returns how many responses were recorded, replayed and missing from the store."""
+        with self._lock:
+            return {"mode": TRANSPORT_MODE, "recorded": self.recorded, "replayed": self.replayed, "missing": self.missing}
+
+# --- Shared Instance ---
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """Returns the process-wide recording store."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = RecordingStore()
+    return _store
+
+def is_replaying():
+    """True when API calls are served from the recordings instead of the network."""
+    return TRANSPORT_MODE == "replay"
+
+def is_recording():
+    """True when live API responses are also written to the recordings."""
+    return TRANSPORT_MODE == "record"
@@ -0,0 +1,482 @@
+# Backtesting engine: replays historical results and odds season by season through the analysis core
+#
+# Usage:
+#   python backtest.py --export historico.jsonl.gz --league 39 --league 71 --season 2022 --season 2023 [--with-odds]
+#   python backtest.py historico.jsonl.gz                 # ROI, yield, Brier/log-loss and calibration per market
+#   python backtest.py --store history                    # same, from the local history store the bot fills
+#   python backtest.py --synthetic 4 --json backtest.json # simulated leagues (smoke test / model sanity check)
+#
+# Each fixture is predicted only from results finished before its match day (walk-forward league model and H2H
+# index), then the value bets found against the stored odds are settled on the real score. Leagues/seasons run
+# in parallel on a process pool.
+
+import argparse
+import gzip
+import json
+import logging
+import math
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import analysis
+import h2h_index
+import history_store
+import league_model
+import odds
+import score_models
+
+# --- Configuration ---
+BACKTEST_DATASET_PATH = os.getenv("BACKTEST_DATASET_PATH", "historico.jsonl.gz")
+BACKTEST_WORKERS = int(os.getenv("BACKTEST_WORKERS", "0")) or os.cpu_count() or 1
+BACKTEST_BANKROLL = float(os.getenv("BACKTEST_BANKROLL", "100")) # Units; ROI = profit / bankroll (flat 1-unit stakes)
+CALIBRATION_BINS = 10
+LOG_LOSS_EPS = 1e-15
+OU_LINE = 2.5 # Goals line scored for Brier/log-loss
+BACKTEST_CORNERS_MIN_MATCHES = int(os.getenv("BACKTEST_CORNERS_MIN_MATCHES", "3")) # Earlier matches with corners (per team and venue) before corner markets are priced
+
+# Setup basic logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Dataset ---
+
+def load_dataset(path):
+    """Reads the historical store (gzip JSON lines, one finished fixture per line) grouped by (league_id, season)."""
+    grupos = defaultdict(list)
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                fixture = json.loads(line)
+                grupos[(fixture["league_id"], fixture["season"])].append(fixture)
+    return grupos
+
+def load_store(path=history_store.HISTORY_STORE_PATH):
+    """Reads finished fixtures and their closing odds (last snapshot up to kickoff) from the local history store."""
+    store = history_store.HistoryStore(path)
+    grupos = {}
+    for league_id, season in store.partitions():
+        fixtures = store.finished_matches(league_id, season)
+        if not fixtures:
+            continue
+        closing = store.closing_odds(league_id, season)
+        rows = store.read("fixtures", league_id, season)
+        corners = {f: (h, a) for f, h, a in zip(rows["fixture_id"].tolist(), rows["corners_home"].tolist(), rows["corners_away"].tolist())
+                   if h >= 0 and a >= 0}
+        for fixture in fixtures:
+            fixture.update(league_id=league_id, season=season)
+            if fixture["fixture_id"] in closing:
+                fixture["odds_table"] = history_store.odds_table(closing[fixture["fixture_id"]])
+            if fixture["fixture_id"] in corners:
+                fixture["corners_home"], fixture["corners_away"] = corners[fixture["fixture_id"]]
+        grupos[(league_id, season)] = fixtures
+    return grupos
+
+def export_dataset(path, league_ids, seasons, with_odds=False):
+    """Builds the historical store from the API (finished fixtures and, optionally, their stored odds).
+
+    Odds of past fixtures are only kept by the API for a short time, so --with-odds is meant for recent rounds
+    (or replayed recordings, API_TRANSPORT=replay); fixtures without odds still count for Brier/log-loss.
+    """
+    import api_handler # Only the export talks to the API; the backtest itself runs offline
+
+    total = 0
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for league_id in league_ids:
+            for season in seasons:
+                fixtures, error_msg = api_handler.get_finished_fixtures(league_id, season)
+                if error_msg:
+                    logging.warning(f"Liga {league_id}/{season} ignorada: {error_msg}")
+                    continue
+                for fixture in fixtures:
+                    entry = dict(fixture, league_id=league_id, season=season)
+                    if with_odds:
+                        raw_odds, _ = api_handler.get_fixture_odds(fixture["fixture_id"])
+                        entry["odds"] = raw_odds
+                    f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+                    total += 1
+    logging.info(f"Histórico exportado para {path}: {total} jogos.")
+    return total
+
+def build_synthetic_dataset(path, n_leagues=4, seasons=(2022, 2023), n_teams=20, n_books=5, margin=0.05, seed=11):
+    """Simulates leagues from a known Poisson strength model, with odds priced off the true probabilities.
+
+    A well-specified model should come out close to calibrated here, and lose roughly the margin on its bets.
+    """
+    rng = np.random.default_rng(seed)
+    total = 0
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for league in range(n_leagues):
+            league_id = 1000 + league
+            for season in seasons:
+                attack = rng.normal(0, 0.3, n_teams)
+                defence = rng.normal(0, 0.3, n_teams)
+                start = time.mktime((season, 8, 1, 15, 0, 0, 0, 0, -1))
+                pairs = [(h, a) for h in range(n_teams) for a in range(n_teams) if h != a]
+                rng.shuffle(pairs)
+                for n, (h, a) in enumerate(pairs):
+                    lambda_casa = math.exp(0.1 + 0.25 + attack[h] - defence[a])
+                    lambda_fora = math.exp(0.1 + attack[a] - defence[h])
+                    entry = {
+                        "league_id": league_id, "season": season, "fixture_id": league_id * 100000 + season * 10 + n,
+                        "timestamp": int(start + (n // (n_teams // 2)) * 7 * 86400),
+                        "home_id": league_id * 100 + h, "away_id": league_id * 100 + a,
+                        "home_goals": int(rng.poisson(lambda_casa)), "away_goals": int(rng.poisson(lambda_fora)),
+                        "odds": _synthetic_odds(lambda_casa, lambda_fora, n_books, margin, rng),
+                    }
+                    f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+                    total += 1
+    return total
+
+def _synthetic_odds(lambda_casa, lambda_fora, n_books, margin, rng):
+    goals = np.arange(11)
+    pmf_casa = np.exp(-lambda_casa) * lambda_casa ** goals / np.array([math.factorial(int(g)) for g in goals])
+    pmf_fora = np.exp(-lambda_fora) * lambda_fora ** goals / np.array([math.factorial(int(g)) for g in goals])
+    matrix = np.outer(pmf_casa, pmf_fora)
+    matrix /= matrix.sum()
+    total = goals[:, None] + goals[None, :]
+    p_home, p_draw = np.tril(matrix, -1).sum(), np.trace(matrix)
+    p_over = matrix[total > OU_LINE].sum()
+    p_btts = matrix[1:, 1:].sum()
+    fair = [
+        (1, "Match Winner", [("Home", p_home), ("Draw", p_draw), ("Away", 1 - p_home - p_draw)]),
+        (5, "Over/Under", [(f"Over {OU_LINE}", p_over), (f"Under {OU_LINE}", 1 - p_over)]),
+        (8, "Both Teams Score", [("Yes", p_btts), ("No", 1 - p_btts)]),
+    ]
+    bookmakers = []
+    for b in range(n_books):
+        bets = [{"id": bet_id, "name": name,
+                 "values": [{"value": value, "odd": f"{max(1.01, 1 / (p * (1 + margin)) * rng.uniform(0.97, 1.03)):.2f}"}
+                            for value, p in values]}
+                for bet_id, name, values in fair]
+        bookmakers.append({"id": b + 1, "name": f"Casa {b + 1}", "bets": bets})
+    return {"bookmakers": bookmakers}
+
+# --- Settlement ---
+
+def liquidar(chave, home_goals, away_goals, corners=None):
+    """Outcome of a bet on (market, key) for a final score: 1 win, 0.5 push (stake returned), 0 loss, None if unknown."""
+    mercado, key = chave
+    if mercado == odds.MERCADO_1X2:
+        resultado = "casa" if home_goals > away_goals else "fora" if away_goals > home_goals else "empate"
+        return 1.0 if key == resultado else 0.0
+    if mercado == odds.MERCADO_BTTS:
+        ambos = home_goals > 0 and away_goals > 0
+        return 1.0 if (key == "Sim") == ambos else 0.0
+    if mercado in (odds.MERCADO_OU_GOLS, odds.MERCADO_OU_CANTOS):
+        total = home_goals + away_goals if mercado == odds.MERCADO_OU_GOLS else corners
+        if total is None:
+            return None
+        over = key.startswith("Over")
+        limit = float(key[4:] if over else key[5:])
+        diff = (total - limit) if over else (limit - total)
+        return 1.0 if diff > 0 else 0.5 if diff == 0 else 0.0
+    if mercado == odds.MERCADO_AH:
+        line, team = key.split("_")
+        margem = (home_goals - away_goals) if team == "home" else (away_goals - home_goals)
+        diff = margem + float(line)
+        return 1.0 if diff > 0 else 0.5 if diff == 0 else 0.0
+    return None
+
+def _cantos_do_jogo(fixture):
+    """(home, away) corners of a finished fixture, or None when they weren't recorded."""
+    home, away = fixture.get("corners_home"), fixture.get("corners_away")
+    if home is None or away is None or home < 0 or away < 0:
+        return None
+    return home, away
+
+def _lucro(resultado, odd):
+    """Profit of a 1-unit stake."""
+    return odd - 1.0 if resultado == 1.0 else 0.0 if resultado == 0.5 else -1.0
+
+# --- Accumulators ---
+
+def _novo_acumulador():
+    return {
+        "fixtures": 0, "previstos": 0, "sem_modelo": 0, "com_odds": 0,
+        "pontuacao": defaultdict(lambda: {"n": 0, "brier": 0.0, "log_loss": 0.0}),
+        "calibracao": defaultdict(lambda: {"n": [0] * CALIBRATION_BINS, "prob": [0.0] * CALIBRATION_BINS, "acertos": [0] * CALIBRATION_BINS}),
+        "apostas": defaultdict(lambda: {"apostas": 0, "apostado": 0.0, "lucro": 0.0, "ganhas": 0, "devolvidas": 0, "odd_soma": 0.0}),
+    }
+
+def _pontuar(acc, mercado, probs, ocorreu):
+    """Adds Brier (sum over classes) and log-loss of one prediction, and its classes to the calibration bins."""
+    probs = np.clip(np.asarray(probs, dtype=float), 0.0, 1.0)
+    ocorreu = np.asarray(ocorreu, dtype=float)
+    pontuacao = acc["pontuacao"][mercado]
+    pontuacao["n"] += 1
+    pontuacao["brier"] += float(((probs - ocorreu) ** 2).sum())
+    pontuacao["log_loss"] += -math.log(max(LOG_LOSS_EPS, float(probs[ocorreu.argmax()])))
+    bins = np.minimum((probs * CALIBRATION_BINS).astype(int), CALIBRATION_BINS - 1)
+    calibracao = acc["calibracao"][mercado]
+    for b, p, o in zip(bins.tolist(), probs.tolist(), ocorreu.tolist()):
+        calibracao["n"][b] += 1
+        calibracao["prob"][b] += p
+        calibracao["acertos"][b] += int(o)
+
+def _apostar(acc, estrategia, aposta, resultado):
+    for chave in (estrategia, f"{estrategia}:{aposta['mercado']}"):
+        stats = acc["apostas"][chave]
+        stats["apostas"] += 1
+        stats["apostado"] += 1.0
+        stats["lucro"] += _lucro(resultado, aposta["odd"])
+        stats["ganhas"] += int(resultado == 1.0)
+        stats["devolvidas"] += int(resultado == 0.5)
+        stats["odd_soma"] += aposta["odd"]
+
+def _merge(total, parcial):
+    for campo in ("fixtures", "previstos", "sem_modelo", "com_odds"):
+        total[campo] += parcial[campo]
+    for mercado, stats in parcial["pontuacao"].items():
+        for campo, valor in stats.items():
+            total["pontuacao"][mercado][campo] += valor
+    for mercado, stats in parcial["calibracao"].items():
+        for campo, valores in stats.items():
+            destino = total["calibracao"][mercado][campo]
+            for b, valor in enumerate(valores):
+                destino[b] += valor
+    for chave, stats in parcial["apostas"].items():
+        for campo, valor in stats.items():
+            total["apostas"][chave][campo] += valor
+    return total
+
+def _plain(acc):
+    """Accumulator with plain dicts (picklable, JSON-serialisable)."""
+    return {campo: {k: dict(v) for k, v in valor.items()} if isinstance(valor, defaultdict) else valor for campo, valor in acc.items()}
+
+# --- Walk-forward Season ---
+
+def _acumular_cantos(cantos, jogos):
+    """Adds the corners of finished fixtures to the running totals: (team_id, venue) -> [won, conceded, matches]."""
+    for fixture in jogos:
+        placar = _cantos_do_jogo(fixture)
+        if placar is None:
+            continue
+        for team_id, venue, won, conceded in ((fixture["home_id"], "home", *placar), (fixture["away_id"], "away", *placar[::-1])):
+            total = cantos[(team_id, venue)]
+            total[0] += won
+            total[1] += conceded
+            total[2] += 1
+
+def _medias_cantos(fixture, cantos):
+    """api_data corner averages of a fixture (home team at home, away team away), or None with too few matches.
+
+    Averages given by the dataset win; otherwise they come from the earlier results of the season.
+    """
+    if fixture.get("avg_corners_home") is not None and fixture.get("avg_corners_away") is not None:
+        return {"avg_corners_home": fixture["avg_corners_home"], "avg_corners_away": fixture["avg_corners_away"]}
+    casa, fora = cantos.get((fixture["home_id"], "home")), cantos.get((fixture["away_id"], "away"))
+    if casa is None or fora is None or min(casa[2], fora[2]) < BACKTEST_CORNERS_MIN_MATCHES:
+        return None
+    return {"avg_corners_home": casa[0] / casa[2], "avg_corners_away": fora[0] / fora[2],
+            "avg_corners_against_home": casa[1] / casa[2], "avg_corners_against_away": fora[1] / fora[2]}
+
+def backtest_season(league_id, season, fixtures):
+    """Backtests one league/season: per match day, refit on earlier results, predict, score and settle bets."""
+    acc = _novo_acumulador()
+    fixtures = sorted(fixtures, key=lambda f: (f["timestamp"], f["fixture_id"]))
+    acc["fixtures"] = len(fixtures)
+    dias = defaultdict(list)
+    for fixture in fixtures:
+        dias[fixture["timestamp"] // 86400].append(fixture)
+
+    model = None
+    anteriores = []
+    confrontos = h2h_index.H2HIndex()
+    cantos = defaultdict(lambda: [0, 0, 0])
+    for dia in sorted(dias):
+        jogos = dias[dia]
+        if len(anteriores) >= league_model.LEAGUE_MODEL_MIN_MATCHES:
+            weights = league_model._decay_weights(anteriores, now=dia * 86400)
+            if model is None:
+                model = league_model.fit_league_model(league_id, season, anteriores, weights=weights)
+            else:
+                model = league_model.update_league_model(model, anteriores, weights=weights) or model
+
+        lote, previstos = [], []
+        for fixture in jogos:
+            lambdas = model.lambdas(fixture["home_id"], fixture["away_id"]) if model is not None else None
+            if lambdas is None:
+                acc["sem_modelo"] += 1
+                continue
+            if h2h_index.H2H_ENABLED:
+                meetings = confrontos.lookup(fixture["home_id"], fixture["away_id"])
+                lambdas = h2h_index.shrink_lambdas(*lambdas, meetings, fixture["home_id"],
+                                                   model.lambdas(fixture["away_id"], fixture["home_id"]), now=fixture["timestamp"])
+            api_data = {"lambda_casa": lambdas[0], "lambda_fora": lambdas[1], "rho": model.rho,
+                        "score_model": score_models.modelo_da_liga(league_id), "league_id": league_id}
+            medias = _medias_cantos(fixture, cantos)
+            api_data.update(medias or {})
+            lote.append(api_data)
+            previstos.append((fixture, medias is not None))
+
+        for (fixture, com_cantos), (previsoes, _) in zip(previstos, analysis.analisar_lote(lote) if lote else []):
+            if not previsoes:
+                continue
+            if not com_cantos:
+                # Without corner averages the analysis prices corners off its fixed fallback; never bet on that
+                previsoes.pop("over_under_cantos", None)
+            acc["previstos"] += 1
+            _avaliar(acc, fixture, previsoes)
+
+        anteriores.extend(jogos)
+        confrontos.update(jogos)
+        _acumular_cantos(cantos, jogos)
+    return _plain(acc)
+
+def _avaliar(acc, fixture, previsoes):
+    """Scores the fixture's probabilities and settles its value bets on the final score."""
+    home_goals, away_goals = fixture["home_goals"], fixture["away_goals"]
+    p_1x2 = previsoes["1X2"]
+    _pontuar(acc, "1X2", [p_1x2["casa"] / 100, p_1x2["empate"] / 100, p_1x2["fora"] / 100],
+             [home_goals > away_goals, home_goals == away_goals, home_goals < away_goals])
+    for linha in previsoes.get("over_under_gols", []):
+        if linha["limite"] == OU_LINE:
+            _pontuar(acc, f"Over/Under {OU_LINE}", [linha["over"] / 100, linha["under"] / 100],
+                     [home_goals + away_goals > OU_LINE, home_goals + away_goals < OU_LINE])
+    btts = previsoes["ambos_marcam"]
+    ambos = home_goals > 0 and away_goals > 0
+    _pontuar(acc, "Ambas Marcam", [btts["sim"] / 100, btts["nao"] / 100], [ambos, not ambos])
+
+    tabela = fixture.get("odds_table")
+    if tabela is None:
+        if not fixture.get("odds"):
+            return
+        tabela = odds.parse_odds_table(fixture["odds"])
+    value_bets = analysis.escanear_value_bets(previsoes, tabela)
+    acc["com_odds"] += 1
+    placar_cantos = _cantos_do_jogo(fixture)
+    corners = sum(placar_cantos) if placar_cantos is not None else None
+    liquidadas = [(aposta, liquidar(aposta["chave"], home_goals, away_goals, corners)) for aposta in value_bets]
+    liquidadas = [(aposta, resultado) for aposta, resultado in liquidadas if resultado is not None]
+    if liquidadas:
+        _apostar(acc, "melhor", *liquidadas[0])
+    for aposta, resultado in liquidadas:
+        _apostar(acc, "todas", aposta, resultado)
+
+def _backtest_task(args):
+    return backtest_season(*args)
+
+def _init_worker():
+    logging.disable(logging.WARNING) # Per-fixture analysis logs would flood the run
+
+def run_backtest(grupos, workers=BACKTEST_WORKERS):
+    """Runs every (league_id, season) group on a process pool and merges the results."""
+    total = _novo_acumulador()
+    por_temporada = {}
+    tarefas = [(league_id, season, fixtures) for (league_id, season), fixtures in sorted(grupos.items())]
+    # Largest seasons first, so a long one doesn't start last and hold up the pool
+    tarefas.sort(key=lambda t: len(t[2]), reverse=True)
+    if workers <= 1:
+        _init_worker()
+        resultados = map(_backtest_task, tarefas)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+        resultados = executor.map(_backtest_task, tarefas)
+    try:
+        for (league_id, season, _), parcial in zip(tarefas, resultados):
+            por_temporada[f"{league_id}/{season}"] = resumir(parcial)
+            _merge(total, parcial)
+    finally:
+        if workers > 1:
+            executor.shutdown()
+        logging.disable(logging.NOTSET)
+    return resumir(_plain(total)), por_temporada
+
+# --- Reporting ---
+
+def resumir(acc):
+    """Turns an accumulator into the report: fixtures, scores per market, calibration curves and betting results."""
+    pontuacao = {mercado: {"n": s["n"], "brier": s["brier"] / s["n"], "log_loss": s["log_loss"] / s["n"]}
+                 for mercado, s in acc["pontuacao"].items() if s["n"]}
+    calibracao = {}
+    for mercado, c in acc["calibracao"].items():
+        calibracao[mercado] = [
+            {"faixa": f"{b / CALIBRATION_BINS:.1f}-{(b + 1) / CALIBRATION_BINS:.1f}", "n": c["n"][b],
+             "prevista": c["prob"][b] / c["n"][b], "observada": c["acertos"][b] / c["n"][b]}
+            for b in range(CALIBRATION_BINS) if c["n"][b]
+        ]
+    apostas = {}
+    for chave, s in acc["apostas"].items():
+        if s["apostas"]:
+            apostas[chave] = {
+                "apostas": s["apostas"], "lucro": round(s["lucro"], 3),
+                "yield": s["lucro"] / s["apostado"], "roi": s["lucro"] / BACKTEST_BANKROLL,
+                "acerto": s["ganhas"] / s["apostas"], "odd_media": s["odd_soma"] / s["apostas"],
+            }
+    return {
+        "fixtures": acc["fixtures"], "previstos": acc["previstos"], "sem_modelo": acc["sem_modelo"], "com_odds": acc["com_odds"],
+        "pontuacao": pontuacao, "calibracao": calibracao, "apostas": apostas,
+    }
+
+def print_report(resumo, segundos):
+    print(f"Jogos: {resumo['fixtures']} | previstos: {resumo['previstos']} | sem modelo (início de temporada): "
+          f"{resumo['sem_modelo']} | com odds: {resumo['com_odds']} | tempo: {segundos:.1f}s")
+    print()
+    header = f"{'mercado':<24} {'n':>8} {'Brier':>8} {'log-loss':>9}"
+    print(header)
+    print("-" * len(header))
+    for mercado, s in sorted(resumo["pontuacao"].items()):
+        print(f"{mercado:<24} {s['n']:>8} {s['brier']:>8.4f} {s['log_loss']:>9.4f}")
+    print()
+    header = f"{'estratégia':<32} {'apostas':>8} {'lucro':>9} {'yield':>8} {'ROI':>8} {'acerto':>7} {'odd média':>10}"
+    print(header)
+    print("-" * len(header))
+    for chave, s in sorted(resumo["apostas"].items()):
+        print(f"{chave:<32} {s['apostas']:>8} {s['lucro']:>9.2f} {s['yield'] * 100:>7.1f}% {s['roi'] * 100:>7.1f}% "
+              f"{s['acerto'] * 100:>6.1f}% {s['odd_media']:>10.2f}")
+    for mercado, curva in sorted(resumo["calibracao"].items()):
+        print(f"\nCalibração - {mercado} (prevista -> observada, n)")
+        for ponto in curva:
+            print(f"  {ponto['faixa']}: {ponto['prevista'] * 100:5.1f}% -> {ponto['observada'] * 100:5.1f}%  ({ponto['n']})")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest das previsões e apostas de valor sobre jogos históricos.")
+    parser.add_argument("dataset", nargs="?", default=BACKTEST_DATASET_PATH, help="Histórico (JSON lines gzip).")
+    parser.add_argument("--workers", type=int, default=BACKTEST_WORKERS)
+    parser.add_argument("--store", nargs="?", const=history_store.HISTORY_STORE_PATH, metavar="DIR",
+                        help="Lê jogos e odds do histórico local (history_store.py) em vez do arquivo JSON lines.")
+    parser.add_argument("--export", help="Exporta o histórico da API para este arquivo (com --league/--season) e sai.")
+    parser.add_argument("--league", type=int, action="append", default=[])
+    parser.add_argument("--season", type=int, action="append", default=[])
+    parser.add_argument("--with-odds", action="store_true", help="Na exportação, busca também as odds de cada jogo.")
+    parser.add_argument("--synthetic", type=int, metavar="LIGAS", help="Gera e usa um histórico simulado com N ligas.")
+    parser.add_argument("--json", help="Grava o relatório completo (incluindo por liga/temporada) em JSON.")
+    return parser.parse_args(argv)
+
+def run(argv=None):
+    args = parse_args(argv)
+    if args.export:
+        if not args.league or not args.season:
+            print("--league e --season são obrigatórios com --export.", file=sys.stderr)
+            return 2
+        export_dataset(args.export, args.league, args.season, with_odds=args.with_odds)
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset = args.dataset
+        if args.synthetic:
+            dataset = os.path.join(tmp, "historico_sintetico.jsonl.gz")
+            build_synthetic_dataset(dataset, n_leagues=args.synthetic)
+        if args.store:
+            grupos = load_store(args.store)
+        elif not os.path.exists(dataset):
+            print(f"Histórico não encontrado: {dataset} (use --export ou --synthetic).", file=sys.stderr)
+            return 2
+        else:
+            grupos = load_dataset(dataset)
+
+    started = time.perf_counter()
+    resumo, por_temporada = run_backtest(grupos, workers=args.workers)
+    print_report(resumo, time.perf_counter() - started)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"total": resumo, "por_temporada": por_temporada}, f, indent=2, ensure_ascii=False)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,334 @@
+# Benchmark suite for the message -> report pipeline (standalone runner, replayed API data)
+#
+# Usage:
+#   python benchmark.py                               # run and print p50/p95/p99, throughput, allocations
+#   python benchmark.py --save-baseline bench.json    # store the results as the baseline
+#   python benchmark.py --baseline bench.json         # fail (exit 1) if a case regressed beyond --threshold
+#   python benchmark.py --recordings api_recordings.jsonl.gz --message "Flamengo x Palmeiras, Serie A, Country=Brazil"
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+import analysis
+import api_handler
+import api_transport
+import main
+import odds
+import score_models
+
+# --- Configuration ---
+DEFAULT_ITERATIONS = 200
+DEFAULT_WARMUP = 20
+DEFAULT_THRESHOLD = 0.25 # Allowed relative regression of p50/p95 and peak allocation vs the baseline
+ALLOC_ITERATIONS = 20 # Iterations traced by tracemalloc (kept apart from the timed runs)
+SYNTHETIC_LEAGUE_ID = 39
+SYNTHETIC_SEASON = 2023
+SYNTHETIC_BOOKMAKERS = 20
+SYNTHETIC_TEAMS = 20
+SCORE_MODEL_BATCH = 1000 # Fixtures per call in the score-model cases
+
+# --- Synthetic Recordings ---
+
+def _fake_response(body):
+    response = Response()
+    response.status_code = 200
+    response.headers = CaseInsensitiveDict({"Content-Type": "application/json"})
+    response._content = json.dumps({"errors": [], "response": body}).encode("utf-8")
+    response.encoding = "utf-8"
+    return response
+
+def _synthetic_odds(fixture_id, rng, n_books=SYNTHETIC_BOOKMAKERS):
+    """Odds of every bookmaker for a fixture, in the API shape ({"bookmakers": [{"bets": [...]}, ...]}).
+
+    Each book quotes the same base prices (the simulated data in analysis.py) with its own noise.
+    """
+    base = [
+        (1, "Match Winner", [("Home", 2.10), ("Draw", 3.50), ("Away", 3.20)]),
+        (5, "Over/Under", [("Over 2.5", 1.80), ("Under 2.5", 2.00), ("Over 3.5", 2.90), ("Under 3.5", 1.40)]),
+        (8, "Both Teams Score", [("Yes", 1.66), ("No", 2.10)]),
+        (4, "Asian Handicap", [("Home -0.5", 2.15), ("Away +0.5", 1.75), ("Home -1.0", 2.90), ("Away +1.0", 1.45)]),
+        (13, "Corners Over/Under", [("Over 9.5", 1.85), ("Under 9.5", 1.95), ("Over 10.5", 2.10), ("Under 10.5", 1.70)]),
+    ]
+    bookmakers = []
+    for b in range(n_books):
+        bets = [{"id": bet_id, "name": name, "values": [{"value": value, "odd": f"{max(1.01, odd * rng.uniform(0.95, 1.05)):.2f}"}
+                                                        for value, odd in values]}
+                for bet_id, name, values in base]
+        bookmakers.append({"id": b + 1, "name": f"Casa {b + 1}", "bets": bets})
+    return {"fixture": {"id": fixture_id}, "bookmakers": bookmakers}
+
+def _synthetic_stats(team_id, rng):
+    scored_home, scored_away = rng.uniform(0.8, 2.4), rng.uniform(0.5, 1.8)
+    conceded_home, conceded_away = rng.uniform(0.6, 1.8), rng.uniform(0.8, 2.2)
+    return {
+        "league": {"id": SYNTHETIC_LEAGUE_ID, "season": SYNTHETIC_SEASON},
+        "team": {"id": team_id},
+        "goals": {
+            "for": {"average": {"home": f"{scored_home:.1f}", "away": f"{scored_away:.1f}", "total": f"{(scored_home + scored_away) / 2:.1f}"}},
+            "against": {"average": {"home": f"{conceded_home:.1f}", "away": f"{conceded_away:.1f}", "total": f"{(conceded_home + conceded_away) / 2:.1f}"}},
+        },
+    }
+
+def build_synthetic_recordings(path, n_pairs=10, seed=7):
+    """Records a synthetic league (teams, a full season of results, stats, odds, H2H) and returns the messages.
+
+    The requests are exactly the ones the bot makes for each message, so replay covers the whole path.
+    """
+    rng = np.random.default_rng(seed)
+    store = api_transport.RecordingStore(path)
+    league_name = "Premier League"
+    teams = [(100 + i, f"Time {i + 1}") for i in range(SYNTHETIC_TEAMS)]
+
+    league_item = {"league": {"id": SYNTHETIC_LEAGUE_ID, "name": league_name}, "country": {"name": "England"},
+                   "seasons": [{"year": SYNTHETIC_SEASON}]}
+    store.record("leagues", {"search": league_name, "season": SYNTHETIC_SEASON}, _fake_response([league_item]))
+    for team_id, name in teams:
+        store.record("teams", {"search": name}, _fake_response([{"team": {"id": team_id, "name": name, "country": "England"}}]))
+        store.record("teams/statistics", {"team": team_id, "league": SYNTHETIC_LEAGUE_ID, "season": SYNTHETIC_SEASON},
+                     _fake_response(_synthetic_stats(team_id, rng)))
+
+    finished = []
+    for h, (home_id, _) in enumerate(teams):
+        for a, (away_id, _) in enumerate(teams):
+            if h != a:
+                finished.append({
+                    "fixture": {"id": 10000 + len(finished), "timestamp": int(time.time()) - len(finished) * 3600},
+                    "teams": {"home": {"id": home_id}, "away": {"id": away_id}},
+                    "goals": {"home": int(rng.poisson(1.5)), "away": int(rng.poisson(1.15))},
+                })
+    store.record("fixtures", {"league": SYNTHETIC_LEAGUE_ID, "season": SYNTHETIC_SEASON, "status": "-".join(api_handler.FINISHED_STATUSES)},
+                 _fake_response(finished))
+
+    messages = []
+    for k in range(n_pairs):
+        (home_id, home_name), (away_id, away_name) = teams[2 * k % SYNTHETIC_TEAMS], teams[(2 * k + 1) % SYNTHETIC_TEAMS]
+        fixture_id = 20000 + k
+        store.record("fixtures", {"league": SYNTHETIC_LEAGUE_ID, "season": SYNTHETIC_SEASON, "team": home_id, "status": "NS", "next": "10"},
+                     _fake_response([{"fixture": {"id": fixture_id, "date": "2023-08-12T14:00:00+00:00"},
+                                      "teams": {"home": {"id": home_id}, "away": {"id": away_id}}}]))
+        store.record("odds", {"fixture": fixture_id}, _fake_response([_synthetic_odds(fixture_id, rng)]))
+        store.record("fixtures/headtohead", {"h2h": f"{home_id}-{away_id}", "last": 10}, _fake_response([]))
+        messages.append(f"{home_name} x {away_name}, {league_name}")
+    return messages
+
+# --- Measurement ---
+
+def _percentiles_ms(samples_ns):
+    p50, p95, p99 = np.percentile(np.asarray(samples_ns) / 1e6, [50, 95, 99])
+    return round(float(p50), 4), round(float(p95), 4), round(float(p99), 4)
+
+def measure(name, func, iterations, warmup):
+    """Times `func` per call (after warmup), then traces a few calls for peak allocation."""
+    for _ in range(warmup):
+        func()
+    samples = []
+    started = time.perf_counter_ns()
+    for _ in range(iterations):
+        t0 = time.perf_counter_ns()
+        func()
+        samples.append(time.perf_counter_ns() - t0)
+    elapsed_s = (time.perf_counter_ns() - started) / 1e9
+
+    tracemalloc.start()
+    peaks = []
+    for _ in range(min(iterations, ALLOC_ITERATIONS)):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        func()
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    p50, p95, p99 = _percentiles_ms(samples)
+    return {
+        "case": name,
+        "iterations": iterations,
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "p99_ms": p99,
+        "throughput_ops": round(iterations / elapsed_s, 1) if elapsed_s else 0.0,
+        "peak_alloc_kib": round(float(np.median(peaks)) / 1024, 1),
+    }
+
+def measure_concurrent(name, messages, concurrency, rounds):
+    """Throughput of process_analysis_request with `concurrency` distinct messages in flight at once."""
+
+    async def _run():
+        latencies = []
+
+        async def _one(text):
+            t0 = time.perf_counter_ns()
+            await main.process_analysis_request(text)
+            latencies.append(time.perf_counter_ns() - t0)
+
+        started = time.perf_counter_ns()
+        for _ in range(rounds):
+            await asyncio.gather(*(_one(messages[i % len(messages)]) for i in range(concurrency)))
+        return latencies, (time.perf_counter_ns() - started) / 1e9
+
+    latencies, elapsed_s = asyncio.run(_run())
+    p50, p95, p99 = _percentiles_ms(latencies)
+    return {
+        "case": name,
+        "iterations": len(latencies),
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "p99_ms": p99,
+        "throughput_ops": round(len(latencies) / elapsed_s, 1) if elapsed_s else 0.0,
+        "peak_alloc_kib": None,
+    }
+
+# --- Cases ---
+
+def _score_model_case(nome, lambdas_casa, lambdas_fora):
+    """Score tensor of a whole batch with one score model (its parameter taken from an empty fixture)."""
+    modelos = [nome] * len(lambdas_casa)
+    parametros = [score_models.MODELOS[nome][1]({})] * len(lambdas_casa)
+    return lambda: score_models.score_matrices(lambdas_casa, lambdas_fora, analysis.MAX_GOALS, modelos, parametros)
+
+def run_suite(messages, iterations, warmup, concurrency):
+    """Runs every case and returns the list of results."""
+    loop = asyncio.new_event_loop()
+    message_cycle = {"i": 0}
+
+    def _next_message():
+        message_cycle["i"] += 1
+        return messages[message_cycle["i"] % len(messages)]
+
+    first_report = loop.run_until_complete(main.process_analysis_request(messages[0]))
+    if "Desculpe" in first_report or "Formato inválido" in first_report:
+        raise RuntimeError(f"Mensagem de benchmark não produziu relatório: {first_report}")
+
+    api_data = main.get_processed_fixture_data(*main._parse_message(messages[0]))
+    lambda_casa, lambda_fora = api_data["lambda_casa"], api_data["lambda_fora"]
+    matrix = analysis._get_poisson_matrix(lambda_casa, lambda_fora)
+    previsoes, melhor_aposta = analysis.analisar_jogo_completo(api_data)
+    tabela_odds = odds.parse_odds_table(api_data.get("raw_odds"))
+    rng = np.random.default_rng(0)
+    lote_casa, lote_fora = rng.uniform(0.3, 3.0, SCORE_MODEL_BATCH), rng.uniform(0.3, 3.0, SCORE_MODEL_BATCH)
+
+    cases = [
+        ("_get_poisson_matrix", lambda: analysis._get_poisson_matrix(lambda_casa, lambda_fora)),
+        ("calcular_1x2", lambda: analysis.calcular_1x2(matrix)),
+        ("calcular_handicaps", lambda: analysis.calcular_handicaps(matrix)),
+        ("calcular_over_under", lambda: analysis.calcular_over_under(matrix)),
+        ("calcular_ambas_marcam", lambda: analysis.calcular_ambas_marcam(matrix)),
+        ("calcular_placar_exato", lambda: analysis.calcular_placar_exato(matrix)),
+        *[(f"score_matrices[{nome}] x{SCORE_MODEL_BATCH}", _score_model_case(nome, lote_casa, lote_fora)) for nome in score_models.MODELOS],
+        ("calcular_total_cantos", lambda: analysis.calcular_total_cantos(api_data)),
+        ("calcular_ht_ft", lambda: analysis.calcular_ht_ft(api_data)),
+        ("_parse_odds", lambda: analysis._parse_odds(api_data.get("raw_odds"))),
+        ("parse_odds_table", lambda: odds.parse_odds_table(api_data.get("raw_odds"))),
+        ("determinar_melhor_aposta", lambda: analysis.determinar_melhor_aposta(previsoes, tabela_odds)),
+        ("analisar_jogo_completo", lambda: analysis.analisar_jogo_completo(api_data)),
+        ("format_report", lambda: main.format_report(previsoes, melhor_aposta, "Time 1", "Time 2")),
+        ("process_analysis_request", lambda: loop.run_until_complete(main.process_analysis_request(_next_message()))),
+    ]
+    results = [measure(name, func, iterations, warmup) for name, func in cases]
+    loop.close()
+    if concurrency > 1:
+        rounds = max(1, iterations // concurrency)
+        results.append(measure_concurrent(f"process_analysis_request x{concurrency}", messages, concurrency, rounds))
+    return results
+
+# --- Reporting ---
+
+def compare_to_baseline(results, baseline, threshold):
+    """Returns the list of regressions (p50, p95 or peak allocation above baseline * (1 + threshold))."""
+    regressions = []
+    for result in results:
+        base = baseline.get(result["case"])
+        if not base:
+            continue
+        for metric in ("p50_ms", "p95_ms", "peak_alloc_kib"):
+            current, previous = result.get(metric), base.get(metric)
+            if current is None or not previous:
+                continue
+            if current > previous * (1 + threshold):
+                regressions.append(f"{result['case']}: {metric} {previous} -> {current} (+{(current / previous - 1) * 100:.0f}%)")
+    return regressions
+
+def print_table(results):
+    header = f"{'caso':<40} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'ops/s':>10} {'pico KiB':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        alloc = f"{r['peak_alloc_kib']:.1f}" if r["peak_alloc_kib"] is not None else "-"
+        print(f"{r['case']:<40} {r['p50_ms']:>10.4f} {r['p95_ms']:>10.4f} {r['p99_ms']:>10.4f} {r['throughput_ops']:>10.1f} {alloc:>10}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline mensagem -> relatório com dados da API reproduzidos.")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument("--warmup", type=int, default=DEFAULT_WARMUP)
+    parser.add_argument("--concurrency", type=int, default=8, help="Mensagens simultâneas no caso de vazão (1 desativa).")
+    parser.add_argument("--recordings", help="Arquivo de gravações (API_TRANSPORT=record). Padrão: liga sintética.")
+    parser.add_argument("--message", action="append", help="Mensagem a analisar (repetível); obrigatória com --recordings.")
+    parser.add_argument("--warm-caches", action="store_true", help="Mantém o cache de relatórios e a memorização dos mercados ativos.")
+    parser.add_argument("--baseline", help="JSON de referência; sai com código 1 se algum caso regredir.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--save-baseline", help="Grava os resultados como nova referência.")
+    parser.add_argument("--json", help="Grava os resultados completos em JSON.")
+    parser.add_argument("--verbose", action="store_true", help="Mantém os logs do bot.")
+    return parser.parse_args(argv)
+
+def run(argv=None):
+    args = parse_args(argv)
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.recordings:
+            if not args.message:
+                print("--message é obrigatório com --recordings.", file=sys.stderr)
+                return 2
+            recordings_path, messages = args.recordings, args.message
+        else:
+            recordings_path = os.path.join(tmp, "synthetic.jsonl.gz")
+            messages = args.message or build_synthetic_recordings(recordings_path)
+
+        # Everything below the transport is replayed; no network, no quota
+        api_transport.TRANSPORT_MODE = "replay"
+        api_transport._store = api_transport.RecordingStore(recordings_path)
+        if not args.warm_caches:
+            main._report_cache.max_size = 0
+            # Without this every repeated per-stage call would be a market memo hit, not the computation
+            analysis._memo_mercados.max_size = 0
+            analysis._memo_mercados.clear()
+        # League models are fitted by the nightly job, outside the request path
+        api_handler.refresh_league_models([SYNTHETIC_LEAGUE_ID], SYNTHETIC_SEASON)
+
+        results = run_suite(messages, args.iterations, args.warmup, args.concurrency)
+
+    logging.disable(logging.NOTSET)
+    print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({r["case"]: r for r in results}, f, indent=2)
+        print(f"\nReferência gravada em {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressões acima de {args.threshold * 100:.0f}%:")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print(f"\nSem regressões acima de {args.threshold * 100:.0f}% em relação a {args.baseline}.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,164 @@
+# Total-corners engine: negative binomial with per-league dispersion and cached CDF tables
+
+import logging
+import os
+import threading
+
+import numpy as np
+from scipy.stats import nbinom, poisson
+
+import history_store
+
+# --- Configuration ---
+# Negative-binomial size r (Var = mean + mean^2 / r); 0 = Poisson. Used for leagues without a fitted value.
+CORNERS_DISPERSION = float(os.getenv("CORNERS_DISPERSION", "40"))
+CORNERS_MIN_MATCHES = int(os.getenv("CORNERS_MIN_MATCHES", "50")) # Results with corners needed to fit a league
+MEAN_STEP = 0.05 # Grid spacing of the CDF tables (linear interpolation in between)
+MAX_MEAN = 30.0
+MAX_CORNERS = 60
+MIN_MEAN = 0.1
+DISPERSION_BOUNDS = (2.0, 500.0)
+
+# Setup basic logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+class CornerCdfTable:
+    """P(total corners <= k) on a grid of means for one dispersion, shared by every fixture using it."""
+
+    def __init__(self, dispersion):
+        self.dispersion = dispersion
+        self.means = np.arange(0.0, MAX_MEAN + 2 * MEAN_STEP, MEAN_STEP)
+        k = np.arange(MAX_CORNERS + 1)
+        if dispersion > 0:
+            # scipy's nbinom(n, p) has mean n(1-p)/p: n = r, p = r / (r + mean)
+            self.cdf = nbinom.cdf(k[None, :], dispersion, dispersion / (dispersion + self.means[:, None]))
+        else:
+            self.cdf = poisson.cdf(k[None, :], self.means[:, None])
+
+    def over_under(self, means, limits):
+        """(N, L) Over/Under probabilities for N means, via one interpolated CDF lookup (whole lines exclude the push)."""
+        means = np.clip(np.asarray(means, dtype=float), MIN_MEAN, MAX_MEAN)
+        lower = np.minimum((means / MEAN_STEP).astype(int), len(self.means) - 2)
+        frac = ((means - self.means[lower]) / MEAN_STEP)[:, None]
+        limits = np.asarray(limits, dtype=float)
+        # Over wins above floor(limit); Under wins up to ceil(limit) - 1. Both columns come from one gather.
+        k = np.clip(np.r_[np.floor(limits), np.ceil(limits) - 1].astype(int), -1, MAX_CORNERS)
+        cdf = self.cdf[lower][:, np.maximum(k, 0)] * (1 - frac) + self.cdf[lower + 1][:, np.maximum(k, 0)] * frac
+        cdf[:, k < 0] = 0.0
+        n = len(limits)
+        return 1.0 - cdf[:, :n], cdf[:, n:]
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+def get_table(dispersion):
+    """Cached CDF table for a dispersion (rounded to 0.1; <= 0 means Poisson)."""
+    key = round(float(dispersion), 1) if dispersion and dispersion > 0 else 0.0
+    table = _tables.get(key)
+    if table is None:
+        table = CornerCdfTable(key)
+        with _tables_lock:
+            table = _tables.setdefault(key, table)
+    return table
+
+# --- Per-league Dispersion ---
+
+def fit_dispersion(totals):
+    """Method-of-moments size r from total corners per match; 0 (Poisson) if there is no overdispersion.
+
+    Mean differences between fixtures also inflate the variance, so this leans towards more dispersion.
+    """
+    totals = np.asarray(totals, dtype=float)
+    if len(totals) < CORNERS_MIN_MATCHES:
+        return None
+    mean, var = totals.mean(), totals.var(ddof=1)
+    if var <= mean:
+        return 0.0
+    return float(np.clip(mean ** 2 / (var - mean), *DISPERSION_BOUNDS))
+
+class LeagueDispersions:
+    """Fitted corner dispersion per league, from results with corners in the local history store.
+
+    Fitted on first use and refitted (refit) whenever the number of stored results with corners changes.
+    """
+
+    def __init__(self, default=CORNERS_DISPERSION):
+        self.default = default
+        self._lock = threading.Lock()
+        self._fitted = {} # league_id -> (r or None when there isn't enough data, results it was fitted on)
+
+    def set(self, league_id, totals):
+        """Fits and stores a league's dispersion from total corners per match. Returns it (None = default)."""
+        r = fit_dispersion(totals)
+        with self._lock:
+            self._fitted[league_id] = (r, len(totals))
+        if r is not None:
+            logging.info(f"Dispersão de cantos da liga {league_id}: r={r:.1f} ({len(totals)} jogos).")
+        return r
+
+    def get(self, league_id):
+        """Dispersion of a league, fitted from the history store on first use; the default when unknown."""
+        if league_id is None:
+            return self.default
+        with self._lock:
+            fitted = self._fitted.get(league_id)
+        r = self.set(league_id, _stored_totals(league_id)) if fitted is None else fitted[0]
+        return self.default if r is None else r
+
+    def refit(self, league_id):
+        """Refits a league from the history store if its results with corners changed since the last fit. Returns r."""
+        totals = _stored_totals(league_id)
+        with self._lock:
+            fitted = self._fitted.get(league_id)
+        if fitted is not None and fitted[1] == len(totals):
+            return fitted[0]
+        return self.set(league_id, totals)
+
+    def stats(self):
+        with self._lock:
+            return {league_id: r for league_id, (r, _) in self._fitted.items() if r is not None}
+
+def _stored_totals(league_id):
+    if not history_store.HISTORY_STORE_ENABLED:
+        return []
+    try:
+        store = history_store.get_store()
+        totals = []
+        for stored_league, season in store.partitions():
+            if stored_league == league_id:
+                rows = store.read("fixtures", league_id, season)
+                rows = rows[(rows["corners_home"] >= 0) & (rows["corners_away"] >= 0)]
+                totals.extend((rows["corners_home"].astype(int) + rows["corners_away"].astype(int)).tolist())
+        return totals
+    except Exception as e:
+        logging.warning(f"Falha ao ler cantos do histórico local (liga {league_id}): {e}")
+        return []
+
+# --- Expected Corners ---
+
+def expected_total(for_home, for_away, against_home=None, against_away=None):
+    """Expected total corners from each team's corners won (and, when known, conceded) per match.
+
+    With conceded rates, a team's expectation is the mean of what it wins and what its opponent concedes.
+    """
+    for_home, for_away = np.asarray(for_home, dtype=float), np.asarray(for_away, dtype=float)
+    home = for_home if against_away is None else np.where(np.isnan(against_away), for_home, (for_home + np.nan_to_num(against_away)) / 2)
+    away = for_away if against_home is None else np.where(np.isnan(against_home), for_away, (for_away + np.nan_to_num(against_home)) / 2)
+    return np.maximum(MIN_MEAN, home + away)
+
+def over_under(means, limits, dispersions=None):
+    """(N, L) Over/Under probabilities for N fixtures; fixtures sharing a dispersion share one table lookup."""
+    means = np.asarray(means, dtype=float)
+    if dispersions is None:
+        return get_table(CORNERS_DISPERSION).over_under(means, limits)
+    dispersions = np.asarray(dispersions, dtype=float)
+    over = np.empty((len(means), len(limits)))
+    under = np.empty((len(means), len(limits)))
+    for r in np.unique(dispersions):
+        rows = dispersions == r
+        over[rows], under[rows] = get_table(r).over_under(means[rows], limits)
+    return over, under
+
+# --- Shared Instance ---
+
+LEAGUE_DISPERSIONS = LeagueDispersions()
@@ -0,0 +1,134 @@
+# Pair-indexed head-to-head results, used to shrink the fixture lambdas towards past meetings
+
+import logging
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+
+import history_store
+
+# --- Configuration ---
+H2H_ENABLED = os.getenv("H2H_ENABLED", "1") not in ("0", "false", "False")
+H2H_MAX_MATCHES = int(os.getenv("H2H_MAX_MATCHES", "10")) # Most recent meetings kept per pair
+H2H_MIN_MATCHES = int(os.getenv("H2H_MIN_MATCHES", "3")) # Below this, the API H2H call is made once to fill the pair
+H2H_PRIOR_WEIGHT = float(os.getenv("H2H_PRIOR_WEIGHT", "8")) # Strength of the model lambdas, in (weighted) meetings
+H2H_HALF_LIFE_DAYS = float(os.getenv("H2H_HALF_LIFE_DAYS", "730")) # Weight of a meeting halves every N days (0 = no decay)
+H2H_SYNC_TTL = 6 * 3600 # Same as the API cache TTL of fixtures/headtohead
+
+# Setup basic logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def _pair(team_a, team_b):
+    return (team_a, team_b) if team_a <= team_b else (team_b, team_a)
+
+class H2HIndex:
+    """(team_a, team_b) -> most recent finished meetings, as (timestamp, fixture_id, home_id, home_goals, away_goals).
+
+    Built from finished fixtures (league fits, the local history store, API H2H responses) and updated
+    incrementally: fixtures already indexed are skipped, so feeding a whole season again costs a set lookup each.
+    """
+
+    def __init__(self, max_matches=H2H_MAX_MATCHES):
+        self.max_matches = max_matches
+        self._lock = threading.Lock()
+        self._pairs = defaultdict(list)
+        self._seen = set()
+        self._synced = {} # pair -> time of the last API H2H merge
+
+    def update(self, matches):
+        """Adds finished-fixture dicts (fixture_id, timestamp, home_id, away_id, home_goals, away_goals). Returns how many were new."""
+        added = 0
+        with self._lock:
+            for m in matches:
+                fixture_id = m.get("fixture_id")
+                if fixture_id is None or fixture_id in self._seen:
+                    continue
+                self._seen.add(fixture_id)
+                meetings = self._pairs[_pair(m["home_id"], m["away_id"])]
+                meetings.append((m.get("timestamp") or 0, fixture_id, m["home_id"], m["home_goals"], m["away_goals"]))
+                if len(meetings) > 1 and meetings[-1][0] < meetings[-2][0]:
+                    meetings.sort()
+                if len(meetings) > self.max_matches:
+                    del meetings[:len(meetings) - self.max_matches]
+                added += 1
+        return added
+
+    def lookup(self, team_a, team_b):
+        """Recent meetings of the two teams (either venue), oldest first."""
+        with self._lock:
+            return list(self._pairs.get(_pair(team_a, team_b), ()))
+
+    def needs_sync(self, team_a, team_b, now=None):
+        """True if the pair has too few meetings indexed and wasn't filled from the API recently."""
+        pair = _pair(team_a, team_b)
+        now = time.time() if now is None else now
+        with self._lock:
+            if len(self._pairs.get(pair, ())) >= H2H_MIN_MATCHES:
+                return False
+            return now - self._synced.get(pair, 0) >= H2H_SYNC_TTL
+
+    def mark_synced(self, team_a, team_b, now=None):
+        with self._lock:
+            self._synced[_pair(team_a, team_b)] = time.time() if now is None else now
+
+    def stats(self):
+        """Returns indexed pairs and fixtures."""
+        with self._lock:
+            return {"pairs": len(self._pairs), "fixtures": len(self._seen)}
+
+def shrink_lambdas(lambda_casa, lambda_fora, meetings, home_id, reversed_lambdas=None, now=None):
+    """Pulls the model lambdas towards the goals of past meetings (Gamma-Poisson shrinkage of a rate multiplier).
+
+    Each team's goals in meeting i are treated as Poisson(m * e_i), with e_i the model's expectation for that
+    venue (reversed_lambdas for meetings with swapped home/away; the current lambdas if not given) and a
+    Gamma(H2H_PRIOR_WEIGHT, H2H_PRIOR_WEIGHT) prior on m. The posterior mean multiplier is
+    (k + sum w*goals) / (k + sum w*e), with w a time-decay weight, so a few meetings barely move the lambdas.
+    Returns (lambda_casa, lambda_fora, number of meetings used).
+    """
+    if not meetings:
+        return lambda_casa, lambda_fora, 0
+    now = time.time() if now is None else now
+    rev_casa, rev_fora = reversed_lambdas or (lambda_fora, lambda_casa)
+    xi = math.log(2) / (H2H_HALF_LIFE_DAYS * 86400) if H2H_HALF_LIFE_DAYS > 0 else 0.0
+    goals_home = goals_away = expected_home = expected_away = 0.0
+    for timestamp, _, meeting_home, home_goals, away_goals in meetings:
+        weight = math.exp(-xi * max(0.0, now - timestamp)) if timestamp else 1.0
+        if meeting_home == home_id:
+            goals_home += weight * home_goals
+            goals_away += weight * away_goals
+            expected_home += weight * lambda_casa
+            expected_away += weight * lambda_fora
+        else: # Today's home team played away: its goals are the away side's, expected under the reversed fixture
+            goals_home += weight * away_goals
+            goals_away += weight * home_goals
+            expected_home += weight * rev_fora
+            expected_away += weight * rev_casa
+    k = H2H_PRIOR_WEIGHT
+    return (lambda_casa * (k + goals_home) / (k + expected_home),
+            lambda_fora * (k + goals_away) / (k + expected_away),
+            len(meetings))
+
+# --- Shared Instance ---
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_index():
+    """Returns the process-wide H2H index, seeded from the local history store on first use."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = H2HIndex()
+                if history_store.HISTORY_STORE_ENABLED:
+                    try:
+                        store = history_store.get_store()
+                        for league_id, season in store.partitions():
+                            index.update(store.finished_matches(league_id, season))
+                    except Exception as e:
+                        logging.warning(f"Falha ao carregar H2H do histórico local: {e}")
+                logging.info(f"Índice H2H carregado: {index.stats()}")
+                _index = index
+    return _index
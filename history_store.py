@@ -0,0 +1,393 @@
+# Persistent columnar store of fixtures, results, team season stats and odds snapshots (NumPy memmaps)
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+import odds
+
+# --- Configuration ---
+HISTORY_STORE_ENABLED = os.getenv("HISTORY_STORE_ENABLED", "1") not in ("0", "false", "False")
+HISTORY_STORE_PATH = os.getenv("HISTORY_STORE_PATH", "history")
+HISTORY_STORE_FLUSH_ROWS = int(os.getenv("HISTORY_STORE_FLUSH_ROWS", "2000")) # Buffered rows before writing to disk
+
+# Setup basic logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# One array per column, each in its own file; -1 marks a missing integer value, NaN a missing float
+FIXTURE_COLUMNS = {
+    "fixture_id": "i8", "timestamp": "i8", "home_id": "i4", "away_id": "i4",
+    "home_goals": "i2", "away_goals": "i2", "ht_home_goals": "i2", "ht_away_goals": "i2",
+    "corners_home": "i2", "corners_away": "i2",
+}
+ODDS_COLUMNS = {
+    "fixture_id": "i8", "captured_at": "i8", "bookmaker": "i4", "market": "u1", "value": "i4", "price": "f8",
+}
+TEAM_STATS_COLUMNS = {
+    "team_id": "i4", "captured_at": "i8",
+    "goals_for_home": "f4", "goals_for_away": "f4", "goals_against_home": "f4", "goals_against_away": "f4",
+    "corners_home": "f4", "corners_away": "f4",
+}
+TABLES = {
+    table: {column: np.dtype(dtype) for column, dtype in columns.items()}
+    for table, columns in (("fixtures", FIXTURE_COLUMNS), ("odds", ODDS_COLUMNS), ("team_stats", TEAM_STATS_COLUMNS))
+}
+# Text columns are stored as integer codes into a vocabulary shared by the whole store (bookmaker, quoted value)
+TEXT_COLUMNS = {"odds": ("bookmaker", "value")}
+# Columns identifying a row; a newer row with the same key replaces the stored one (None = append-only)
+TABLE_KEYS = {"fixtures": "fixture_id", "odds": None, "team_stats": None}
+# Columns a newer row can't erase: when it has them missing (-1), the last known value of the key is kept
+TABLE_STICKY = {"fixtures": ("ht_home_goals", "ht_away_goals", "corners_home", "corners_away")}
+
+class Columns:
+    """Rows of one table as one array per column.
+
+    Indexing with a column name returns that column; with a mask, an index array or a slice it returns the
+    selected rows. Text columns hold integer codes, decoded with text().
+    """
+
+    def __init__(self, columns, vocabularies=None):
+        self.columns = columns # column -> array, all the same length
+        self.vocabularies = vocabularies or {} # text column -> [string per code]
+
+    @classmethod
+    def empty(cls, table, vocabularies=None):
+        return cls({column: np.empty(0, dtype) for column, dtype in TABLES[table].items()}, vocabularies)
+
+    @classmethod
+    def concat(cls, parts):
+        return cls({column: np.concatenate([part.columns[column] for part in parts]) for column in parts[0].columns},
+                   parts[0].vocabularies)
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __getitem__(self, item):
+        if isinstance(item, str):
+            return self.columns[item]
+        return Columns({column: values[item] for column, values in self.columns.items()}, self.vocabularies)
+
+    def text(self, column):
+        """Decoded strings of a text column (raw strings for rows not yet encoded by a store)."""
+        values = self.columns[column]
+        if values.dtype == object:
+            return values
+        return np.asarray(self.vocabularies[column], dtype=object)[values] if len(values) else np.empty(0, dtype=object)
+
+# --- Row Builders ---
+
+def _int_or_missing(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return -1
+
+def _float_or_nan(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def _rows(table, records):
+    """Builds Columns from row tuples in the table's column order (text columns stay raw strings until stored)."""
+    text = TEXT_COLUMNS.get(table, ())
+    values = list(zip(*records)) if records else [()] * len(TABLES[table])
+    return Columns({
+        column: np.array(column_values, dtype=object if column in text else dtype)
+        for (column, dtype), column_values in zip(TABLES[table].items(), values)
+    })
+
+def fixture_rows(fixtures):
+    """Flat fixture dicts (as returned by api_handler.get_finished_fixtures / get_upcoming_fixtures) -> rows."""
+    return _rows("fixtures", [(
+        _int_or_missing(f.get("fixture_id")), _int_or_missing(f.get("timestamp")),
+        _int_or_missing(f.get("home_id")), _int_or_missing(f.get("away_id")),
+        _int_or_missing(f.get("home_goals")), _int_or_missing(f.get("away_goals")),
+        _int_or_missing(f.get("ht_home_goals")), _int_or_missing(f.get("ht_away_goals")),
+        _int_or_missing(f.get("corners_home")), _int_or_missing(f.get("corners_away")),
+    ) for f in fixtures])
+
+def odds_rows(fixture_id, raw_odds_data, captured_at=None):
+    """One row per (bookmaker, market, quoted value) of an odds response; only markets odds.py understands."""
+    captured_at = int(time.time() if captured_at is None else captured_at)
+    linhas = []
+    for casa, bets in odds._casas(raw_odds_data or {}):
+        for bet in bets:
+            if not isinstance(bet, dict):
+                continue
+            mercado = odds._classificar_aposta(bet.get("id"), bet.get("name", "").lower())
+            if mercado is None:
+                continue
+            for v in bet.get("values", []):
+                price = _float_or_nan(v.get("odd"))
+                if price == price:
+                    linhas.append((fixture_id, captured_at, casa, odds.MERCADOS.index(mercado), str(v.get("value", "")), price))
+    return _rows("odds", linhas)
+
+def team_stats_rows(team_id, stats_response, captured_at=None):
+    """Season averages of a teams/statistics response -> one row."""
+    stats = stats_response or {}
+    goals = stats.get("goals", {})
+    corners = stats.get("corners", {}).get("for", {}).get("average", {}) if isinstance(stats.get("corners"), dict) else {}
+    return _rows("team_stats", [(
+        team_id, int(time.time() if captured_at is None else captured_at),
+        _float_or_nan(goals.get("for", {}).get("average", {}).get("home")),
+        _float_or_nan(goals.get("for", {}).get("average", {}).get("away")),
+        _float_or_nan(goals.get("against", {}).get("average", {}).get("home")),
+        _float_or_nan(goals.get("against", {}).get("average", {}).get("away")),
+        _float_or_nan(corners.get("home")), _float_or_nan(corners.get("away")),
+    )])
+
+def odds_table(rows):
+    """Builds an odds.OddsTable from stored odds rows (e.g. one snapshot of a fixture)."""
+    return odds.tabela_de_registros(
+        [odds.MERCADOS[m] for m in rows["market"].tolist()], rows.text("value").tolist(), rows.text("bookmaker").tolist(), rows["price"].tolist())
+
+# --- Store ---
+
+class HistoryStore:
+    """Directory of column files partitioned by league/season: <path>/<league>/<season>/<table>/<column>.bin.
+
+    Each column is a raw little-endian array, memory-mapped on read, so scanning a partition costs no parsing and
+    only touches the columns and pages used. Writes are buffered and appended to the column files on flush();
+    nothing is rewritten. Bookmaker names and quoted values are stored as integer codes into vocabularies kept
+    in <path>/_vocab/<column>.txt (one string per line, the line number being the code).
+
+    Rows are never updated in place: a newer row with the same key is appended and wins on read (_dedupe). A
+    flush interrupted between columns leaves them uneven; reads ignore the extra tail and the next flush trims it.
+    """
+
+    def __init__(self, path=HISTORY_STORE_PATH, flush_rows=HISTORY_STORE_FLUSH_ROWS):
+        self.path = path
+        self.flush_rows = flush_rows
+        self._lock = threading.Lock()
+        self._pending = defaultdict(list) # (table, league_id, season) -> [Columns]
+        self._pending_rows = 0
+        self._vocabularies = None # text column -> [string per code], loaded on first use
+        self._codes = {} # text column -> {string: code}
+        self._saved_words = {} # text column -> strings already in the vocabulary file
+
+    def _dir(self, table, league_id, season):
+        return os.path.join(self.path, str(league_id), str(season), table)
+
+    def _vocab_file(self, column):
+        return os.path.join(self.path, "_vocab", f"{column}.txt")
+
+    def _load_vocabularies(self):
+        """Reads the vocabulary files once (caller holds the lock)."""
+        if self._vocabularies is not None:
+            return self._vocabularies
+        self._vocabularies = {}
+        for column in {c for columns in TEXT_COLUMNS.values() for c in columns}:
+            words = []
+            if os.path.exists(self._vocab_file(column)):
+                with open(self._vocab_file(column), "rb+") as f:
+                    data = f.read()
+                    complete = data.rfind(b"\n") + 1
+                    f.truncate(complete) # A torn last word was never referenced: codes are written after the words
+                words = data[:complete].decode("utf-8").split("\n")[:-1]
+            self._vocabularies[column] = words
+            self._codes[column] = {word: code for code, word in enumerate(words)}
+            self._saved_words[column] = len(words)
+        return self._vocabularies
+
+    def _encode(self, table, rows):
+        """Replaces the raw strings of the table's text columns by vocabulary codes (caller holds the lock)."""
+        text = [column for column in TEXT_COLUMNS.get(table, ()) if rows[column].dtype == object]
+        if not text:
+            return rows
+        vocabularies = self._load_vocabularies()
+        columns = dict(rows.columns)
+        for column in text:
+            codes, words = self._codes[column], vocabularies[column]
+            encoded = np.empty(len(rows), dtype=TABLES[table][column])
+            for i, word in enumerate(rows[column].tolist()):
+                word = word.replace("\r", " ").replace("\n", " ")
+                if word not in codes:
+                    codes[word] = len(words)
+                    words.append(word)
+                encoded[i] = codes[word]
+            columns[column] = encoded
+        return Columns(columns, vocabularies)
+
+    def append(self, table, league_id, season, rows):
+        """Buffers rows for a partition (flushing every flush_rows rows)."""
+        if rows is None or len(rows) == 0:
+            return
+        with self._lock:
+            self._pending[(table, league_id, season)].append(self._encode(table, rows))
+            self._pending_rows += len(rows)
+            should_flush = self._pending_rows >= self.flush_rows
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        """Appends the buffered rows to the column files (new vocabulary words first, so every code resolves)."""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(list)
+            self._pending_rows = 0
+            for column, words in (self._vocabularies or {}).items():
+                if len(words) > self._saved_words[column]:
+                    os.makedirs(os.path.dirname(self._vocab_file(column)), exist_ok=True)
+                    with open(self._vocab_file(column), "a", encoding="utf-8") as f:
+                        f.write("".join(word + "\n" for word in words[self._saved_words[column]:]))
+                    self._saved_words[column] = len(words)
+            for (table, league_id, season), chunks in pending.items():
+                directory = self._dir(table, league_id, season)
+                os.makedirs(directory, exist_ok=True)
+                rows = Columns.concat(chunks)
+                stored = _stored_rows(directory, table)
+                for column, dtype in TABLES[table].items():
+                    with open(os.path.join(directory, f"{column}.bin"), "ab") as f:
+                        f.truncate(stored * dtype.itemsize) # Drops the tail of an interrupted flush
+                        np.ascontiguousarray(rows[column], dtype=dtype.newbyteorder("<")).tofile(f)
+        if pending:
+            logging.info(f"Histórico local gravado: {sum(len(c) for chunks in pending.values() for c in chunks)} linhas em {len(pending)} partição(ões).")
+
+    def read(self, table, league_id, season):
+        """Memory-mapped rows of a partition (plus rows still buffered), latest per key. Empty if there are none."""
+        directory = self._dir(table, league_id, season)
+        with self._lock:
+            vocabularies = self._load_vocabularies()
+            chunks = list(self._pending.get((table, league_id, season), ()))
+        count = _stored_rows(directory, table)
+        columns = {}
+        for column, dtype in TABLES[table].items():
+            path = os.path.join(directory, f"{column}.bin")
+            columns[column] = np.memmap(path, dtype=dtype.newbyteorder("<"), mode="r", shape=(count,)) if count else np.empty(0, dtype)
+        rows = Columns(columns, vocabularies)
+        if chunks:
+            rows = Columns.concat([rows] + chunks)
+        return _dedupe(rows, TABLE_KEYS[table], TABLE_STICKY.get(table, ()))
+
+    def partitions(self):
+        """(league_id, season) of every partition on disk or buffered."""
+        found = set()
+        if os.path.isdir(self.path):
+            for league in os.listdir(self.path):
+                league_dir = os.path.join(self.path, league)
+                if league.lstrip("-").isdigit() and os.path.isdir(league_dir):
+                    found.update((int(league), int(season)) for season in os.listdir(league_dir) if season.isdigit())
+        with self._lock:
+            found.update((league_id, season) for _, league_id, season in self._pending)
+        return sorted(found)
+
+    # --- Queries ---
+
+    def finished_matches(self, league_id, season):
+        """Finished fixtures of a partition as league_model match dicts, oldest first."""
+        rows = self.read("fixtures", league_id, season)
+        rows = rows[(rows["home_goals"] >= 0) & (rows["away_goals"] >= 0)]
+        rows = rows[np.argsort(rows["timestamp"], kind="stable")]
+        return [
+            {"fixture_id": f, "timestamp": t, "home_id": h, "away_id": a, "home_goals": hg, "away_goals": ag}
+            for f, t, h, a, hg, ag in zip(rows["fixture_id"].tolist(), rows["timestamp"].tolist(), rows["home_id"].tolist(),
+                                          rows["away_id"].tolist(), rows["home_goals"].tolist(), rows["away_goals"].tolist())
+        ]
+
+    def odds_snapshot(self, league_id, season, fixture_id, before=None):
+        """Rows of the latest odds snapshot of a fixture captured at or before `before` (all times when None)."""
+        rows = self.read("odds", league_id, season)
+        rows = rows[rows["fixture_id"] == fixture_id]
+        if before is not None:
+            rows = rows[rows["captured_at"] <= before]
+        if len(rows) == 0:
+            return rows
+        return rows[rows["captured_at"] == rows["captured_at"].max()]
+
+    def closing_odds(self, league_id, season):
+        """Latest odds snapshot captured up to kickoff for every fixture of a partition: {fixture_id: rows}."""
+        rows = self.read("odds", league_id, season)
+        if len(rows) == 0:
+            return {}
+        # Snapshots taken after kickoff are live prices; fixtures without a known kickoff keep every snapshot
+        fixtures = self.read("fixtures", league_id, season)
+        kickoff = np.full(len(rows), np.iinfo(np.int64).max)
+        if len(fixtures):
+            order = np.argsort(fixtures["fixture_id"])
+            known_ids = fixtures["fixture_id"][order]
+            kickoffs = fixtures["timestamp"][order]
+            pos = np.minimum(np.searchsorted(known_ids, rows["fixture_id"]), len(known_ids) - 1)
+            known = (known_ids[pos] == rows["fixture_id"]) & (kickoffs[pos] > 0)
+            kickoff[known] = kickoffs[pos][known]
+        rows = rows[rows["captured_at"] <= kickoff]
+        if len(rows) == 0:
+            return {}
+
+        rows = rows[np.lexsort((rows["captured_at"], rows["fixture_id"]))]
+        starts = np.flatnonzero(np.r_[True, rows["fixture_id"][1:] != rows["fixture_id"][:-1]])
+        latest = np.repeat(np.maximum.reduceat(rows["captured_at"], starts), np.diff(np.r_[starts, len(rows)]))
+        rows = rows[rows["captured_at"] == latest]
+        bounds = np.r_[np.flatnonzero(np.r_[True, rows["fixture_id"][1:] != rows["fixture_id"][:-1]]), len(rows)]
+        return {int(rows["fixture_id"][s]): rows[s:e] for s, e in zip(bounds[:-1].tolist(), bounds[1:].tolist())}
+
+    def head_to_head(self, team_a, team_b, partitions=None):
+        """Finished meetings of two teams (either venue) across partitions, as fixture rows sorted by time."""
+        found = []
+        for league_id, season in (self.partitions() if partitions is None else partitions):
+            rows = self.read("fixtures", league_id, season)
+            mask = (((rows["home_id"] == team_a) & (rows["away_id"] == team_b)) | ((rows["home_id"] == team_b) & (rows["away_id"] == team_a)))
+            mask &= rows["home_goals"] >= 0
+            if mask.any():
+                found.append(rows[mask])
+        if not found:
+            return Columns.empty("fixtures")
+        matches = Columns.concat(found)
+        return matches[np.argsort(matches["timestamp"], kind="stable")]
+
+    def stats(self):
+        """Returns partition count and buffered rows."""
+        with self._lock:
+            pending = self._pending_rows
+        return {"partitions": len(self.partitions()), "pending_rows": pending}
+
+def _stored_rows(directory, table):
+    """Complete rows on disk: the shortest column, since an interrupted flush may have written only some."""
+    sizes = []
+    for column, dtype in TABLES[table].items():
+        path = os.path.join(directory, f"{column}.bin")
+        sizes.append(os.path.getsize(path) // dtype.itemsize if os.path.exists(path) else 0)
+    return min(sizes)
+
+def _dedupe(rows, key, sticky=()):
+    """Keeps the last row per key (rows are in insertion order), or every row when key is None.
+
+    Missing values (-1) of the `sticky` columns in a kept row are filled with the last known value of its key.
+    """
+    if key is None or len(rows) == 0:
+        return rows
+    _, last_from_end = np.unique(rows[key][::-1], return_index=True)
+    kept = rows[np.sort(len(rows) - 1 - last_from_end)]
+    for column in sticky:
+        missing = kept[column] < 0
+        known = rows[rows[column] >= 0]
+        if not missing.any() or len(known) == 0:
+            continue
+        known = _dedupe(known, key)
+        known = known[np.argsort(known[key])]
+        pos = np.minimum(np.searchsorted(known[key], kept[key][missing]), len(known) - 1)
+        found = known[key][pos] == kept[key][missing]
+        filled = kept[column][missing]
+        filled[found] = known[column][pos][found]
+        kept[column][missing] = filled
+    return kept
+
+# --- Shared Instance ---
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """Returns the process-wide history store (buffered rows are flushed at exit)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = HistoryStore()
+                atexit.register(_store.flush)
+    return _store
@@ -0,0 +1,286 @@
+# League-wide team strength model (Dixon-Coles) fitted once per league/season
+
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+from scipy.optimize import minimize
+from scipy.special import gammaln
+
+# --- Configuration ---
+LEAGUE_MODEL_ENABLED = os.getenv("LEAGUE_MODEL_ENABLED", "1") not in ("0", "false", "False")
+LEAGUE_MODEL_MIN_MATCHES = int(os.getenv("LEAGUE_MODEL_MIN_MATCHES", "30")) # Finished matches needed to fit a league
+LEAGUE_MODEL_MIN_TEAM_MATCHES = int(os.getenv("LEAGUE_MODEL_MIN_TEAM_MATCHES", "6")) # Per team, to trust its parameters
+LEAGUE_MODEL_BLEND_MATCHES = float(os.getenv("LEAGUE_MODEL_BLEND_MATCHES", "10")) # Team matches at which model and stats lambdas weigh the same (0 = model only)
+LEAGUE_MODEL_HALF_LIFE_DAYS = float(os.getenv("LEAGUE_MODEL_HALF_LIFE_DAYS", "180")) # Weight of a result halves every N days (0 = no decay)
+LEAGUE_MODEL_FULL_REFIT_EVERY = int(os.getenv("LEAGUE_MODEL_FULL_REFIT_EVERY", "10")) # Incremental updates before a full refit
+# Gaussian prior on attack/defence, worth this many matches of a team: shrinks teams with few results towards the league average
+LEAGUE_MODEL_PRIOR_MATCHES = float(os.getenv("LEAGUE_MODEL_PRIOR_MATCHES", "8"))
+RHO_BOUNDS = (-0.2, 0.2)
+MIN_LAMBDA = 0.1
+
+# Setup basic logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+class LeagueModel:
+    """Fitted parameters of one league/season: log-rates are mu + home + attack[team] + defence[opponent]."""
+
+    def __init__(self, league_id, season, team_ids, attack, defence, mu, home_adv, rho, matches_per_team, fixture_ids, partial_updates=0):
+        self.league_id = league_id
+        self.season = season
+        self.team_ids = list(team_ids)
+        self.index = {team_id: i for i, team_id in enumerate(self.team_ids)}
+        self.attack = np.asarray(attack, dtype=float)
+        self.defence = np.asarray(defence, dtype=float)
+        self.mu = float(mu)
+        self.home_adv = float(home_adv)
+        self.rho = float(rho)
+        self.matches_per_team = np.asarray(matches_per_team, dtype=int)
+        self.fixture_ids = frozenset(fixture_ids)
+        self.partial_updates = partial_updates # Incremental updates since the last full fit
+        self.fitted_at = time.time()
+
+    def lambdas(self, home_id, away_id):
+        """Expected goals (lambda_casa, lambda_fora) for a fixture, or None if a team isn't covered by the fit."""
+        h = self.index.get(home_id)
+        a = self.index.get(away_id)
+        if h is None or a is None:
+            return None
+        if min(self.matches_per_team[h], self.matches_per_team[a]) < LEAGUE_MODEL_MIN_TEAM_MATCHES:
+            return None
+        lambda_casa = np.exp(self.mu + self.home_adv + self.attack[h] + self.defence[a])
+        lambda_fora = np.exp(self.mu + self.attack[a] + self.defence[h])
+        return max(MIN_LAMBDA, float(lambda_casa)), max(MIN_LAMBDA, float(lambda_fora))
+
+    def team_matches(self, home_id, away_id):
+        """Matches played in the fit by the less covered of the two teams (0 if one isn't covered)."""
+        h = self.index.get(home_id)
+        a = self.index.get(away_id)
+        if h is None or a is None:
+            return 0
+        return int(min(self.matches_per_team[h], self.matches_per_team[a]))
+
+    def params_vector(self):
+        """Flattened parameters in the layout used by the optimiser."""
+        return np.concatenate([self.attack, self.defence, [self.mu, self.home_adv, self.rho]])
+
+def blend_lambdas(model_lambdas, stat_lambdas, team_matches):
+    """Geometric blend of model and stat-based lambdas, trusting the model more as its teams play more.
+
+    The model's weight is team_matches / (team_matches + LEAGUE_MODEL_BLEND_MATCHES).
+    """
+    if LEAGUE_MODEL_BLEND_MATCHES <= 0:
+        return model_lambdas
+    w = team_matches / (team_matches + LEAGUE_MODEL_BLEND_MATCHES)
+    return tuple(max(MIN_LAMBDA, float(m ** w * s ** (1 - w))) for m, s in zip(model_lambdas, stat_lambdas))
+
+def _matches_to_arrays(matches, team_ids=None):
+    """Turns finished-fixture dicts into team list, index arrays and goal arrays."""
+    if team_ids is None:
+        team_ids = sorted({m["home_id"] for m in matches} | {m["away_id"] for m in matches})
+    index = {team_id: i for i, team_id in enumerate(team_ids)}
+    home_idx = np.array([index[m["home_id"]] for m in matches], dtype=np.intp)
+    away_idx = np.array([index[m["away_id"]] for m in matches], dtype=np.intp)
+    home_goals = np.array([m["home_goals"] for m in matches], dtype=float)
+    away_goals = np.array([m["away_goals"] for m in matches], dtype=float)
+    return team_ids, home_idx, away_idx, home_goals, away_goals
+
+def _decay_weights(matches, now=None):
+    """Time-decay weight per match: exp(-xi * age_in_days), with xi set from LEAGUE_MODEL_HALF_LIFE_DAYS.
+
+    Ages are measured from `now`, by default the newest match of the set, so a past season weighs its own
+    results exactly as the current season does.
+    """
+    if LEAGUE_MODEL_HALF_LIFE_DAYS <= 0:
+        return np.ones(len(matches))
+    if now is None:
+        now = max((m["timestamp"] for m in matches if m.get("timestamp")), default=time.time())
+    ages = np.array([(now - m["timestamp"]) / 86400 if m.get("timestamp") else 0.0 for m in matches])
+    xi = np.log(2) / LEAGUE_MODEL_HALF_LIFE_DAYS
+    return np.exp(-xi * np.maximum(ages, 0.0))
+
+def _prior_precision(x, y, weights):
+    """Precision of the attack/defence prior: LEAGUE_MODEL_PRIOR_MATCHES times the information of one match.
+
+    A team's log-rate gains about the league's mean goals per team and match in precision from each match it
+    plays, so the prior weighs as much as LEAGUE_MODEL_PRIOR_MATCHES results and fades as the team plays more.
+    A match counts with its mean weight, so decayed weights shrink data and prior alike.
+    """
+    return LEAGUE_MODEL_PRIOR_MATCHES * max(0.1, (x.mean() + y.mean()) / 2) * weights.mean()
+
+def _neg_log_likelihood(params, n_teams, home_idx, away_idx, x, y, weights, precision):
+    """Weighted Dixon-Coles negative log-posterior (Gaussian prior on attack/defence) and its gradient, vectorized."""
+    attack = params[:n_teams]
+    defence = params[n_teams:2 * n_teams]
+    mu, home_adv, rho = params[2 * n_teams:]
+
+    lh = np.exp(mu + home_adv + attack[home_idx] + defence[away_idx])
+    la = np.exp(mu + attack[away_idx] + defence[home_idx])
+
+    # Low-score dependence correction tau(x, y) and its derivatives w.r.t. log-rates and rho
+    tau = np.ones_like(lh)
+    dtau_h = np.zeros_like(lh)
+    dtau_a = np.zeros_like(lh)
+    dtau_rho = np.zeros_like(lh)
+    m00 = (x == 0) & (y == 0)
+    m01 = (x == 0) & (y == 1)
+    m10 = (x == 1) & (y == 0)
+    m11 = (x == 1) & (y == 1)
+    tau[m00] = 1 - lh[m00] * la[m00] * rho
+    dtau_h[m00] = dtau_a[m00] = -lh[m00] * la[m00] * rho
+    dtau_rho[m00] = -lh[m00] * la[m00]
+    tau[m01] = 1 + lh[m01] * rho
+    dtau_h[m01] = lh[m01] * rho
+    dtau_rho[m01] = lh[m01]
+    tau[m10] = 1 + la[m10] * rho
+    dtau_a[m10] = la[m10] * rho
+    dtau_rho[m10] = la[m10]
+    tau[m11] = 1 - rho
+    dtau_rho[m11] = -1
+    tau = np.maximum(tau, 1e-10)
+
+    loglik = x * np.log(lh) - lh + y * np.log(la) - la - gammaln(x + 1) - gammaln(y + 1) + np.log(tau)
+    penalty = 0.5 * precision * (attack @ attack + defence @ defence) + attack.sum() ** 2 + defence.sum() ** 2
+    value = -(weights @ loglik) + penalty
+
+    g_h = weights * (x - lh + dtau_h / tau) # d loglik / d log(lh)
+    g_a = weights * (y - la + dtau_a / tau) # d loglik / d log(la)
+    grad_attack = np.bincount(home_idx, g_h, n_teams) + np.bincount(away_idx, g_a, n_teams)
+    grad_defence = np.bincount(away_idx, g_h, n_teams) + np.bincount(home_idx, g_a, n_teams)
+    grad = -np.concatenate([grad_attack, grad_defence, [g_h.sum() + g_a.sum(), g_h.sum(), weights @ (dtau_rho / tau)]])
+    grad[:n_teams] += precision * attack + 2 * attack.sum()
+    grad[n_teams:2 * n_teams] += precision * defence + 2 * defence.sum()
+    return value, grad
+
+def fit_league_model(league_id, season, matches, previous=None, weights=None):
+    """Fits attack/defence per team plus home advantage and rho by maximum likelihood (L-BFGS-B).
+
+    `matches` are finished-fixture dicts (fixture_id, home_id, away_id, home_goals, away_goals). When a previous
+    fit is given, the optimiser starts from its parameters, so refits after a new round converge in a few steps.
+    Returns a LeagueModel, or None if there aren't enough matches.
+    """
+    if len(matches) < LEAGUE_MODEL_MIN_MATCHES:
+        logging.info(f"Modelo da liga {league_id}/{season}: apenas {len(matches)} jogos finalizados. Ajuste ignorado.")
+        return None
+
+    team_ids, home_idx, away_idx, x, y = _matches_to_arrays(matches)
+    n_teams = len(team_ids)
+    weights = _decay_weights(matches) if weights is None else np.asarray(weights, dtype=float)
+
+    x0 = np.zeros(2 * n_teams + 3)
+    x0[2 * n_teams] = np.log(max(0.1, (x.mean() + y.mean()) / 2))
+    if previous is not None:
+        for i, team_id in enumerate(team_ids):
+            j = previous.index.get(team_id)
+            if j is not None:
+                x0[i] = previous.attack[j]
+                x0[n_teams + i] = previous.defence[j]
+        x0[2 * n_teams:] = [previous.mu, previous.home_adv, previous.rho]
+
+    bounds = [(None, None)] * (2 * n_teams + 2) + [RHO_BOUNDS]
+    started = time.perf_counter()
+    result = minimize(_neg_log_likelihood, x0, args=(n_teams, home_idx, away_idx, x, y, weights, _prior_precision(x, y, weights)),
+                      jac=True, method="L-BFGS-B", bounds=bounds)
+    if not result.success:
+        logging.warning(f"Modelo da liga {league_id}/{season}: otimização não convergiu ({result.message}).")
+
+    params = result.x
+    matches_per_team = np.bincount(home_idx, minlength=n_teams) + np.bincount(away_idx, minlength=n_teams)
+    model = LeagueModel(
+        league_id, season, team_ids,
+        attack=params[:n_teams], defence=params[n_teams:2 * n_teams],
+        mu=params[2 * n_teams], home_adv=params[2 * n_teams + 1], rho=params[2 * n_teams + 2],
+        matches_per_team=matches_per_team, fixture_ids=[m["fixture_id"] for m in matches],
+    )
+    logging.info(
+        f"Modelo da liga {league_id}/{season} ajustado: {len(matches)} jogos, {n_teams} times, "
+        f"{result.nit} iterações em {(time.perf_counter() - started) * 1000:.0f}ms "
+        f"(vantagem casa={np.exp(model.home_adv):.2f}, rho={model.rho:.3f})."
+    )
+    return model
+
+def update_league_model(previous, matches, weights=None):
+    """Updates a fitted model with newly finished matches, re-optimising only the teams that played them.
+
+    Attack/defence of the affected teams are optimised (warm-started, time-decayed weights) over the matches
+    they played, with every other parameter held at its previous value. Falls back to a full warm-started fit
+    when a new team appears, results were removed, or after LEAGUE_MODEL_FULL_REFIT_EVERY incremental updates.
+    """
+    new_matches = [m for m in matches if m["fixture_id"] not in previous.fixture_ids]
+    fixture_ids = {m["fixture_id"] for m in matches}
+    if not new_matches and fixture_ids == previous.fixture_ids:
+        return previous
+
+    affected = {m["home_id"] for m in new_matches} | {m["away_id"] for m in new_matches}
+    if (not affected or not affected.issubset(previous.index) or not previous.fixture_ids.issubset(fixture_ids)
+            or previous.partial_updates >= LEAGUE_MODEL_FULL_REFIT_EVERY):
+        return fit_league_model(previous.league_id, previous.season, matches, previous=previous, weights=weights)
+
+    weights = _decay_weights(matches) if weights is None else np.asarray(weights, dtype=float)
+    involved = np.array([m["home_id"] in affected or m["away_id"] in affected for m in matches])
+    subset = [m for m, keep in zip(matches, involved) if keep]
+    _, home_idx, away_idx, x, y = _matches_to_arrays(subset, previous.team_ids)
+    _, all_home, all_away, all_x, all_y = _matches_to_arrays(matches, previous.team_ids)
+    precision = _prior_precision(all_x, all_y, weights)
+    n_teams = len(previous.team_ids)
+    team_idx = np.array(sorted(previous.index[t] for t in affected), dtype=np.intp)
+    free = np.concatenate([team_idx, n_teams + team_idx])
+    base = previous.params_vector()
+
+    def _objective(z):
+        params = base.copy()
+        params[free] = z
+        value, grad = _neg_log_likelihood(params, n_teams, home_idx, away_idx, x, y, weights[involved], precision)
+        return value, grad[free]
+
+    started = time.perf_counter()
+    result = minimize(_objective, base[free], jac=True, method="L-BFGS-B")
+    params = base.copy()
+    params[free] = result.x
+
+    model = LeagueModel(
+        previous.league_id, previous.season, previous.team_ids,
+        attack=params[:n_teams], defence=params[n_teams:2 * n_teams],
+        mu=previous.mu, home_adv=previous.home_adv, rho=previous.rho,
+        matches_per_team=np.bincount(all_home, minlength=n_teams) + np.bincount(all_away, minlength=n_teams),
+        fixture_ids=fixture_ids, partial_updates=previous.partial_updates + 1,
+    )
+    logging.info(
+        f"Modelo da liga {previous.league_id}/{previous.season} atualizado: {len(new_matches)} novos jogos, "
+        f"{len(affected)} times, {result.nit} iterações em {(time.perf_counter() - started) * 1000:.0f}ms."
+    )
+    return model
+
+class LeagueModelStore:
+    """Keeps the latest fitted model per (league_id, season) and refits only when new results appear."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models = {}
+
+    def get(self, league_id, season):
+        with self._lock:
+            return self._models.get((league_id, season))
+
+    def update(self, league_id, season, matches):
+        """Returns the model for these matches, updating it incrementally only if new results came in."""
+        current = self.get(league_id, season)
+        if current is None:
+            model = fit_league_model(league_id, season, matches)
+        else:
+            model = update_league_model(current, matches)
+        if model is not None and model is not current:
+            with self._lock:
+                self._models[(league_id, season)] = model
+        return model or current
+
+    def stats(self):
+        """Returns the fitted leagues and their sizes."""
+        with self._lock:
+            return {f"{l}/{s}": {"teams": len(m.team_ids), "matches": len(m.fixture_ids)} for (l, s), m in self._models.items()}
+
+# --- Shared Instance ---
+
+LEAGUE_MODELS = LeagueModelStore()
@@ -1,15 +1,29 @@
 # Entry point for the Telegram Bot
 
+import asyncio
+import contextvars
+import functools
+import hashlib
+import heapq
+import json
 import logging
 import os
 import re
+import threading
+from collections import OrderedDict
+from datetime import time as dt_time
+from concurrent.futures import ThreadPoolExecutor
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 import html # For escaping HTML characters if needed, though using parse_mode=HTML is simpler
 
 # Import necessary functions from other modules
-from api_handler import get_processed_fixture_data
-from analysis import analisar_jogo_completo
+from api_handler import get_processed_fixture_data, refresh_league_models, start_name_index_refresher
+from analysis import analisar_jogo_completo, analisar_lote
+from name_index import normalize_name
+from prefetch import PREFETCH_ENABLED, PREFETCH_INTERVAL_MINUTES, PREFETCH_LEAGUES, league_seasons, run_prefetch
+from singleflight import AsyncSingleFlight
+import metrics
 
 # Setup basic logging
 logging.basicConfig(
@@ -20,17 +34,26 @@ logger = logging.getLogger(__name__)
 # --- Configuration ---
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "7664698447:AAFx4uxHitMeegCrWuvIiP6Fzb7wrOWBfZM")
 DEFAULT_SEASON = 2023 # Use a season likely available in free tier
+MAX_CONCURRENT_ANALYSES = int(os.getenv("MAX_CONCURRENT_ANALYSES", "4")) # Analyses running at once
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "64")) # Telegram updates handled at once
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "512")) # Pre-rendered reports kept in memory (0 disables)
+LEAGUE_MODEL_REFRESH_HOUR = int(os.getenv("LEAGUE_MODEL_REFRESH_HOUR", "4")) # UTC hour of the nightly league model update
+
+# "Time Casa x Time Fora, Liga [, Season=AAAA] [, Country=NomePais]"
+_MESSAGE_RE = re.compile(r"^\s*([^,]+?)\s+x\s+([^,]+?)\s*,\s*([^,]+?)\s*(?:,\s*Season=(\d{4}))?\s*(?:,\s*Country=([^,]+))?\s*$", re.IGNORECASE)
+
+# Blocking API/analysis work runs here so the event loop keeps answering other chats
+_analysis_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_ANALYSES, thread_name_prefix="analysis")
+# Coalesces identical analysis requests that arrive while one is already running
+_inflight_analyses = AsyncSingleFlight()
+# Background prefetch gets its own thread so it never occupies a slot meant for user analyses
+_prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
 
 # --- Helper Functions ---
 
-def format_report(previsoes, melhor_aposta, home_team, away_team):
-    """Formats the analysis results into a user-friendly string for Telegram using HTML."""
-    # Escape team names to prevent accidental HTML injection
-    home_team_html = html.escape(home_team)
-    away_team_html = html.escape(away_team)
-    
-    report = f"📊 <b>Análise para {home_team_html} x {away_team_html}</b> 📊\n\n"
-    report += "<b>Probabilidades Estimadas:</b>\n"
+def _format_report_body(previsoes, melhor_aposta):
+    """Renders everything below the title of the report (independent of how the user typed the team names)."""
+    parts = ["<b>Probabilidades Estimadas:</b>\n"]
 
     # 1X2
     if "1X2" in previsoes:
@@ -38,120 +61,297 @@ def format_report(previsoes, melhor_aposta, home_team, away_team):
         casa_prob = p.get("casa", "N/A")
         empate_prob = p.get("empate", "N/A")
         fora_prob = p.get("fora", "N/A")
-        report += f"  - <b>Resultado Final (1X2):</b> Casa: {casa_prob}%, Empate: {empate_prob}%, Fora: {fora_prob}%\n"
+        parts.append(f"  - <b>Resultado Final (1X2):</b> Casa: {casa_prob}%, Empate: {empate_prob}%, Fora: {fora_prob}%\n")
 
     # BTTS
     if "ambos_marcam" in previsoes:
         p = previsoes["ambos_marcam"]
         sim_prob = p.get("sim", "N/A")
         nao_prob = p.get("nao", "N/A")
-        report += f"  - <b>Ambas Marcam (BTTS):</b> Sim: {sim_prob}%, Não: {nao_prob}%\n"
+        parts.append(f"  - <b>Ambas Marcam (BTTS):</b> Sim: {sim_prob}%, Não: {nao_prob}%\n")
 
     # Over/Under Gols
     if "over_under_gols" in previsoes and previsoes["over_under_gols"]:
-        report += "  - <b>Over/Under Gols:</b>\n"
+        parts.append("  - <b>Over/Under Gols:</b>\n")
         for item in previsoes["over_under_gols"]:
             limite = item.get("limite", "?")
             over_prob = item.get("over", "N/A")
             under_prob = item.get("under", "N/A")
-            report += f"    - Limite {limite}: Over {over_prob}%, Under {under_prob}%\n"
+            parts.append(f"    - Limite {limite}: Over {over_prob}%, Under {under_prob}%\n")
 
     # Placar Exato
     if "placar_exato" in previsoes and previsoes["placar_exato"]:
-        report += "  - <b>Placares Mais Prováveis:</b>\n"
+        parts.append("  - <b>Placares Mais Prováveis:</b>\n")
         for item in previsoes["placar_exato"]:
             placar = item.get("placar", "?")
             prob = item.get("prob", "N/A")
-            report += f"    - {placar}: {prob}%\n"
+            parts.append(f"    - {placar}: {prob}%\n")
 
     # Handicap Asiático
     if "handicap_asiatico" in previsoes and previsoes["handicap_asiatico"]:
-        report += "  - <b>Handicap Asiático:</b>\n"
+        parts.append("  - <b>Handicap Asiático:</b>\n")
         for item in previsoes["handicap_asiatico"][:5]: # Limit lines
             linha = item.get("linha", "?")
             casa_prob = item.get("casa", "N/A")
             fora_prob = item.get("fora", "N/A")
             push_prob = item.get("push")
             push_txt = f", Push: {push_prob}%" if push_prob is not None else ""
-            report += f"    - Linha {linha}: Casa {casa_prob}%, Fora {fora_prob}%{push_txt}\n"
+            parts.append(f"    - Linha {linha}: Casa {casa_prob}%, Fora {fora_prob}%{push_txt}\n")
 
     # Over/Under Cantos
     if "over_under_cantos" in previsoes and previsoes["over_under_cantos"]:
-        report += "  - <b>Over/Under Cantos:</b>\n"
+        parts.append("  - <b>Over/Under Cantos:</b>\n")
         for item in previsoes["over_under_cantos"]:
             limite = item.get("limite", "?")
             over_prob = item.get("over", "N/A")
             under_prob = item.get("under", "N/A")
-            report += f"    - Limite {limite}: Over {over_prob}%, Under {under_prob}%\n"
+            parts.append(f"    - Limite {limite}: Over {over_prob}%, Under {under_prob}%\n")
 
     # HT/FT
     if "ht_ft" in previsoes and isinstance(previsoes["ht_ft"], dict) and "status" not in previsoes["ht_ft"]:
-        report += "  - <b>Intervalo/Final (HT/FT - Modelo Simples):</b>\n"
-        htft_sorted = sorted(previsoes["ht_ft"].items(), key=lambda item: item[1], reverse=True)
-        for key, prob in htft_sorted[:5]: # Show top 5
-            report += f"    - {key}: {prob}%\n"
+        parts.append("  - <b>Intervalo/Final (HT/FT - Modelo Simples):</b>\n")
+        htft_top = heapq.nlargest(5, previsoes["ht_ft"].items(), key=lambda item: item[1]) # Show top 5
+        for key, prob in htft_top:
+            parts.append(f"    - {key}: {prob}%\n")
     else:
-        report += "  - <b>Intervalo/Final (HT/FT):</b> Não disponível ou erro no cálculo.\n"
+        parts.append("  - <b>Intervalo/Final (HT/FT):</b> Não disponível ou erro no cálculo.\n")
 
     # Melhor Aposta - Escape potential HTML in the suggestion string
     melhor_aposta_html = html.escape(melhor_aposta)
-    report += f"\n💡 <b>Melhor Aposta Sugerida (Baseado em Valor):</b>\n  - {melhor_aposta_html}\n"
+    parts.append(f"\n💡 <b>Melhor Aposta Sugerida (Baseado em Valor):</b>\n  - {melhor_aposta_html}\n")
 
     # Nota final
-    report += "\n<i>Nota: Probabilidades são estimativas. Aposte com responsabilidade.</i>"
-    return report
+    parts.append("\n<i>Nota: Probabilidades são estimativas. Aposte com responsabilidade.</i>")
+    return "".join(parts)
+
+def _format_report_title(home_team, away_team):
+    """Renders the report title; team names are escaped to prevent accidental HTML injection."""
+    return f"📊 <b>Análise para {html.escape(home_team)} x {html.escape(away_team)}</b> 📊\n\n"
+
+def format_report(previsoes, melhor_aposta, home_team, away_team):
+    """Formats the analysis results into a user-friendly string for Telegram using HTML."""
+    return _format_report_title(home_team, away_team) + _format_report_body(previsoes, melhor_aposta)
+
+# --- Rendered Report Cache ---
+
+def _snapshot_hash(data):
+    """Short, stable hash of an API data snapshot (odds, statistics...)."""
+    payload = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=12).hexdigest()
+
+def _report_cache_key(api_data):
+    """Keys a rendered report on the fixture and the version of the data it was computed from.
+
+    The fixture is identified by its ID (or teams/league/season when no fixture was found). The data version
+    is the hash of the odds and statistics snapshots plus the model inputs derived from them, so a refresh of
+    odds or statistics produces a new key and the stale report is never served.
+    """
+    fixture_ref = api_data.get("fixture_id") or (
+        api_data.get("home_team_id"), api_data.get("away_team_id"), api_data.get("league_id"), api_data.get("season")
+    )
+    model_inputs = tuple(api_data.get(k) for k in ("lambda_casa", "lambda_fora", "avg_corners_home", "avg_corners_away"))
+    return (
+        fixture_ref,
+        _snapshot_hash(api_data.get("raw_odds")),
+        _snapshot_hash([api_data.get("raw_home_stats"), api_data.get("raw_away_stats")]),
+        model_inputs,
+    )
+
+class _ReportCache:
+    """Thread-safe bounded LRU of (previsoes, melhor_aposta, rendered report body)."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def set(self, key, entry):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+_report_cache = _ReportCache(REPORT_CACHE_SIZE)
+
+@metrics.register_collector
+def _report_cache_metrics():
+    """Exports the rendered-report cache and analysis coalescing counters on each scrape."""
+    return [
+        ("palpitepro_report_cache_total", "counter", "Consultas ao cache de relatórios renderizados.",
+         [({"result": "hit"}, _report_cache.hits), ({"result": "miss"}, _report_cache.misses)]),
+        ("palpitepro_analyses_shared_total", "counter", "Análises atendidas por uma análise idêntica em andamento.",
+         [({}, _inflight_analyses.stats()["shared"])]),
+    ]
+
+def _analyse_with_cache(api_data):
+    """Runs the analysis for fetched API data, reusing the cached analysis and report body when available.
+
+    Returns (previsoes, melhor_aposta, report_body).
+    """
+    cache_key = _report_cache_key(api_data)
+    cached = _report_cache.get(cache_key)
+    if cached is not None:
+        logger.info(f"Relatório servido do cache para fixture {cache_key[0]}")
+        return cached
+
+    previsoes, melhor_aposta = analisar_jogo_completo(api_data)
+    if not previsoes:
+        return previsoes, melhor_aposta, None
+    with metrics.stage("relatorio"):
+        report_body = _format_report_body(previsoes, melhor_aposta)
+    _report_cache.set(cache_key, (previsoes, melhor_aposta, report_body))
+    return previsoes, melhor_aposta, report_body
+
+def _fetch_and_analyse(home_team, away_team, league_name, season, country_name):
+    """Blocking part of an analysis request: API data fetch, then the analysis and report body.
+
+    Returns (api_data, previsoes, melhor_aposta, report_body). When the same fixture was already analysed
+    from the same odds/statistics snapshot, the cached analysis and pre-rendered body are returned.
+    """
+    api_data = get_processed_fixture_data(
+        home_team_name=home_team,
+        away_team_name=away_team,
+        league_name=league_name,
+        season=season,
+        country_name=country_name
+    )
+    if not api_data or not isinstance(api_data, dict) or api_data.get("error"):
+        return api_data, None, None, None
+
+    previsoes, melhor_aposta, report_body = _analyse_with_cache(api_data)
+    return api_data, previsoes, melhor_aposta, report_body
+
+def _warm_report_cache(lista_api_data):
+    """Analyses prefetched fixtures in one batch and stores the rendered bodies of those not cached yet."""
+    pending = [(key, api_data) for key, api_data in ((_report_cache_key(d), d) for d in lista_api_data) if key not in _report_cache]
+    if not pending:
+        return 0
+    resultados = analisar_lote([api_data for _, api_data in pending])
+    warmed = 0
+    for (cache_key, _), (previsoes, melhor_aposta) in zip(pending, resultados):
+        if previsoes:
+            _report_cache.set(cache_key, (previsoes, melhor_aposta, _format_report_body(previsoes, melhor_aposta)))
+            warmed += 1
+    return warmed
+
+def _prefetch_and_warm():
+    """Blocking body of the prefetch job: warms the API cache, then the report cache."""
+    warmed = _warm_report_cache(run_prefetch())
+    logger.info(f"Pré-busca: {warmed} relatórios pré-calculados.")
+
+async def _prefetch_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Job-queue callback that runs the prefetch off the event loop."""
+    try:
+        await asyncio.get_running_loop().run_in_executor(_prefetch_executor, _prefetch_and_warm)
+    except Exception as e:
+        logger.error(f"Erro na pré-busca de jogos: {e}", exc_info=True)
+
+def _parse_message(text):
+    """Extracts (home_team, away_team, league_name, season, country_name) from a message, or None if malformed."""
+    match = _MESSAGE_RE.match(text)
+    if not match:
+        return None
+    home_team, away_team, league_name, season_str, country_name = match.groups()
+    season = int(season_str) if season_str else DEFAULT_SEASON
+    return home_team.strip(), away_team.strip(), league_name.strip(), season, country_name.strip() if country_name else None
 
 async def process_analysis_request(text):
     """Parses message, gets data, runs analysis, and formats report."""
+    # Sampled requests get every stage below (including the ones in worker threads) timed
+    with metrics.trace_request("analise"):
+        return await _process_analysis_request(text)
+
+async def _process_analysis_request(text):
+    """Body of process_analysis_request (runs inside its metrics trace)."""
     logger.info(f"Processando solicitação de análise: {text}")
-    match = re.match(r"^\s*([^,]+?)\s+x\s+([^,]+?)\s*,\s*([^,]+?)\s*(?:,\s*Season=(\d{4}))?\s*(?:,\s*Country=([^,]+))?\s*$", text, re.IGNORECASE)
-    
-    if not match:
+    with metrics.stage("parse"):
+        parsed = _parse_message(text)
+    if not parsed:
         logger.warning("Formato de mensagem inválido.")
+        metrics.REQUESTS_TOTAL.inc(result="formato_invalido")
         return "Formato inválido. Use: <code>Time Casa x Time Fora, Liga [, Season=AAAA] [, Country=NomePais]</code>"
-
-    home_team, away_team, league_name, season_str, country_name = match.groups()
-    home_team = home_team.strip()
-    away_team = away_team.strip()
-    league_name = league_name.strip()
-    season = int(season_str) if season_str else DEFAULT_SEASON
-    country_name = country_name.strip() if country_name else None
+    home_team, away_team, league_name, season, country_name = parsed
 
     logger.info(f"Dados extraídos: Casa=\"{home_team}\", Fora=\"{away_team}\", Liga=\"{league_name}\", Temporada={season}, País={country_name}")
 
     try:
-        api_data = get_processed_fixture_data(
-            home_team_name=home_team,
-            away_team_name=away_team,
-            league_name=league_name,
-            season=season,
-            country_name=country_name
+        loop = asyncio.get_running_loop()
+        # Identical requests already in flight (e.g. a popular derby) share one fetch + analysis
+        request_key = (normalize_name(home_team), normalize_name(away_team), normalize_name(league_name), season, normalize_name(country_name))
+        (api_data, previsoes, melhor_aposta, report_body), shared = await _inflight_analyses.do(
+            request_key,
+            lambda: loop.run_in_executor(
+                _analysis_executor,
+                contextvars.copy_context().run,
+                functools.partial(_fetch_and_analyse, home_team, away_team, league_name, season, country_name)
+            )
         )
+        if shared:
+            logger.info(f"Análise compartilhada com solicitação idêntica em andamento: {request_key}")
         
         if not api_data or not isinstance(api_data, dict):
             logger.error("Falha ao obter dados do api_handler ou formato inválido.")
+            metrics.REQUESTS_TOTAL.inc(result="erro_api")
             return "Desculpe, não consegui obter os dados necessários da API."
             
         if api_data.get("error"): 
             error_msg = api_data.get("error_message", "Erro desconhecido na busca de dados API.")
             logger.error(f"Erro da API impedindo análise: {error_msg}")
+            metrics.REQUESTS_TOTAL.inc(result="erro_api")
             # Escape error message for HTML safety
             return f"Desculpe, ocorreu um erro ao buscar dados da API: {html.escape(error_msg)}"
 
-        previsoes, melhor_aposta = analisar_jogo_completo(api_data)
-        
-        if not previsoes and "Erro" in melhor_aposta:
-             logger.error(f"Falha na análise do jogo: {melhor_aposta}")
+        if not previsoes:
+             # No predictions means no report body, whatever the analysis said (error or not)
+             motivo = melhor_aposta or "nenhuma previsão gerada"
+             logger.error(f"Falha na análise do jogo: {motivo}")
+             metrics.REQUESTS_TOTAL.inc(result="erro_analise")
              # Escape error message for HTML safety
-             return f"Desculpe, ocorreu um erro durante a análise: {html.escape(melhor_aposta)}"
+             return f"Desculpe, ocorreu um erro durante a análise: {html.escape(str(motivo))}"
 
-        report = format_report(previsoes, melhor_aposta, home_team, away_team)
+        report = _format_report_title(home_team, away_team) + report_body
+        metrics.REQUESTS_TOTAL.inc(result="compartilhada" if shared else "ok")
         return report
         
     except Exception as e:
         logger.error(f"Erro inesperado ao processar a solicitação ", text, ": ", e, exc_info=True)
+        metrics.REQUESTS_TOTAL.inc(result="erro_inesperado")
         return "Ocorreu um erro inesperado ao processar sua solicitação. Por favor, tente novamente mais tarde."
 
+def _refresh_league_models():
+    """Updates the followed leagues' models for the default season and, with prefetch on, for the prefetched seasons."""
+    refresh_league_models(PREFETCH_LEAGUES, DEFAULT_SEASON)
+    if PREFETCH_ENABLED:
+        for league_id, season in league_seasons():
+            if season != DEFAULT_SEASON:
+                refresh_league_models([league_id], season)
+
+async def _league_model_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Nightly job-queue callback that updates the league strength models with the latest results."""
+    try:
+        await asyncio.get_running_loop().run_in_executor(_prefetch_executor, _refresh_league_models)
+    except Exception as e:
+        logger.error(f"Erro ao atualizar modelos de liga: {e}", exc_info=True)
+
 # --- Telegram Bot Handlers ---
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -226,13 +426,31 @@ def main() -> None:
         # return # Uncomment this line to prevent running with the example token
 
     logger.info("Iniciando BetInsight Bot...")
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    # Concurrent updates let /start, /help and other analyses proceed while slow API calls are in flight
+    application = Application.builder().token(TELEGRAM_BOT_TOKEN).concurrent_updates(MAX_CONCURRENT_UPDATES).build()
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     application.add_error_handler(error_handler)
 
+    # Per-stage timings, cache hits, API errors and quota are exposed for Prometheus
+    metrics.start_metrics_server()
+
+    # Team/league names are resolved from a local index filled (and refreshed) in the background
+    start_name_index_refresher()
+
+    # Upcoming fixtures of the followed leagues are fetched and analysed ahead of user requests
+    # and league strength models are updated nightly with the latest finished fixtures
+    if application.job_queue is None:
+        logger.warning("JobQueue indisponível (instale python-telegram-bot[job-queue]). Pré-busca e atualização noturna desativadas.")
+    else:
+        if PREFETCH_ENABLED:
+            application.job_queue.run_repeating(_prefetch_job, interval=PREFETCH_INTERVAL_MINUTES * 60, first=60, name="prefetch")
+        # Requests only look league models up, so they are also fitted once right after startup
+        application.job_queue.run_once(_league_model_job, when=30, name="league-models-startup")
+        application.job_queue.run_daily(_league_model_job, time=dt_time(hour=LEAGUE_MODEL_REFRESH_HOUR), name="league-models")
+
     logger.info("Bot iniciado e escutando por mensagens...")
     application.run_polling()
 
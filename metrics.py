@@ -0,0 +1,202 @@
+# Per-stage timing, counters and a Prometheus-compatible metrics endpoint
+
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Configuration ---
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108")) # 0 disables the HTTP endpoint
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_SAMPLE_RATE = float(os.getenv("METRICS_SAMPLE_RATE", "1.0")) # Share of requests whose stages are timed
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Setup basic logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+class Counter:
+    """Monotonic counter with labels."""
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple((name, labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value:g}")
+        return lines
+
+class Histogram:
+    """Cumulative-bucket histogram with labels (Prometheus semantics)."""
+
+    def __init__(self, name, help_text, label_names=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {} # label key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple((name, labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_format_labels(key + (('le', f'{bound:g}'),))} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]:.6f}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+# --- Metrics ---
+
+STAGE_SECONDS = Histogram("palpitepro_stage_seconds", "Duração de cada etapa da análise (amostrada).", ["stage"])
+REQUESTS_TOTAL = Counter("palpitepro_requests_total", "Solicitações de análise por resultado.", ["result"])
+API_ERRORS_TOTAL = Counter("palpitepro_api_errors_total", "Erros da API-Football por status HTTP ou tipo de falha.", ["status"])
+
+# Gauges/counters owned by other modules are read at scrape time, so the hot path pays nothing for them
+_collectors = []
+
+def register_collector(func):
+    """Registers func() -> [(name, type, help, [(labels_dict, value), ...]), ...], evaluated on each scrape."""
+    _collectors.append(func)
+    return func
+
+def render():
+    """Returns every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in (STAGE_SECONDS, REQUESTS_TOTAL, API_ERRORS_TOTAL):
+        lines.extend(metric.render())
+    for collector in list(_collectors):
+        try:
+            families = collector()
+        except Exception as e:
+            logging.warning(f"Coletor de métricas falhou: {e}")
+            continue
+        for name, metric_type, help_text, samples in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(sorted(labels.items()))} {value:g}")
+    return "\n".join(lines) + "\n"
+
+# --- Request Tracing ---
+
+class _Trace:
+    """Stage durations of one sampled request (stages may run in several threads)."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.stages = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] += seconds
+
+_current_trace = contextvars.ContextVar("metrics_trace", default=None)
+
+@contextlib.contextmanager
+def trace_request(name):
+    """Marks a request; with probability METRICS_SAMPLE_RATE its stages are timed and logged as one JSON line."""
+    if METRICS_SAMPLE_RATE <= 0 or random.random() >= METRICS_SAMPLE_RATE:
+        yield None
+        return
+    trace = _Trace(name)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        total = time.perf_counter() - trace.started
+        STAGE_SECONDS.observe(total, stage="total")
+        stages_ms = {stage: round(seconds * 1000, 2) for stage, seconds in sorted(trace.stages.items())}
+        logging.info(f"Tempos por etapa ({name}): " + json.dumps({"total_ms": round(total * 1000, 2), "etapas": stages_ms}, ensure_ascii=False))
+
+@contextlib.contextmanager
+def stage(name):
+    """Times a block as `name` when the current request is sampled (no-op otherwise)."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        trace.add(name, elapsed)
+        STAGE_SECONDS.observe(elapsed, stage=name)
+
+def timed(name, func, *args, **kwargs):
+    """Calls func inside stage(name)."""
+    with stage(name):
+        return func(*args, **kwargs)
+
+# --- HTTP Endpoint ---
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # Scrapes every few seconds would flood the bot log
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    """Serves /metrics from a daemon thread. Returns the server, or None if disabled or the port is taken."""
+    if port <= 0:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logging.error(f"Não foi possível iniciar o endpoint de métricas em {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logging.info(f"Métricas disponíveis em http://{host}:{port}/metrics")
+    return server
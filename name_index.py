@@ -0,0 +1,190 @@
+# In-memory name-resolution index for teams and leagues (replaces live search calls)
+
+import bisect
+import logging
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+
+# Setup basic logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Configuration ---
+FUZZY_MIN_SIMILARITY = 0.55 # Dice coefficient over trigrams required for a fuzzy match
+
+# Common nicknames/short forms users type, mapped to the name API-Football uses (both already normalized).
+# A value may also be (name, country) when the alias implies the country of an otherwise ambiguous name.
+TEAM_ALIASES = {
+    "man city": "manchester city",
+    "man utd": "manchester united",
+    "man united": "manchester united",
+    "spurs": "tottenham",
+    "barca": "barcelona",
+    "atletico": "atletico madrid",
+    "inter de milao": "inter",
+    "milan": "ac milan",
+    "psg": "paris saint germain",
+    "bayern": "bayern munich",
+    "bayern de munique": "bayern munich",
+    "fla": "flamengo",
+    "mengao": "flamengo",
+    "verdao": "palmeiras",
+    "timao": "corinthians",
+    "tricolor paulista": "sao paulo",
+    "galo": "atletico mg",
+    "atletico mineiro": "atletico mg",
+    "vasco": "vasco da gama",
+}
+
+LEAGUE_ALIASES = {
+    "brasileirao": ("serie a", "brazil"),
+    "brasileirao serie a": ("serie a", "brazil"),
+    "brasileirao serie b": ("serie b", "brazil"),
+    "epl": "premier league",
+    "premier": "premier league",
+    "laliga": "la liga",
+    "champions": "uefa champions league",
+    "champions league": "uefa champions league",
+    "libertadores": "copa libertadores",
+    "bundesliga alema": "bundesliga",
+}
+
+def normalize_name(name):
+    """Accent-folds, lowercases and strips punctuation so 'São Paulo' and 'Sao Paulo' map to the same key."""
+    if not name:
+        return ""
+    folded = unicodedata.normalize("NFKD", str(name))
+    folded = "".join(ch for ch in folded if not unicodedata.combining(ch))
+    folded = re.sub(r"[^0-9a-zA-Z]+", " ", folded.lower())
+    return " ".join(folded.split())
+
+def _trigrams(key):
+    """Returns the set of character trigrams of a normalized key (padded so short names still match)."""
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _marker_tokens(key):
+    """Numbers and single letters that tell otherwise similar names apart (Serie A/B)."""
+    return {token for token in key.split() if token.isdigit() or len(token) == 1}
+
+class NameIndex:
+    """Maps normalized names and aliases to API IDs, scoped by country and season, with fuzzy fallback."""
+
+    def __init__(self, kind, aliases=None):
+        self.kind = kind
+        self.aliases = dict(aliases or {})
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._entries = {} # id -> {"id", "name", "country", "seasons"}
+        self._by_key = defaultdict(list) # normalized name -> [id, ...]
+        self._sorted_keys = []
+        self._trigram_postings = defaultdict(set) # trigram -> {normalized name, ...}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _add_locked(self, entity_id, name, country=None, season=None):
+        entry = self._entries.get(entity_id)
+        if entry is None:
+            entry = {"id": entity_id, "name": name, "country": normalize_name(country) or None, "seasons": set()}
+            self._entries[entity_id] = entry
+        if season is not None:
+            entry["seasons"].add(int(season))
+
+        key = normalize_name(name)
+        if not key:
+            return
+        ids = self._by_key[key]
+        if entity_id not in ids:
+            if not ids:
+                bisect.insort(self._sorted_keys, key)
+                for trigram in _trigrams(key):
+                    self._trigram_postings[trigram].add(key)
+            ids.append(entity_id)
+
+    def add(self, entity_id, name, country=None, season=None):
+        """Adds (or extends the seasons of) a single entry."""
+        if entity_id is None or not name:
+            return
+        with self._lock:
+            self._add_locked(entity_id, name, country, season)
+
+    def replace_all(self, records):
+        """Rebuilds the index from (id, name, country, season) records in one go (used by bulk refresh)."""
+        with self._lock:
+            self._reset()
+            for entity_id, name, country, season in records:
+                if entity_id is not None and name:
+                    self._add_locked(entity_id, name, country, season)
+        logging.info(f"Índice de {self.kind} reconstruído com {len(self._entries)} entradas.")
+
+    def _pick(self, ids, country, season):
+        """Chooses the best ID among candidates for the same key, preferring entries inside the requested scope."""
+        country_key = normalize_name(country) or None
+        candidates = [self._entries[i] for i in ids]
+        if season is not None:
+            in_season = [e for e in candidates if not e["seasons"] or int(season) in e["seasons"]]
+            candidates = in_season or candidates
+        if country_key:
+            in_country = [e for e in candidates if e["country"] == country_key]
+            candidates = in_country or candidates
+        return candidates[0] if candidates else None
+
+    def lookup(self, name, country=None, season=None):
+        """Resolves a name to (id, canonical_name, match_type), or None. match_type is exact, prefix or fuzzy."""
+        key = normalize_name(name)
+        if not key:
+            return None
+        alias = self.aliases.get(key, key)
+        if isinstance(alias, tuple):
+            key, alias_country = alias
+            country = country or alias_country
+        else:
+            key = alias
+        with self._lock:
+            if not self._entries:
+                return None
+
+            # 1. O(1) exact hit on the normalized name
+            ids = self._by_key.get(key)
+            if ids:
+                entry = self._pick(ids, country, season)
+                return entry["id"], entry["name"], "exact"
+
+            # 2. Shortest name starting with the query ("Bayer" -> "bayer leverkusen")
+            pos = bisect.bisect_left(self._sorted_keys, key)
+            prefixed = []
+            while pos < len(self._sorted_keys) and self._sorted_keys[pos].startswith(key):
+                prefixed.append(self._sorted_keys[pos])
+                pos += 1
+            if prefixed:
+                best_key = min(prefixed, key=len)
+                entry = self._pick(self._by_key[best_key], country, season)
+                return entry["id"], entry["name"], "prefix"
+
+            # 3. Trigram similarity for misspellings
+            query_trigrams = _trigrams(key)
+            shared = Counter()
+            for trigram in query_trigrams:
+                for candidate in self._trigram_postings.get(trigram, ()):
+                    shared[candidate] += 1
+            query_markers = _marker_tokens(key)
+            best_key, best_score = None, 0.0
+            for candidate, count in shared.items():
+                if _marker_tokens(candidate) != query_markers:
+                    continue # "Serie B" must never fuzzy-match "Serie A"
+                score = 2.0 * count / (len(query_trigrams) + len(_trigrams(candidate)))
+                if score > best_score:
+                    best_key, best_score = candidate, score
+            if best_key is not None and best_score >= FUZZY_MIN_SIMILARITY:
+                entry = self._pick(self._by_key[best_key], country, season)
+                return entry["id"], entry["name"], "fuzzy"
+        return None
+
+# --- Shared Indexes ---
+
+TEAM_INDEX = NameIndex("times", aliases=TEAM_ALIASES)
+LEAGUE_INDEX = NameIndex("ligas", aliases=LEAGUE_ALIASES)
@@ -0,0 +1,198 @@
+# Multi-bookmaker odds table: per-selection price arrays, best price and no-vig consensus
+
+import functools
+import logging
+
+import numpy as np
+
+# Setup basic logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Market names (same keys the parsed-odds dict always used)
+MERCADO_1X2 = "1X2"
+MERCADO_OU_GOLS = "OverUnderGols"
+MERCADO_BTTS = "BTTS"
+MERCADO_AH = "AH"
+MERCADO_OU_CANTOS = "OverUnderCantos"
+MERCADOS = (MERCADO_1X2, MERCADO_OU_GOLS, MERCADO_BTTS, MERCADO_AH, MERCADO_OU_CANTOS)
+
+@functools.lru_cache(maxsize=1024)
+def _classificar_aposta(bet_id, bet_name):
+    """Maps an API-Football bet (id, lowercased name) to one of MERCADOS, or None if unsupported."""
+    if bet_id == 1 or "match winner" in bet_name or "resultado final" in bet_name:
+        return MERCADO_1X2
+    if bet_id == 5 or "over/under" in bet_name and "corners" not in bet_name: # Avoid matching corners OU
+        return MERCADO_OU_GOLS
+    if bet_id == 8 or "both teams score" in bet_name or "ambas marcam" in bet_name:
+        return MERCADO_BTTS
+    if bet_id == 4 or "asian handicap" in bet_name:
+        return MERCADO_AH
+    if "corners over/under" in bet_name or "total corners" in bet_name:
+        return MERCADO_OU_CANTOS
+    return None
+
+@functools.lru_cache(maxsize=4096)
+def _selecao(mercado, value):
+    """Returns (selection key, group key) for one quoted value; selections of a group are mutually exclusive."""
+    if mercado == MERCADO_1X2:
+        key = {"Home": "casa", "Draw": "empate", "Away": "fora"}.get(value)
+        return (key, "1X2") if key else (None, None)
+    if mercado == MERCADO_BTTS:
+        key = {"Yes": "Sim", "No": "Nao"}.get(value)
+        return (key, "BTTS") if key else (None, None)
+    if mercado in (MERCADO_OU_GOLS, MERCADO_OU_CANTOS):
+        for side in ("Over", "Under"):
+            if value.startswith(side + " "):
+                limit = float(value[len(side) + 1:])
+                return f"{side}{limit}", f"{limit}"
+        return None, None
+    if mercado == MERCADO_AH:
+        parts = value.split(" ")
+        if len(parts) == 2:
+            team = parts[0].lower()
+            line = float(parts[1]) + 0.0 # + 0.0 turns "-0" into 0.0, so "Away -0" formats as "+0.0"
+            home_line = (line if team == "home" else -line) + 0.0 # "Home -0.5" is paired with "Away +0.5"
+            return f"{line:+.1f}_{team}", f"{home_line:+.1f}"
+    return None, None
+
+def _casas(raw_odds_data):
+    """Yields (bookmaker_name, bets) for both the API shape ({"bookmakers": [...]}) and a single-book {"bets": [...]}."""
+    if "bookmakers" in raw_odds_data:
+        for bookmaker in raw_odds_data.get("bookmakers") or []:
+            if isinstance(bookmaker, dict):
+                yield bookmaker.get("name") or str(bookmaker.get("id")), bookmaker.get("bets") or []
+    elif "bets" in raw_odds_data:
+        bookmaker = raw_odds_data.get("bookmaker") or {}
+        yield bookmaker.get("name") or "?", raw_odds_data.get("bets") or []
+
+class OddsTable:
+    """Prices of every (market, selection) across every bookmaker as one (S, B) array (NaN = not quoted).
+
+    Selections are stored grouped (e.g. Over/Under 2.5, AH -0.5/+0.5), which lets the best price, the book
+    offering it and the no-vig consensus probability be computed for all selections in a few array operations.
+    """
+
+    def __init__(self, selecoes, grupos, casas, precos):
+        self.selecoes = selecoes # [(market, key), ...]
+        self.indice = {selecao: i for i, selecao in enumerate(selecoes)}
+        self.grupos = grupos # group id per selection (contiguous)
+        self.casas = casas # bookmaker names
+        self.precos = precos # (S, B) float array
+        self._calcular()
+
+    def _calcular(self):
+        n_sel = len(self.selecoes)
+        if n_sel == 0 or not self.casas:
+            self.melhor_preco = np.full(n_sel, np.nan)
+            self.melhor_casa = np.zeros(n_sel, dtype=int)
+            self.prob_consenso = np.full(n_sel, np.nan)
+            return
+
+        cotado = ~np.isnan(self.precos)
+        precos_validos = np.where(cotado, self.precos, -np.inf)
+        self.melhor_casa = precos_validos.argmax(axis=1)
+        self.melhor_preco = np.where(cotado.any(axis=1), precos_validos.max(axis=1), np.nan)
+
+        # No-vig: within each group, a book's implied probabilities are divided by its overround. Only books
+        # quoting every selection of the group count towards the consensus (the mean across those books).
+        with np.errstate(divide="ignore", invalid="ignore"):
+            implicita = np.where(cotado & (self.precos > 1.0), 1.0 / self.precos, 0.0)
+        inicios = np.flatnonzero(np.r_[True, self.grupos[1:] != self.grupos[:-1]])
+        tamanhos = np.diff(np.r_[inicios, n_sel])
+        soma_grupo = np.add.reduceat(implicita, inicios, axis=0)
+        cotacoes_grupo = np.add.reduceat((implicita > 0).astype(int), inicios, axis=0)
+        completo = (cotacoes_grupo == tamanhos[:, None]) & (tamanhos[:, None] > 1)
+        soma_por_sel = np.repeat(soma_grupo, tamanhos, axis=0)
+        completo_por_sel = np.repeat(completo, tamanhos, axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            justa = np.where(completo_por_sel, implicita / soma_por_sel, np.nan)
+            n_casas = completo_por_sel.sum(axis=1)
+            self.prob_consenso = np.where(n_casas > 0, np.nansum(justa, axis=1) / np.maximum(n_casas, 1), np.nan)
+
+    def __len__(self):
+        return len(self.selecoes)
+
+    def melhores_odds(self):
+        """Best price per selection in the parsed-odds dict shape: {market: {key: odd}} (every market present)."""
+        parsed = {mercado: {} for mercado in MERCADOS}
+        for (mercado, key), preco in zip(self.selecoes, self.melhor_preco.tolist()):
+            if preco == preco: # not NaN
+                parsed[mercado][key] = preco
+        return parsed
+
+    def alinhar(self, chaves):
+        """Row index of each (market, key) in chaves (-1 = not quoted), for gathering the per-selection arrays."""
+        return np.fromiter((self.indice.get(chave, -1) for chave in chaves), dtype=np.intp, count=len(chaves))
+
+    def detalhes(self, mercado, key):
+        """(best price, bookmaker, no-vig consensus probability in %) for a selection, or None if not quoted."""
+        i = self.indice.get((mercado, key))
+        if i is None or np.isnan(self.melhor_preco[i]):
+            return None
+        consenso = self.prob_consenso[i]
+        return float(self.melhor_preco[i]), self.casas[self.melhor_casa[i]], None if np.isnan(consenso) else round(float(consenso) * 100, 1)
+
+def tabela_de_dict(parsed):
+    """Wraps an already-parsed {market: {key: odd}} dict as a single-book OddsTable (no consensus available)."""
+    lista = [(mercado, key) for mercado, selecoes in (parsed or {}).items() for key in selecoes]
+    precos = np.array([[float(parsed[mercado][key])] for mercado, key in lista], dtype=float).reshape(len(lista), 1)
+    return OddsTable(lista, np.arange(len(lista), dtype=int), ["?"], precos)
+
+def parse_odds_table(raw_odds_data):
+    """Builds an OddsTable from the odds response of a fixture (all bookmakers)."""
+    if not raw_odds_data or not isinstance(raw_odds_data, dict):
+        logging.warning("Dados brutos de odds ausentes ou inválidos para parse.")
+        return OddsTable([], np.array([], dtype=int), [], np.empty((0, 0)))
+
+    casas = []
+    cotacoes = [] # (market, key, group, book index, price)
+    for casa, bets in _casas(raw_odds_data):
+        b = len(casas)
+        casas.append(casa)
+        for bet in bets:
+            if not isinstance(bet, dict):
+                continue
+            bet_name = bet.get("name", "").lower()
+            mercado = _classificar_aposta(bet.get("id"), bet_name)
+            if mercado is None:
+                continue
+            for v in bet.get("values", []):
+                try:
+                    key, grupo = _selecao(mercado, v.get("value", ""))
+                    if key is not None:
+                        cotacoes.append((mercado, key, grupo, b, float(v["odd"])))
+                except (ValueError, TypeError, AttributeError, KeyError) as e:
+                    logging.warning(f"Erro ao parsear odd para {bet_name} - value: {v}: {e}")
+    return _montar_tabela(cotacoes, casas)
+
+def tabela_de_registros(mercados, valores, casas, precos):
+    """Builds an OddsTable from flat quotes (market, API value string, bookmaker name, price), e.g. stored rows."""
+    nomes = {}
+    cotacoes = []
+    for mercado, value, casa, preco in zip(mercados, valores, casas, precos):
+        try:
+            key, grupo = _selecao(mercado, value)
+        except ValueError:
+            continue
+        if key is not None:
+            cotacoes.append((mercado, key, grupo, nomes.setdefault(casa, len(nomes)), float(preco)))
+    return _montar_tabela(cotacoes, list(nomes))
+
+def _montar_tabela(cotacoes, casas):
+    """Quotes (market, key, group, book index, price) -> OddsTable."""
+    # Group-major ordering keeps the selections of each group contiguous for the reductions above
+    ordem_grupos = {}
+    selecoes = {}
+    for mercado, key, grupo, _, _ in cotacoes:
+        g = ordem_grupos.setdefault((mercado, grupo), len(ordem_grupos))
+        selecoes.setdefault((mercado, key), g)
+    lista = sorted(selecoes, key=lambda sel: selecoes[sel])
+    indice = {sel: i for i, sel in enumerate(lista)}
+    precos = np.full((len(lista), len(casas)), np.nan)
+    if cotacoes:
+        linhas = np.fromiter((indice[(m, k)] for m, k, _, _, _ in cotacoes), dtype=np.intp, count=len(cotacoes))
+        colunas = np.fromiter((c[3] for c in cotacoes), dtype=np.intp, count=len(cotacoes))
+        valores = np.fromiter((c[4] for c in cotacoes), dtype=float, count=len(cotacoes))
+        np.fmax.at(precos, (linhas, colunas), valores) # A book quoting a selection twice keeps its best price
+    grupos = np.array([selecoes[sel] for sel in lista], dtype=int)
+    return OddsTable(lista, grupos, casas, precos)
@@ -0,0 +1,86 @@
+# Background prefetch of upcoming fixtures so user requests hit warm data
+
+import logging
+import os
+import threading
+
+import rate_limiter
+from api_handler import NAME_INDEX_LEAGUES, current_season, get_upcoming_fixtures, get_processed_fixture_data_by_ids
+
+# --- Configuration ---
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "0") not in ("0", "false", "False") # Off by default: it spends quota ahead of users
+PREFETCH_LEAGUES = [int(x) for x in os.getenv("PREFETCH_LEAGUES", ",".join(str(l) for l in NAME_INDEX_LEAGUES)).split(",") if x.strip()]
+PREFETCH_SEASON = int(os.getenv("PREFETCH_SEASON", "0")) or None # None = each league's current season, from the league index
+PREFETCH_HOURS_AHEAD = float(os.getenv("PREFETCH_HOURS_AHEAD", "48"))
+PREFETCH_INTERVAL_MINUTES = float(os.getenv("PREFETCH_INTERVAL_MINUTES", "60"))
+PREFETCH_MAX_FIXTURES = int(os.getenv("PREFETCH_MAX_FIXTURES", "20")) # Fixtures warmed per run (soonest first)
+PREFETCH_QUOTA_RESERVE = float(os.getenv("PREFETCH_QUOTA_RESERVE", "0.5")) # Share of the daily quota kept for users
+CALLS_PER_FIXTURE = 5 # fixtures + odds + 2x statistics + H2H (when the pair isn't indexed), when nothing is cached yet
+
+# Setup basic logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Runs never overlap: a slow run (throttled by the limiter) makes the next one skip instead of piling up
+_run_lock = threading.Lock()
+
+def _quota_allows(calls):
+    """True if `calls` more requests still leave PREFETCH_QUOTA_RESERVE of the daily quota for users."""
+    stats = rate_limiter.get_limiter().stats()
+    reserve = int(stats["day_limit"] * PREFETCH_QUOTA_RESERVE)
+    return stats["day_remaining"] - calls >= reserve
+
+def league_seasons(league_ids=None, season=None):
+    """(league_id, season) pairs to prefetch: the given season, else each league's current one (unknown leagues are skipped)."""
+    league_ids = PREFETCH_LEAGUES if league_ids is None else league_ids
+    season = PREFETCH_SEASON if season is None else season
+    pairs = []
+    for league_id in league_ids:
+        league_season = season or current_season(league_id)
+        if league_season is None:
+            logging.info(f"Temporada atual da liga {league_id} ainda desconhecida. Liga ignorada na pré-busca.")
+            continue
+        pairs.append((league_id, league_season))
+    return pairs
+
+def run_prefetch(league_ids=None, season=None, hours_ahead=None, max_fixtures=None):
+    """Fetches statistics, odds and H2H of the upcoming fixtures of the followed leagues.
+
+    Every call goes through api_handler (so it fills the shared API cache under the same keys the user path
+    uses) at low queue priority, and the run stops before eating into the quota reserved for users.
+    Returns the processed data of each warmed fixture (same shape as get_processed_fixture_data).
+    """
+    hours_ahead = PREFETCH_HOURS_AHEAD if hours_ahead is None else hours_ahead
+    max_fixtures = PREFETCH_MAX_FIXTURES if max_fixtures is None else max_fixtures
+
+    if not _run_lock.acquire(blocking=False):
+        logging.info("Pré-busca anterior ainda em andamento. Execução ignorada.")
+        return []
+    try:
+        with rate_limiter.prioridade(rate_limiter.PRIORIDADE_BAIXA):
+            upcoming = []
+            for league_id, league_season in league_seasons(league_ids, season):
+                if not _quota_allows(1):
+                    logging.info("Pré-busca interrompida: cota diária reservada para usuários.")
+                    break
+                fixtures, error_msg = get_upcoming_fixtures(league_id, league_season, hours_ahead)
+                if not error_msg:
+                    upcoming.extend(fixtures)
+
+            upcoming.sort(key=lambda f: f["timestamp"] or 0)
+            warmed = []
+            for fixture in upcoming[:max_fixtures]:
+                if not _quota_allows(CALLS_PER_FIXTURE):
+                    logging.info("Pré-busca interrompida: cota diária reservada para usuários.")
+                    break
+                api_data = get_processed_fixture_data_by_ids(
+                    fixture["home_id"], fixture["away_id"], fixture["league_id"], fixture["season"],
+                    home_team_name=fixture["home_name"], away_team_name=fixture["away_name"], league_name=fixture["league_name"]
+                )
+                if api_data.get("error"):
+                    logging.warning(f"Pré-busca falhou para fixture {fixture['fixture_id']}: {api_data.get('error_message')}")
+                    continue
+                warmed.append(api_data)
+        logging.info(f"Pré-busca concluída: {len(warmed)} de {len(upcoming)} jogos nas próximas {hours_ahead:.0f}h.")
+        return warmed
+    finally:
+        _run_lock.release()
@@ -0,0 +1,214 @@
+# Client-side rate limiting and quota budgeting for API-Football
+
+import contextlib
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+
+# --- Configuration ---
+API_RATE_LIMIT_PER_MINUTE = int(os.getenv("API_RATE_LIMIT_PER_MINUTE", "10"))
+API_RATE_LIMIT_PER_DAY = int(os.getenv("API_RATE_LIMIT_PER_DAY", "100"))
+API_RATE_MAX_WAIT = float(os.getenv("API_RATE_MAX_WAIT", "30")) # Seconds a caller may queue before giving up
+API_MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", "3")) # Retries after a 429
+API_BACKOFF_BASE = 1.0
+API_BACKOFF_MAX = 30.0
+
+# Queue priorities (lower goes first): cheap ID lookups jump ahead of quota-heavy data endpoints
+PRIORIDADE_ALTA = 0
+PRIORIDADE_NORMAL = 1
+PRIORIDADE_BAIXA = 2
+
+ENDPOINT_PRIORITIES = {
+    "teams": PRIORIDADE_ALTA,
+    "leagues": PRIORIDADE_ALTA,
+    "fixtures": PRIORIDADE_NORMAL,
+    "teams/statistics": PRIORIDADE_NORMAL,
+    "fixtures/headtohead": PRIORIDADE_NORMAL,
+    "odds": PRIORIDADE_NORMAL,
+}
+
+# Priority override for every call made in the current context (e.g. background prefetch runs at PRIORIDADE_BAIXA)
+_prioridade_contexto = contextvars.ContextVar("prioridade_api", default=None)
+
+# Setup basic logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+class TokenBucket:
+    """Classic token bucket: `capacity` tokens, refilled continuously over `period` seconds."""
+
+    def __init__(self, capacity, period):
+        self.capacity = float(capacity)
+        self.period = float(period)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.capacity / self.period)
+            self.updated = now
+
+    def wait_time(self, now):
+        """Seconds until one token is available (0 if one is available now)."""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) * self.period / self.capacity
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def resync(self, remaining, limit=None, now=None):
+        """Aligns the bucket with the server's view of the quota."""
+        self._refill(now if now is not None else time.monotonic())
+        if limit is not None and limit > 0:
+            self.capacity = float(limit)
+        self.tokens = max(0.0, min(self.capacity, float(remaining)))
+
+    def drain(self, now=None):
+        """Empties the bucket (used after the server rejects a call for rate limiting)."""
+        self._refill(now if now is not None else time.monotonic())
+        self.tokens = min(self.tokens, 0.0)
+
+class RateLimiter:
+    """Enforces per-minute and per-day limits before calls go out, serving waiters by priority then arrival."""
+
+    def __init__(self, per_minute=API_RATE_LIMIT_PER_MINUTE, per_day=API_RATE_LIMIT_PER_DAY, max_wait=API_RATE_MAX_WAIT):
+        self.minute_bucket = TokenBucket(per_minute, 60)
+        self.day_bucket = TokenBucket(per_day, 24 * 3600)
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._queue = []
+        self._seq = itertools.count()
+        self.granted = 0
+        self.rejected = 0
+        self.throttled = 0
+        self.server_rate_limited = 0
+
+    def acquire(self, priority=PRIORIDADE_NORMAL, max_wait=None):
+        """Blocks until both buckets have a token and it's this caller's turn; False if max_wait runs out."""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        deadline = time.monotonic() + max_wait
+        ticket = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            waited = False
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._queue[0] == ticket:
+                        wait = max(self.minute_bucket.wait_time(now), self.day_bucket.wait_time(now))
+                        if wait <= 0:
+                            self.minute_bucket.take(now)
+                            self.day_bucket.take(now)
+                            self.granted += 1
+                            self.throttled += waited
+                            return True
+                    else:
+                        wait = None # Not our turn; wake up when the queue moves
+                    remaining = deadline - now
+                    if remaining <= 0 or (wait is not None and wait > remaining):
+                        self.rejected += 1
+                        espera = f"{wait:.1f}s" if wait is not None else "fila ocupada"
+                        logging.warning(f"Limitador: requisição descartada (espera necessária: {espera}, limite {max_wait:.0f}s).")
+                        return False
+                    waited = True
+                    self._cond.wait(timeout=min(wait, remaining) if wait is not None else remaining)
+            finally:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+
+    def sync_from_headers(self, headers):
+        """Resyncs the buckets with API-Football's x-ratelimit-* response headers."""
+        if not headers:
+            return
+
+        def _int_header(name):
+            try:
+                value = headers.get(name)
+                return int(value) if value is not None else None
+            except (TypeError, ValueError):
+                return None
+
+        day_limit = _int_header("x-ratelimit-requests-limit")
+        day_remaining = _int_header("x-ratelimit-requests-remaining")
+        minute_limit = _int_header("X-RateLimit-Limit")
+        minute_remaining = _int_header("X-RateLimit-Remaining")
+        with self._cond:
+            now = time.monotonic()
+            if day_remaining is not None:
+                self.day_bucket.resync(day_remaining, day_limit, now)
+            if minute_remaining is not None:
+                # Responses may arrive out of order, so never raise the per-minute budget from a header
+                self.minute_bucket.resync(min(minute_remaining, self.minute_bucket.tokens), minute_limit, now)
+            self._cond.notify_all()
+
+    def penalize(self):
+        """Called when the server answers 429: stops further calls until the per-minute bucket refills."""
+        with self._cond:
+            self.server_rate_limited += 1
+            self.minute_bucket.drain()
+
+    def stats(self):
+        """Returns the local view of the remaining quota and queue counters."""
+        with self._cond:
+            now = time.monotonic()
+            self.minute_bucket._refill(now)
+            self.day_bucket._refill(now)
+            return {
+                "minute_remaining": int(self.minute_bucket.tokens),
+                "minute_limit": int(self.minute_bucket.capacity),
+                "day_remaining": int(self.day_bucket.tokens),
+                "day_limit": int(self.day_bucket.capacity),
+                "queued": len(self._queue),
+                "granted": self.granted,
+                "throttled": self.throttled,
+                "rejected": self.rejected,
+                "server_rate_limited": self.server_rate_limited,
+            }
+
+def backoff_delay(attempt, retry_after=None):
+    """Jittered exponential backoff for retry `attempt` (0-based), honouring a Retry-After header if present."""
+    try:
+        if retry_after is not None:
+            return min(API_BACKOFF_MAX, float(retry_after)) + random.uniform(0, API_BACKOFF_BASE)
+    except (TypeError, ValueError):
+        pass
+    return random.uniform(0.5, 1.5) * min(API_BACKOFF_MAX, API_BACKOFF_BASE * (2 ** attempt))
+
+def endpoint_priority(endpoint):
+    """Queue priority for an endpoint (cheap ID lookups first), unless overridden by `prioridade()`."""
+    override = _prioridade_contexto.get()
+    if override is not None:
+        return override
+    return ENDPOINT_PRIORITIES.get(endpoint, PRIORIDADE_NORMAL)
+
+@contextlib.contextmanager
+def prioridade(priority):
+    """Runs every API call made inside the block (in this context) with the given queue priority."""
+    token = _prioridade_contexto.set(priority)
+    try:
+        yield
+    finally:
+        _prioridade_contexto.reset(token)
+
+# --- Shared Instance ---
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_limiter():
+    """Returns the process-wide rate limiter."""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter()
+    return _limiter
@@ -0,0 +1,124 @@
+# Pluggable scoreline models: each backend turns N (lambda_casa, lambda_fora) pairs into an (N, G, G) tensor
+
+import logging
+import math
+import os
+
+import numpy as np
+from scipy.stats import poisson
+
+# --- Configuration ---
+SCORE_MODEL = os.getenv("SCORE_MODEL", "poisson") # Default backend: poisson, dixon_coles or bivariate_poisson
+SCORE_MODEL_LEAGUES = os.getenv("SCORE_MODEL_LEAGUES", "") # Per-league override, e.g. "39:dixon_coles,140:bivariate_poisson"
+DIXON_COLES_RHO = float(os.getenv("DIXON_COLES_RHO", "-0.05")) # Used when the fixture has no fitted league rho
+BIVARIATE_POISSON_COV = float(os.getenv("BIVARIATE_POISSON_COV", "0.1")) # Shared goal rate lambda3 (= covariance)
+PARAM_DECIMALS = 3 # Model parameters are rounded to this for the market memo key
+
+# Setup basic logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+MODELOS = {}
+
+def registrar_modelo(nome, parametro):
+    """Registers a score-matrix backend (decorator). `parametro(api_data)` reads its one parameter from a fixture."""
+    def decorator(matrizes):
+        MODELOS[nome] = (matrizes, parametro)
+        return matrizes
+    return decorator
+
+def _pmf(goals, lambdas):
+    return poisson.pmf(goals, np.asarray(lambdas, dtype=float)[:, None])
+
+@registrar_modelo("poisson", lambda api_data: 0.0)
+def _matrizes_poisson(lambdas_casa, lambdas_fora, parametros, max_goals):
+    """Independent home and away goals: the outer product of the two Poisson pmf vectors."""
+    goals = np.arange(max_goals + 1)
+    return _pmf(goals, lambdas_casa)[:, :, None] * _pmf(goals, lambdas_fora)[:, None, :]
+
+def _rho_do_jogo(api_data):
+    rho = api_data.get("rho")
+    return float(rho) if isinstance(rho, (int, float)) and math.isfinite(rho) else DIXON_COLES_RHO
+
+@registrar_modelo("dixon_coles", _rho_do_jogo)
+def _matrizes_dixon_coles(lambdas_casa, lambdas_fora, parametros, max_goals):
+    """Independent Poisson with the Dixon-Coles tau correction on 0-0, 0-1, 1-0 and 1-1 (same rho as league_model)."""
+    lambdas_casa = np.asarray(lambdas_casa, dtype=float)
+    lambdas_fora = np.asarray(lambdas_fora, dtype=float)
+    rho = np.asarray(parametros, dtype=float)
+    matrices = _matrizes_poisson(lambdas_casa, lambdas_fora, parametros, max_goals)
+    tau = np.ones((len(rho), 2, 2))
+    tau[:, 0, 0] = 1 - lambdas_casa * lambdas_fora * rho
+    tau[:, 0, 1] = 1 + lambdas_casa * rho
+    tau[:, 1, 0] = 1 + lambdas_fora * rho
+    tau[:, 1, 1] = 1 - rho
+    matrices[:, :2, :2] *= np.maximum(tau, 0.0) # Extreme rho/lambda combinations would go negative
+    return matrices
+
+@registrar_modelo("bivariate_poisson", lambda api_data: BIVARIATE_POISSON_COV)
+def _matrizes_bivariate_poisson(lambdas_casa, lambdas_fora, parametros, max_goals):
+    """Bivariate Poisson: home = X1 + X3, away = X2 + X3 with a shared X3 ~ Poisson(lambda3), so Cov = lambda3.
+
+    lambda3 is capped below both lambdas, and X1/X2 take the rest so the marginal means stay the given lambdas.
+    """
+    lambdas_casa = np.asarray(lambdas_casa, dtype=float)
+    lambdas_fora = np.asarray(lambdas_fora, dtype=float)
+    lambdas_comum = np.clip(np.asarray(parametros, dtype=float), 0.0, 0.9 * np.minimum(lambdas_casa, lambdas_fora))
+    goals = np.arange(max_goals + 1)
+    independentes = _matrizes_poisson(lambdas_casa - lambdas_comum, lambdas_fora - lambdas_comum, parametros, max_goals)
+    pmf_comum = _pmf(goals, lambdas_comum)
+    # P(x, y) = sum_k P(X1 = x - k) P(X2 = y - k) P(X3 = k): each shared goal shifts the matrix one cell diagonally
+    size = max_goals + 1
+    matrices = independentes * pmf_comum[:, 0, None, None]
+    for k in range(1, size):
+        matrices[:, k:, k:] += independentes[:, :size - k, :size - k] * pmf_comum[:, k, None, None]
+    return matrices
+
+# --- Model Selection ---
+
+def _parse_leagues(spec):
+    """Parses SCORE_MODEL_LEAGUES ("league_id:model,...") into {league_id: model}, skipping bad entries."""
+    leagues = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        try:
+            league_id, nome = item.split(":")
+            leagues[int(league_id)] = nome.strip()
+        except ValueError:
+            logging.warning(f"Entrada inválida em SCORE_MODEL_LEAGUES: '{item}'")
+    return leagues
+
+_modelos_por_liga = _parse_leagues(SCORE_MODEL_LEAGUES)
+
+def modelo_da_liga(league_id):
+    """Name of the score model configured for a league (SCORE_MODEL when it has no override)."""
+    return _modelos_por_liga.get(league_id, SCORE_MODEL)
+
+def modelo_do_jogo(api_data):
+    """(model name, parameter) for a fixture: an explicit "score_model" key, else its league's model."""
+    nome = api_data.get("score_model") or modelo_da_liga(api_data.get("league_id"))
+    if nome not in MODELOS:
+        logging.warning(f"Modelo de placar desconhecido '{nome}'. Usando poisson.")
+        nome = "poisson"
+    return nome, round(MODELOS[nome][1](api_data), PARAM_DECIMALS)
+
+def score_matrices(lambdas_casa, lambdas_fora, max_goals, modelos=None, parametros=None):
+    """Normalized (N, G, G) score tensor for N fixtures, each with its own model (all Poisson if not given).
+
+    Fixtures sharing a model are computed in one vectorized call. Also returns a boolean mask of fixtures
+    whose raw matrix had positive total probability (the others are left as NaN).
+    """
+    lambdas_casa = np.asarray(lambdas_casa, dtype=float)
+    lambdas_fora = np.asarray(lambdas_fora, dtype=float)
+    if modelos is None:
+        matrices = _matrizes_poisson(lambdas_casa, lambdas_fora, None, max_goals)
+    else:
+        modelos = np.asarray(modelos, dtype=object)
+        parametros = np.zeros(len(modelos)) if parametros is None else np.asarray(parametros, dtype=float)
+        matrices = np.empty((len(modelos), max_goals + 1, max_goals + 1))
+        for nome in dict.fromkeys(modelos.tolist()):
+            rows = modelos == nome
+            matrices[rows] = MODELOS[nome][0](lambdas_casa[rows], lambdas_fora[rows], parametros[rows], max_goals)
+    totals = matrices.sum(axis=(-2, -1))
+    valid = totals > 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        matrices = matrices / totals[:, None, None]
+    return matrices, valid
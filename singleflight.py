@@ -0,0 +1,95 @@
+# In-flight request coalescing ("single-flight") for duplicate work
+
+import asyncio
+import threading
+
+class _Call:
+    """One in-progress call that followers wait on."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+class SingleFlight:
+    """Thread-based single-flight: concurrent calls with the same key share one execution of the function.
+
+    The leader runs the function; followers block until it finishes and receive the same result object
+    (or exception), so results must be treated as read-only.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key, func, *args, **kwargs):
+        """Runs func(*args, **kwargs) once per key among concurrent callers. Returns (result, shared)."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                self.shared += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+        return call.result, False
+
+    def stats(self):
+        """Returns how many calls actually ran and how many were served from a shared in-flight call."""
+        with self._lock:
+            return {"executed": self.executed, "shared": self.shared, "in_flight": len(self._calls)}
+
+class AsyncSingleFlight:
+    """asyncio single-flight: concurrent awaits with the same key share one task.
+
+    The shared task is shielded, so one caller being cancelled doesn't cancel it for the others.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+        self.executed = 0
+        self.shared = 0
+
+    async def do(self, key, coro_factory):
+        """Awaits coro_factory() once per key among concurrent callers. Returns (result, shared)."""
+        task = self._tasks.get(key)
+        shared = task is not None
+        if shared:
+            self.shared += 1
+        else:
+            task = asyncio.ensure_future(coro_factory())
+            self._tasks[key] = task
+            self.executed += 1
+
+            def _forget(done_task, key=key):
+                if self._tasks.get(key) is done_task:
+                    del self._tasks[key]
+
+            task.add_done_callback(_forget)
+        return await asyncio.shield(task), shared
+
+    def stats(self):
+        """Returns how many tasks actually ran and how many awaits joined an in-flight task."""
+        return {"executed": self.executed, "shared": self.shared, "in_flight": len(self._tasks)}
@@ -0,0 +1,144 @@
+import logging
+import unittest
+
+import numpy as np
+
+import analysis
+
+def _fixtures(n=25, seed=3):
+    """api_data dicts with varied lambdas and corner averages, all with the same single-book odds."""
+    rng = np.random.default_rng(seed)
+    raw_odds = {"bookmaker": {"id": 8, "name": "Bet365"}, "bets": [
+        {"id": 1, "name": "Match Winner", "values": [{"value": "Home", "odd": "2.10"}, {"value": "Draw", "odd": "3.50"}, {"value": "Away", "odd": "3.20"}]},
+        {"id": 5, "name": "Over/Under", "values": [{"value": "Over 2.5", "odd": "1.80"}, {"value": "Under 2.5", "odd": "2.00"}]},
+        {"id": 8, "name": "Both Teams Score", "values": [{"value": "Yes", "odd": "1.70"}, {"value": "No", "odd": "2.10"}]},
+    ]}
+    return [{"lambda_casa": float(rng.uniform(0.2, 3.5)), "lambda_fora": float(rng.uniform(0.2, 3.0)),
+             "avg_corners_home": float(rng.uniform(3, 8)), "avg_corners_away": float(rng.uniform(2, 7)),
+             "raw_odds": raw_odds} for _ in range(n)]
+
+def _per_fixture(api_data):
+    """The per-fixture path: one legacy score matrix per fixture and each calcular_* function on its own."""
+    matrix = analysis._get_poisson_matrix(api_data["lambda_casa"], api_data["lambda_fora"])
+    previsoes = {
+        "1X2": analysis.calcular_1x2(matrix),
+        "handicap_asiatico": analysis.calcular_handicaps(matrix),
+        "over_under_gols": analysis.calcular_over_under(matrix),
+        "ambos_marcam": analysis.calcular_ambas_marcam(matrix),
+        "ht_ft": analysis.calcular_ht_ft(api_data),
+        "placar_exato": analysis.calcular_placar_exato(matrix),
+        "over_under_cantos": analysis.calcular_total_cantos(api_data),
+    }
+    return previsoes, analysis.determinar_melhor_aposta(previsoes, analysis.odds.parse_odds_table(api_data["raw_odds"]))
+
+class TestBatchParity(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        analysis._memo_mercados.clear()
+
+    def tearDown(self):
+        analysis._memo_mercados.clear()
+        logging.disable(logging.NOTSET)
+
+    def test_batch_matches_per_fixture_analysis(self):
+        fixtures = _fixtures()
+        esperados = [_per_fixture(api_data) for api_data in fixtures]
+        analysis._memo_mercados.clear()
+        lote = analysis.analisar_lote(fixtures)
+        self.assertEqual(len(lote), len(fixtures))
+        for (previsoes, melhor), (esperadas, melhor_esperada) in zip(lote, esperados):
+            self.assertEqual(set(previsoes), set(esperadas))
+            for mercado in esperadas:
+                self.assertEqual(previsoes[mercado], esperadas[mercado], mercado)
+            self.assertEqual(melhor, melhor_esperada)
+        # A second batch is served from the memo and must not change anything
+        self.assertEqual(analysis.analisar_lote(fixtures), lote)
+        self.assertEqual([analysis.analisar_jogo_completo(api_data) for api_data in fixtures], lote)
+
+    def test_batch_keeps_positions_of_invalid_entries(self):
+        fixtures = _fixtures(n=3)
+        lote = analysis.analisar_lote([fixtures[0], "invalido", {"error": True, "error_message": "x"}, fixtures[1]])
+        self.assertEqual(lote[1], ({}, "Erro nos dados de entrada"))
+        self.assertEqual(lote[2], ({}, "Erro API: x"))
+        self.assertEqual(lote[0], analysis.analisar_jogo_completo(fixtures[0]))
+        self.assertEqual(lote[3], analysis.analisar_jogo_completo(fixtures[1]))
+
+def _ht_ft_nested_loops(lambda_casa, lambda_fora, ht_factor=analysis.HT_FACTOR):
+    """The HT/FT model as it was before the convolution: every HT score against every 2nd-half score."""
+    ht_matrix = analysis._get_poisson_matrix(lambda_casa * ht_factor, lambda_fora * ht_factor, max_goals=analysis.HT_MAX_GOALS)
+    matrix_2h = analysis._get_poisson_matrix(max(0.01, lambda_casa * (1 - ht_factor)), max(0.01, lambda_fora * (1 - ht_factor)),
+                                             max_goals=analysis.SEGUNDO_TEMPO_MAX_GOALS)
+    resultado = lambda casa, fora: "1" if casa > fora else ("X" if casa == fora else "2")
+    results = dict.fromkeys(analysis.HT_FT_KEYS, 0.0)
+    for (i_ht, j_ht), prob_ht in ht_matrix.items():
+        for (i_2h, j_2h), prob_2h in matrix_2h.items():
+            results[f"{resultado(i_ht, j_ht)}/{resultado(i_ht + i_2h, j_ht + j_2h)}"] += prob_ht * prob_2h
+    total = sum(results.values())
+    return {key: prob / total for key, prob in results.items()}
+
+class TestHtFt(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_convolution_matches_nested_loops(self):
+        rng = np.random.default_rng(11)
+        lambdas_casa, lambdas_fora = rng.uniform(0.05, 4.0, 40), rng.uniform(0.05, 4.0, 40)
+        ht_ft, valid = analysis._calcular_ht_ft_arrays(lambdas_casa, lambdas_fora)
+        self.assertTrue(valid.all())
+        states = {"1": 0, "X": 1, "2": 2}
+        for n, (lambda_casa, lambda_fora) in enumerate(zip(lambdas_casa, lambdas_fora)):
+            esperado = _ht_ft_nested_loops(lambda_casa, lambda_fora)
+            for key, prob in esperado.items():
+                self.assertAlmostEqual(ht_ft[n, states[key[0]], states[key[2]]], prob, places=12, msg=key)
+
+    def test_formatted_output_matches_nested_loops(self):
+        for lambdas in [(1.4, 1.1), (0.3, 2.7), (3.2, 0.2), (0.01, 0.01)]:
+            calculado = analysis.calcular_ht_ft({}, lambdas=lambdas)
+            esperado = _ht_ft_nested_loops(*lambdas)
+            self.assertEqual(list(calculado), analysis.HT_FT_KEYS)
+            for key in analysis.HT_FT_KEYS:
+                self.assertAlmostEqual(calculado[key], esperado[key] * 100, delta=0.05 + 1e-9, msg=key)
+        # The batch gives each fixture the same result as calling it alone
+        self.assertEqual(analysis.calcular_ht_ft_lote([1.4, 0.3], [1.1, 2.7]),
+                         [analysis.calcular_ht_ft({}, lambdas=(1.4, 1.1)), analysis.calcular_ht_ft({}, lambdas=(0.3, 2.7))])
+
+class TestMarketMemo(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        analysis._memo_mercados.clear()
+
+    def tearDown(self):
+        analysis._memo_mercados.clear()
+        logging.disable(logging.NOTSET)
+
+    def test_default_step_is_exact(self):
+        self.assertEqual(analysis.LAMBDA_QUANT_STEP, 0)
+        self.assertEqual(max(analysis.verificar_precisao_memo(amostras=300).values()), 0.0)
+
+    def test_quantization_drift_is_bounded(self):
+        """Documented drift of a 0.01 step: at most 0.5 percentage points on any goals market."""
+        desvios = analysis.verificar_precisao_memo(quant_step=0.01, amostras=1000)
+        self.assertLessEqual(max(desvios.values()), 0.5)
+        self.assertLessEqual(max(analysis.verificar_precisao_memo(quant_step=0.001, amostras=1000).values()), 0.1)
+
+    def test_memo_hit_returns_same_markets(self):
+        lambdas_casa, lambdas_fora = [1.37, 0.92], [1.05, 2.41]
+        primeiro = analysis._obter_mercados_gols(lambdas_casa, lambdas_fora)
+        misses = analysis._memo_mercados.stats()["misses"]
+        segundo = analysis._obter_mercados_gols(lambdas_casa, lambdas_fora)
+        self.assertEqual(primeiro, segundo)
+        self.assertEqual(analysis._memo_mercados.stats()["misses"], misses)
+        # Entries handed out are copies: mutating one doesn't leak into the memo
+        segundo[0]["1X2"]["casa"] = -1
+        self.assertEqual(analysis._obter_mercados_gols(lambdas_casa, lambdas_fora)[0], primeiro[0])
+
+    def test_memo_key_includes_score_model(self):
+        poisson = analysis._obter_mercados_gols([1.2], [1.0])[0]
+        dixon_coles = analysis._obter_mercados_gols([1.2], [1.0], ["dixon_coles"], [-0.1])[0]
+        self.assertNotEqual(poisson["placar_exato"], dixon_coles["placar_exato"])
+
+if __name__ == '__main__':
+    unittest.main()
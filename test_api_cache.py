@@ -0,0 +1,98 @@
+import logging
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import api_cache
+
+class _Clock:
+    """Stands in for the time module so TTLs and access order don't depend on wall-clock time."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+class TestApiCache(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "cache.sqlite3")
+        self.clock = _Clock()
+        self.patch = mock.patch.object(api_cache, "time", self.clock)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.tmp.cleanup()
+        logging.disable(logging.NOTSET)
+
+    def _cache(self, **kwargs):
+        cache = api_cache.ApiCache(path=self.path, **kwargs)
+        self.addCleanup(cache._conn.close)
+        return cache
+
+    def test_entries_expire_after_endpoint_ttl(self):
+        cache = self._cache(ttls={"odds": 60, "teams": 3600})
+        cache.set("odds", {"fixture": 1}, {"odd": "2.10"})
+        cache.set("teams", {"search": "Arsenal"}, [{"id": 42}])
+        self.assertEqual(cache.get("odds", {"fixture": 1}), {"odd": "2.10"})
+
+        self.clock.now += 60
+        self.assertIsNone(cache.get("odds", {"fixture": 1}))
+        self.assertEqual(cache.get("teams", {"search": "Arsenal"}), [{"id": 42}])
+        self.assertEqual(cache.stats()["size"], 1) # The expired entry was dropped on read
+
+        self.clock.now += 3600
+        self.assertIsNone(cache.get("teams", {"search": "Arsenal"}))
+        self.assertEqual(cache.stats()["misses_by_endpoint"], {"odds": 1, "teams": 1})
+
+    def test_zero_ttl_is_not_stored(self):
+        cache = self._cache(ttls={"odds": 0})
+        cache.set("odds", {"fixture": 1}, {"odd": "2.10"})
+        self.assertIsNone(cache.get("odds", {"fixture": 1}))
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_params_order_and_types_share_a_key(self):
+        cache = self._cache()
+        cache.set("fixtures", {"league": 39, "season": 2023}, [1])
+        self.assertEqual(cache.get("fixtures", {"season": "2023", "league": "39"}), [1])
+
+    def test_full_cache_evicts_least_recently_used(self):
+        cache = self._cache(max_entries=10, ttls={"teams": 3600})
+        for i in range(10):
+            self.clock.now += 1
+            cache.set("teams", {"id": i}, i)
+        # Touch the oldest entries so they become the most recently used
+        for i in range(3):
+            self.clock.now += 1
+            self.assertEqual(cache.get("teams", {"id": i}), i)
+
+        self.clock.now += 1
+        cache.set("teams", {"id": 10}, 10)
+        # Over capacity: trimmed to 90% (9 entries), dropping the two least recently used (3 and 4)
+        kept = [i for i in range(11) if cache.get("teams", {"id": i}) is not None]
+        self.assertEqual(kept, [0, 1, 2, 5, 6, 7, 8, 9, 10])
+        self.assertEqual(cache.stats()["evictions"], 2)
+
+    def test_eviction_drops_expired_entries_first(self):
+        cache = self._cache(max_entries=4, ttls={"odds": 10, "teams": 3600})
+        cache.set("odds", {"fixture": 1}, 1)
+        cache.set("odds", {"fixture": 2}, 2)
+        cache.set("teams", {"id": 1}, 1)
+        cache.set("teams", {"id": 2}, 2)
+        self.clock.now += 10
+        cache.set("teams", {"id": 3}, 3)
+        self.assertEqual(cache.stats()["size"], 3)
+        self.assertEqual([cache.get("teams", {"id": i}) for i in (1, 2, 3)], [1, 2, 3])
+
+    def test_entries_survive_reopening(self):
+        self._cache().set("leagues", {"id": 39}, [{"name": "Premier League"}])
+        reopened = self._cache()
+        self.assertEqual(reopened.stats()["size"], 1)
+        self.assertEqual(reopened.get("leagues", {"id": 39}), [{"name": "Premier League"}])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import logging
+import threading
+import unittest
+from unittest import mock
+
+import api_cache
+import api_handler
+import rate_limiter
+
+def _lookup(*result):
+    """A lookup function that always returns (id, error_msg) = result."""
+    return lambda *args: result
+
+class TestFanOut(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_league_and_team_lookups_run_concurrently(self):
+        # Each lookup waits for the other two: run one after the other, the barrier would time out
+        barrier = threading.Barrier(3, timeout=5)
+
+        def _league(league_name, country_name, season):
+            barrier.wait()
+            return 39, None
+
+        def _team(team_name, country_name, season):
+            barrier.wait()
+            return {"Arsenal": 42, "Chelsea": 49}[team_name], None
+
+        # Patched with plain functions: the pool times each call under its function name
+        with mock.patch.object(api_handler, "find_league_id", _league), \
+             mock.patch.object(api_handler, "find_team_id", _team), \
+             mock.patch.object(api_handler, "_fetch_fixture_details", side_effect=lambda data: data):
+            data = api_handler.get_processed_fixture_data("Arsenal", "Chelsea", "Premier League", 2023, "England")
+        self.assertFalse(data["error"])
+        self.assertEqual((data["league_id"], data["home_team_id"], data["away_team_id"]), (39, 42, 49))
+
+    def test_errors_are_reported_in_lookup_order(self):
+        with mock.patch.object(api_handler, "find_league_id", _lookup(None, "liga inexistente")), \
+             mock.patch.object(api_handler, "find_team_id", _lookup(None, "time inexistente")), \
+             mock.patch.object(api_handler, "_fetch_fixture_details") as details:
+            data = api_handler.get_processed_fixture_data("Arsenal", "Chelsea", "Premier League", 2023)
+        self.assertTrue(data["error"])
+        self.assertEqual(data["error_message"], "Erro ao buscar Liga: liga inexistente")
+        details.assert_not_called()
+
+        with mock.patch.object(api_handler, "find_league_id", _lookup(39, None)), \
+             mock.patch.object(api_handler, "find_team_id", lambda name, *args: (42, None) if name == "Arsenal" else (None, "time inexistente")), \
+             mock.patch.object(api_handler, "_fetch_fixture_details") as details:
+            data = api_handler.get_processed_fixture_data("Arsenal", "Chelsea", "Premier League", 2023)
+        self.assertEqual(data["error_message"], "Erro ao buscar Time Fora (Chelsea): time inexistente")
+        details.assert_not_called()
+
+    def test_pool_calls_keep_the_callers_priority(self):
+        def get_priority():
+            return rate_limiter.endpoint_priority("teams")
+
+        with rate_limiter.prioridade(rate_limiter.PRIORIDADE_BAIXA):
+            self.assertEqual(api_handler._submit(get_priority).result(timeout=5), rate_limiter.PRIORIDADE_BAIXA)
+        self.assertEqual(api_handler._submit(get_priority).result(timeout=5), rate_limiter.PRIORIDADE_ALTA)
+
+class TestNameIndexRefresher(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_refresh_runs_at_low_priority(self):
+        priorities = {}
+        done = threading.Event()
+
+        def fake_request(endpoint, params=None):
+            priorities[endpoint] = rate_limiter.endpoint_priority(endpoint)
+            if endpoint == "teams":
+                done.set()
+            return []
+
+        with mock.patch.object(api_handler, "_make_api_request", side_effect=fake_request), \
+             mock.patch.object(api_handler, "NAME_INDEX_LEAGUES", [39]):
+            stop = api_handler.start_name_index_refresher()
+            self.assertTrue(done.wait(timeout=5))
+            stop.set()
+        self.assertEqual(priorities, {"leagues": rate_limiter.PRIORIDADE_BAIXA, "teams": rate_limiter.PRIORIDADE_BAIXA})
+
+class TestSession(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.patches = [mock.patch.object(api_handler, "_session", None),
+                        mock.patch.object(api_handler, "API_KEY", "chave-de-teste"),
+                        mock.patch.object(api_cache, "get_cache", return_value=None),
+                        mock.patch.object(rate_limiter, "get_limiter", return_value=rate_limiter.RateLimiter(per_minute=60000, per_day=1000))]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        logging.disable(logging.NOTSET)
+
+    def test_one_pooled_session_for_every_thread(self):
+        sessions = []
+        threads = [threading.Thread(target=lambda: sessions.append(api_handler._get_session())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(sessions), 8)
+        self.assertTrue(all(session is sessions[0] for session in sessions))
+        adapter = sessions[0].get_adapter("https://v3.football.api-sports.io/teams")
+        self.assertIs(adapter, sessions[0].get_adapter("http://v3.football.api-sports.io/teams"))
+        self.assertEqual(adapter._pool_maxsize, api_handler.API_POOL_SIZE)
+        self.assertTrue(adapter._pool_block)
+
+    def test_calls_reuse_the_session_with_connect_and_read_timeouts(self):
+        response = mock.Mock(status_code=200, headers={})
+        response.json.return_value = {"errors": [], "response": [{"team": {"id": 33}}]}
+        session = api_handler._get_session()
+        with mock.patch.object(session, "get", return_value=response) as get:
+            for params in ({"search": "Arsenal"}, {"search": "Chelsea"}):
+                self.assertEqual(api_handler._make_api_request("teams", params), [{"team": {"id": 33}}])
+        self.assertIs(api_handler._get_session(), session)
+        self.assertEqual(get.call_count, 2)
+        for call in get.call_args_list:
+            self.assertEqual(call.kwargs["timeout"], (api_handler.API_CONNECT_TIMEOUT, api_handler.API_READ_TIMEOUT))
+
+if __name__ == '__main__':
+    unittest.main()
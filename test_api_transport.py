@@ -0,0 +1,117 @@
+import json
+import logging
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+import api_cache
+import api_handler
+import api_transport
+import rate_limiter
+
+def _response(status, body, headers=None):
+    response = Response()
+    response.status_code = status
+    response._content = json.dumps(body, ensure_ascii=False).encode("utf-8")
+    response.encoding = "utf-8"
+    response.headers = CaseInsensitiveDict(headers or {})
+    return response
+
+class TestRecordReplay(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "gravacoes.jsonl.gz")
+        self.patches = [mock.patch.object(api_transport, "TRANSPORT_MODE", "record"),
+                        mock.patch.object(api_transport, "_store", api_transport.RecordingStore(self.path)),
+                        mock.patch.object(api_handler, "API_KEY", "chave-de-teste"),
+                        mock.patch.object(rate_limiter, "get_limiter", return_value=rate_limiter.RateLimiter(per_minute=60000, per_day=1000)),
+                        mock.patch.object(api_handler.time, "sleep")]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.tmp.cleanup()
+        logging.disable(logging.NOTSET)
+
+    def _switch_to_replay(self):
+        """A fresh store on the same file in replay mode, as a new process would see it."""
+        api_transport.TRANSPORT_MODE = "replay"
+        api_transport._store = api_transport.RecordingStore(self.path)
+
+    def test_recorded_calls_replay_without_network(self):
+        teams = {"errors": [], "response": [{"team": {"id": 33, "name": "São Paulo"}}]}
+        odds = {"errors": [], "response": [{"bookmakers": []}]}
+        live = [
+            _response(200, teams, {"x-ratelimit-requests-remaining": "99", "Set-Cookie": "sessão"}),
+            _response(429, {}, {"Retry-After": "1"}),
+            _response(200, odds),
+        ]
+        session = mock.Mock()
+        session.get.side_effect = live
+        with mock.patch.object(api_handler, "_get_session", return_value=session):
+            recorded = [api_handler._request_api("teams", {"search": "São Paulo"}, None),
+                        api_handler._request_api("odds", {"fixture": 7}, None)]
+        self.assertEqual(session.get.call_count, 3)
+        self.assertEqual(api_transport.get_store().stats()["recorded"], 3)
+
+        self._switch_to_replay()
+        with mock.patch.object(api_handler, "_get_session", side_effect=AssertionError("rede usada em replay")):
+            replayed = [api_handler._request_api("teams", {"search": "São Paulo"}, None),
+                        api_handler._request_api("odds", {"fixture": "7"}, None)]
+        self.assertEqual(replayed, recorded)
+        self.assertEqual(recorded[0], teams["response"])
+        # The 429 and its retry were replayed in order
+        self.assertEqual(api_transport.get_store().stats(), {"mode": "replay", "recorded": 0, "replayed": 3, "missing": 0})
+
+    def test_warm_cache_is_bypassed_while_recording_and_replaying(self):
+        cache = api_cache.ApiCache(os.path.join(self.tmp.name, "cache.sqlite3"))
+        cache.set("teams", {"search": "São Paulo"}, [{"team": {"id": 1, "name": "Antigo"}}])
+        teams = {"errors": [], "response": [{"team": {"id": 126, "name": "São Paulo"}}]}
+        session = mock.Mock()
+        session.get.return_value = _response(200, teams)
+        with mock.patch.object(api_cache, "get_cache", return_value=cache), \
+             mock.patch.object(api_handler, "_get_session", return_value=session):
+            recorded = api_handler._make_api_request("teams", {"search": "São Paulo"})
+            self.assertEqual(recorded, teams["response"])
+            self.assertEqual(session.get.call_count, 1) # The warm entry didn't hide the call from the recording
+
+            self._switch_to_replay()
+            replayed = api_handler._make_api_request("teams", {"search": "São Paulo"})
+        self.assertEqual(replayed, recorded)
+        self.assertEqual(api_transport.get_store().stats()["replayed"], 1)
+        self.assertEqual(cache.get("teams", {"search": "São Paulo"}), [{"team": {"id": 1, "name": "Antigo"}}]) # Never overwritten
+
+    def test_replay_keeps_status_and_quota_headers_only(self):
+        store = api_transport.get_store()
+        store.record("teams", {"id": 1}, _response(429, {"message": "lento"}, {"Retry-After": "3", "X-RateLimit-Remaining": "0", "Server": "nginx"}))
+        self._switch_to_replay()
+        response = api_transport.get_store().replay("teams", {"id": 1})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(dict(response.headers), {"Retry-After": "3", "X-RateLimit-Remaining": "0"})
+        self.assertEqual(response.json(), {"message": "lento"})
+
+    def test_replay_serves_calls_in_order_then_repeats_the_last(self):
+        store = api_transport.get_store()
+        for status in (429, 200):
+            store.record("fixtures", {"league": 39}, _response(status, {"response": [status]}))
+        self._switch_to_replay()
+        replay = api_transport.get_store()
+        statuses = [replay.replay("fixtures", {"league": 39}).status_code for _ in range(3)]
+        self.assertEqual(statuses, [429, 200, 200])
+        self.assertIsNone(replay.replay("fixtures", {"league": 140}))
+        self.assertEqual(replay.stats()["missing"], 1)
+
+    def test_missing_recording_is_an_error_result(self):
+        self._switch_to_replay()
+        result = api_handler._request_api("teams", {"search": "Nenhum"}, None)
+        self.assertTrue(result["error"])
+
+if __name__ == '__main__':
+    unittest.main()
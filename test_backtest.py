@@ -0,0 +1,121 @@
+import copy
+import logging
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import backtest
+
+LEAGUE_ID, SEASON = 1000, 2023
+
+def _season():
+    """One synthetic league/season (10 fixtures per weekly match day), with the fixtures of each day an hour apart."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "historico.jsonl.gz")
+        backtest.build_synthetic_dataset(path, n_leagues=1, seasons=(SEASON,), n_books=2)
+        fixtures = backtest.load_dataset(path)[(LEAGUE_ID, SEASON)]
+    for n, fixture in enumerate(sorted(fixtures, key=lambda f: f["fixture_id"])):
+        fixture["timestamp"] += (n % 10) * 3600
+    return fixtures
+
+def _predictions(fixtures):
+    """{fixture_id: 1X2 probabilities} for every fixture the walk-forward backtest predicted."""
+    previstas = {}
+    avaliar = backtest._avaliar
+
+    def _capturar(acc, fixture, previsoes):
+        previstas[fixture["fixture_id"]] = previsoes["1X2"]
+        return avaliar(acc, fixture, previsoes)
+
+    with mock.patch.object(backtest, "_avaliar", side_effect=_capturar):
+        backtest.backtest_season(LEAGUE_ID, SEASON, copy.deepcopy(fixtures))
+    return previstas
+
+class TestWalkForward(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.fixtures = _season()
+        self.days = sorted({f["timestamp"] // 86400 for f in self.fixtures})
+        self.baseline = _predictions(self.fixtures)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def _with_results_changed(self, changed):
+        fixtures = copy.deepcopy(self.fixtures)
+        for fixture in fixtures:
+            if changed(fixture):
+                fixture["home_goals"], fixture["away_goals"] = fixture["away_goals"] + 4, fixture["home_goals"]
+        return _predictions(fixtures)
+
+    def test_predictions_ignore_results_of_the_same_day(self):
+        day = self.days[len(self.days) // 2]
+        same_day = sorted((f for f in self.fixtures if f["timestamp"] // 86400 == day), key=lambda f: f["timestamp"])
+        # The day's earliest kickoff finishing differently must not move its later fixtures
+        earliest = same_day[0]["fixture_id"]
+        previstas = self._with_results_changed(lambda f: f["fixture_id"] == earliest)
+        later = [f["fixture_id"] for f in same_day[1:]]
+        self.assertTrue(all(fixture_id in self.baseline for fixture_id in later))
+        for fixture_id in later:
+            self.assertEqual(previstas[fixture_id], self.baseline[fixture_id], fixture_id)
+
+    def test_only_earlier_days_feed_each_prediction(self):
+        day = self.days[len(self.days) // 2]
+        previstas = self._with_results_changed(lambda f: f["timestamp"] // 86400 >= day)
+        self.assertEqual(set(previstas), set(self.baseline))
+        for fixture in self.fixtures:
+            fixture_id = fixture["fixture_id"]
+            if fixture["timestamp"] // 86400 <= day and fixture_id in self.baseline:
+                self.assertEqual(previstas[fixture_id], self.baseline[fixture_id], fixture_id)
+        # Sanity check that results do feed later days (so the equalities above are meaningful)
+        later = [f["fixture_id"] for f in self.fixtures if f["timestamp"] // 86400 > day]
+        self.assertTrue(any(previstas[fixture_id] != self.baseline[fixture_id] for fixture_id in later))
+
+class TestCornerMarkets(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.fixtures = _season()
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def _run(self, fixtures):
+        """(api_data sent to the analysis, fixture ids whose predictions reached the bet scanner with corners)."""
+        lotes, com_cantos = [], set()
+        analisar_lote, avaliar = backtest.analysis.analisar_lote, backtest._avaliar
+
+        def _analisar(lote):
+            lotes.extend(lote)
+            return analisar_lote(lote)
+
+        def _capturar(acc, fixture, previsoes):
+            if "over_under_cantos" in previsoes:
+                com_cantos.add(fixture["fixture_id"])
+            return avaliar(acc, fixture, previsoes)
+
+        with mock.patch.object(backtest.analysis, "analisar_lote", side_effect=_analisar), \
+             mock.patch.object(backtest, "_avaliar", side_effect=_capturar):
+            backtest.backtest_season(LEAGUE_ID, SEASON, copy.deepcopy(fixtures))
+        return lotes, com_cantos
+
+    def test_corners_are_not_priced_without_averages(self):
+        lotes, com_cantos = self._run(self.fixtures)
+        self.assertTrue(lotes)
+        self.assertEqual(com_cantos, set())
+        self.assertTrue(all(api_data["league_id"] == LEAGUE_ID and "avg_corners_home" not in api_data for api_data in lotes))
+
+    def test_corner_averages_come_from_earlier_results(self):
+        for fixture in self.fixtures:
+            fixture["corners_home"], fixture["corners_away"] = 7, 3
+        lotes, com_cantos = self._run(self.fixtures)
+        priced = [api_data for api_data in lotes if "avg_corners_home" in api_data]
+        self.assertTrue(priced)
+        self.assertLess(len(priced), len(lotes)) # Not before each team has BACKTEST_CORNERS_MIN_MATCHES at its venue
+        self.assertEqual(len(com_cantos), len(priced))
+        for api_data in priced:
+            self.assertEqual((api_data["avg_corners_home"], api_data["avg_corners_away"]), (7.0, 3.0))
+            self.assertEqual((api_data["avg_corners_against_home"], api_data["avg_corners_against_away"]), (3.0, 7.0))
+
+if __name__ == '__main__':
+    unittest.main()
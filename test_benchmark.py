@@ -0,0 +1,77 @@
+import contextlib
+import io
+import json
+import logging
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import analysis
+import api_transport
+import benchmark
+import main
+
+GATED_METRICS = ("p50_ms", "p95_ms", "peak_alloc_kib")
+
+def _scaled(baseline, factor):
+    """The baseline with every gated metric multiplied by `factor`."""
+    return {case: {k: (v * factor if k in GATED_METRICS and v else v) for k, v in result.items()} for case, result in baseline.items()}
+
+class TestBenchmarkGate(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        # run() reconfigures the transport and caches for the whole process; put them back afterwards
+        self.patches = [mock.patch.object(api_transport, "TRANSPORT_MODE", api_transport.TRANSPORT_MODE),
+                        mock.patch.object(api_transport, "_store", api_transport._store),
+                        mock.patch.object(main._report_cache, "max_size", main._report_cache.max_size),
+                        mock.patch.object(analysis._memo_mercados, "max_size", analysis._memo_mercados.max_size)]
+        for patch in self.patches:
+            patch.start()
+        analysis._memo_mercados.clear()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        analysis._memo_mercados.clear()
+        logging.disable(logging.NOTSET)
+        self.tmp.cleanup()
+
+    def _run(self, *args):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return benchmark.run(["--iterations", "3", "--warmup", "1", "--concurrency", "2", *args])
+
+    def _write(self, name, baseline):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(baseline, f)
+        return path
+
+    def test_gate_fails_on_regression_and_passes_otherwise(self):
+        saved = os.path.join(self.tmp.name, "bench.json")
+        self.assertEqual(self._run("--save-baseline", saved), 0)
+        with open(saved, encoding="utf-8") as f:
+            baseline = json.load(f)
+        self.assertIn("process_analysis_request", baseline)
+        self.assertIn("calcular_1x2", baseline)
+
+        # A baseline 100x faster than this machine is a regression; one 100x slower is not
+        self.assertEqual(self._run("--baseline", self._write("fast.json", _scaled(baseline, 0.01))), 1)
+        self.assertEqual(self._run("--baseline", self._write("slow.json", _scaled(baseline, 100))), 0)
+
+    def test_per_stage_cases_skip_the_market_memo(self):
+        self.assertEqual(self._run(), 0)
+        stats = analysis._memo_mercados.stats()
+        self.assertEqual(stats["hits"], 0)
+        self.assertGreater(stats["misses"], 0)
+        self.assertEqual(stats["size"], 0)
+
+    def test_compare_to_baseline(self):
+        baseline = {"a": {"p50_ms": 1.0, "p95_ms": 2.0, "peak_alloc_kib": 10.0}}
+        within = [{"case": "a", "p50_ms": 1.2, "p95_ms": 2.4, "peak_alloc_kib": 12.0}]
+        self.assertEqual(benchmark.compare_to_baseline(within, baseline, 0.25), [])
+        slower = [{"case": "a", "p50_ms": 1.3, "p95_ms": 2.0, "peak_alloc_kib": None}, {"case": "novo", "p50_ms": 9.0}]
+        self.assertEqual(len(benchmark.compare_to_baseline(slower, baseline, 0.25)), 1)
+
+if __name__ == '__main__':
+    unittest.main()
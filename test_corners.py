@@ -0,0 +1,94 @@
+import logging
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import api_handler
+import corners
+import history_store
+
+LEAGUE_ID, SEASON = 39, 2023
+
+def _item(fixture_id, corners_home=None, corners_away=None):
+    """A finished fixtures-endpoint item; with statistics only when corners are given (as `fixtures?ids=` returns)."""
+    item = {"fixture": {"id": fixture_id, "timestamp": 1700000000 + fixture_id, "status": {"short": "FT"}},
+            "teams": {"home": {"id": 1}, "away": {"id": 2}},
+            "goals": {"home": 2, "away": 1}, "score": {"halftime": {"home": 1, "away": 0}}}
+    if corners_home is not None:
+        item["statistics"] = [
+            {"team": {"id": 2}, "statistics": [{"type": "Shots on Goal", "value": 3}, {"type": "Corner Kicks", "value": corners_away}]},
+            {"team": {"id": 1}, "statistics": [{"type": "Corner Kicks", "value": corners_home}]},
+        ]
+    return item
+
+class TestCornerHistory(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = history_store.HistoryStore(path=self.tmp.name)
+        self.patches = [mock.patch.object(history_store, "get_store", return_value=self.store),
+                        mock.patch.object(history_store, "HISTORY_STORE_ENABLED", True),
+                        mock.patch.object(corners, "CORNERS_MIN_MATCHES", 20)]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.tmp.cleanup()
+        logging.disable(logging.NOTSET)
+
+    def _archive(self, items):
+        matches = [api_handler._finished_match(item) for item in items]
+        self.store.append("fixtures", LEAGUE_ID, SEASON, history_store.fixture_rows(matches))
+        self.store.flush()
+
+    def test_finished_match_reads_corners_by_team(self):
+        match = api_handler._finished_match(_item(7, corners_home=6, corners_away=3))
+        self.assertEqual((match["corners_home"], match["corners_away"]), (6, 3))
+        match = api_handler._finished_match(_item(8))
+        self.assertEqual((match["corners_home"], match["corners_away"]), (None, None))
+
+    def test_rearchiving_without_corners_keeps_them(self):
+        self._archive([_item(1, 5, 4)])
+        self._archive([_item(1), _item(2)])
+        rows = self.store.read("fixtures", LEAGUE_ID, SEASON)
+        by_id = {f: (h, a, g) for f, h, a, g in zip(rows["fixture_id"].tolist(), rows["corners_home"].tolist(),
+                                                     rows["corners_away"].tolist(), rows["home_goals"].tolist())}
+        self.assertEqual(by_id, {1: (5, 4, 2), 2: (-1, -1, 2)})
+
+    def test_backfill_fills_newest_first_and_refits(self):
+        rng = np.random.default_rng(0)
+        totals = {i: int(t) for i, t in enumerate(rng.negative_binomial(8, 8 / (8 + 10), 60))}
+        self._archive([_item(i) for i in totals])
+        dispersions = corners.LeagueDispersions(default=40.0)
+        self.assertEqual(dispersions.get(LEAGUE_ID), 40.0) # No corners stored yet
+
+        requested = []
+        def fake_request(endpoint, params=None):
+            ids = [int(i) for i in params["ids"].split("-")]
+            requested.append(ids)
+            return [_item(i, totals[i] // 2, totals[i] - totals[i] // 2) for i in ids]
+
+        with mock.patch.object(api_handler, "_make_api_request", side_effect=fake_request):
+            self.assertEqual(api_handler.backfill_fixture_corners(LEAGUE_ID, SEASON, max_calls=1), 20)
+            self.assertEqual(requested[0], list(range(59, 39, -1)))
+            # The store grew: the league is refitted on the 20 newest results, not stuck on the empty fit
+            self.assertAlmostEqual(dispersions.refit(LEAGUE_ID), corners.fit_dispersion([totals[i] for i in range(40, 60)]))
+            self.assertEqual(api_handler.backfill_fixture_corners(LEAGUE_ID, SEASON, max_calls=5), 40)
+        self.store.flush()
+
+        r = dispersions.refit(LEAGUE_ID)
+        expected = corners.fit_dispersion(list(totals.values()))
+        self.assertIsNotNone(r)
+        self.assertAlmostEqual(r, expected)
+        self.assertAlmostEqual(dispersions.get(LEAGUE_ID), expected)
+        # Nothing new in the store: refit keeps the fit without refitting
+        with mock.patch.object(dispersions, "set") as refit:
+            dispersions.refit(LEAGUE_ID)
+        refit.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import logging
+import unittest
+from unittest import mock
+
+import h2h_index
+
+NOW = 1_700_000_000
+HOME, AWAY = 10, 20
+
+def _meetings(n, home_goals=3, away_goals=0, home_id=HOME, away_id=AWAY, start=1):
+    """n finished meetings a day apart, all with the same score."""
+    return [{"fixture_id": start + i, "timestamp": NOW - (n - i) * 86400, "home_id": home_id, "away_id": away_id,
+             "home_goals": home_goals, "away_goals": away_goals} for i in range(n)]
+
+class TestShrinkLambdas(unittest.TestCase):
+    def test_no_meetings_leaves_lambdas_unchanged(self):
+        self.assertEqual(h2h_index.shrink_lambdas(1.4, 1.1, [], HOME, now=NOW), (1.4, 1.1, 0))
+
+    def test_moves_towards_h2h_rate_more_with_more_meetings(self):
+        index = h2h_index.H2HIndex(max_matches=50)
+        index.update(_meetings(30))
+        meetings = index.lookup(HOME, AWAY)
+        shrunk = [h2h_index.shrink_lambdas(1.4, 1.1, meetings[-n:], HOME, now=NOW) for n in (1, 5, 30)]
+        homes = [lambda_casa for lambda_casa, _, _ in shrunk]
+        aways = [lambda_fora for _, lambda_fora, _ in shrunk]
+        # Meetings ended 3-0: home goes up towards 3, away down towards 0, each step closer but never past
+        self.assertTrue(1.4 < homes[0] < homes[1] < homes[2] < 3.0)
+        self.assertTrue(1.1 > aways[0] > aways[1] > aways[2] > 0.0)
+        self.assertEqual([n for _, _, n in shrunk], [1, 5, 30])
+
+    def test_meetings_matching_the_model_change_nothing(self):
+        meetings = [(NOW - 86400, 1, HOME, 2, 1), (NOW - 2 * 86400, 2, HOME, 2, 1)]
+        lambda_casa, lambda_fora, _ = h2h_index.shrink_lambdas(2.0, 1.0, meetings, HOME, now=NOW)
+        self.assertAlmostEqual(lambda_casa, 2.0)
+        self.assertAlmostEqual(lambda_fora, 1.0)
+
+    def test_reversed_venue_counts_goals_for_the_right_team(self):
+        # Today's away team hosted the past meeting and lost 0-3: that is three goals for today's home team
+        meetings = [(NOW - 86400, 1, AWAY, 0, 3)]
+        direct = h2h_index.shrink_lambdas(1.4, 1.1, [(NOW - 86400, 1, HOME, 3, 0)], HOME, now=NOW)
+        reversed_venue = h2h_index.shrink_lambdas(1.4, 1.1, meetings, HOME, reversed_lambdas=(1.1, 1.4), now=NOW)
+        self.assertAlmostEqual(reversed_venue[0], direct[0])
+        self.assertAlmostEqual(reversed_venue[1], direct[1])
+
+    def test_old_meetings_weigh_less(self):
+        with mock.patch.object(h2h_index, "H2H_HALF_LIFE_DAYS", 365):
+            recent = h2h_index.shrink_lambdas(1.4, 1.1, [(NOW - 86400, 1, HOME, 4, 0)], HOME, now=NOW)[0]
+            old = h2h_index.shrink_lambdas(1.4, 1.1, [(NOW - 5 * 365 * 86400, 1, HOME, 4, 0)], HOME, now=NOW)[0]
+        self.assertTrue(1.4 < old < recent)
+
+class TestH2HIndex(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_pairs_are_venue_independent_and_capped(self):
+        index = h2h_index.H2HIndex(max_matches=4)
+        self.assertEqual(index.update(_meetings(3) + _meetings(3, home_id=AWAY, away_id=HOME, start=100)), 6)
+        self.assertEqual(index.update(_meetings(3)), 0) # Already indexed
+        meetings = index.lookup(AWAY, HOME)
+        self.assertEqual(len(meetings), 4)
+        self.assertEqual(meetings, sorted(meetings)) # Oldest first, only the most recent kept
+        self.assertEqual(index.stats(), {"pairs": 1, "fixtures": 6})
+
+    def test_needs_sync_until_filled_or_synced_within_ttl(self):
+        index = h2h_index.H2HIndex()
+        self.assertTrue(index.needs_sync(HOME, AWAY, now=NOW))
+        index.mark_synced(AWAY, HOME, now=NOW)
+        self.assertFalse(index.needs_sync(HOME, AWAY, now=NOW + 60))
+        self.assertFalse(index.needs_sync(HOME, AWAY, now=NOW + h2h_index.H2H_SYNC_TTL - 1))
+        self.assertTrue(index.needs_sync(HOME, AWAY, now=NOW + h2h_index.H2H_SYNC_TTL)) # Stale: ask the API again
+        # Enough meetings indexed: never needs the API, whatever the sync time
+        index.update(_meetings(h2h_index.H2H_MIN_MATCHES))
+        self.assertFalse(index.needs_sync(HOME, AWAY, now=NOW + 10 * h2h_index.H2H_SYNC_TTL))
+
+if __name__ == '__main__':
+    unittest.main()
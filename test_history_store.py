@@ -0,0 +1,119 @@
+import logging
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import history_store
+
+LEAGUE_ID, SEASON = 39, 2023
+
+def _odds(bookmakers):
+    """An odds response with a 1X2 market per bookmaker: {name: (home, draw, away)}."""
+    return {"bookmakers": [
+        {"name": name, "bets": [{"id": 1, "name": "Match Winner", "values": [
+            {"value": "Home", "odd": str(home)}, {"value": "Draw", "odd": str(draw)}, {"value": "Away", "odd": str(away)}]}]}
+        for name, (home, draw, away) in bookmakers.items()
+    ]}
+
+class TestHistoryStore(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = history_store.HistoryStore(path=self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+        logging.disable(logging.NOTSET)
+
+    def _column_file(self, table, column):
+        return os.path.join(self.tmp.name, str(LEAGUE_ID), str(SEASON), table, f"{column}.bin")
+
+    def test_dedupe_keeps_last_row_and_sticky_columns(self):
+        rows = history_store.fixture_rows([
+            {"fixture_id": 1, "timestamp": 10, "corners_home": 5, "corners_away": 4, "ht_home_goals": 1},
+            {"fixture_id": 2, "timestamp": 20},
+            {"fixture_id": 1, "timestamp": 11, "home_goals": 2, "away_goals": 1}, # Newer, without corners/half-time
+        ])
+        kept = history_store._dedupe(rows, "fixture_id", history_store.TABLE_STICKY["fixtures"])
+        self.assertEqual(kept["fixture_id"].tolist(), [2, 1])
+        self.assertEqual(kept["timestamp"].tolist(), [20, 11])
+        self.assertEqual(kept["home_goals"].tolist(), [-1, 2])
+        self.assertEqual(kept["corners_home"].tolist(), [-1, 5])
+        self.assertEqual(kept["ht_home_goals"].tolist(), [-1, 1])
+        self.assertEqual(kept["ht_away_goals"].tolist(), [-1, -1])
+        self.assertIs(history_store._dedupe(rows, None), rows)
+
+    def test_flush_appends_instead_of_rewriting(self):
+        self.store.append("fixtures", LEAGUE_ID, SEASON, history_store.fixture_rows([{"fixture_id": 1, "timestamp": 10}]))
+        self.store.flush()
+        path = self._column_file("fixtures", "fixture_id")
+        with open(path, "rb") as f:
+            first = f.read()
+        self.store.append("fixtures", LEAGUE_ID, SEASON, history_store.fixture_rows([{"fixture_id": 1, "timestamp": 10, "home_goals": 1}]))
+        self.store.flush()
+        with open(path, "rb") as f:
+            data = f.read()
+        self.assertEqual(data[:len(first)], first)
+        self.assertEqual(len(data), 2 * len(first))
+
+        rows = history_store.HistoryStore(path=self.tmp.name).read("fixtures", LEAGUE_ID, SEASON)
+        self.assertEqual(rows["fixture_id"].tolist(), [1])
+        self.assertEqual(rows["home_goals"].tolist(), [1])
+
+    def test_text_columns_are_coded_and_survive_reopening(self):
+        self.store.append("odds", LEAGUE_ID, SEASON, history_store.odds_rows(1, _odds({"Bet365": (2.0, 3.4, 3.8)}), captured_at=5))
+        self.store.append("odds", LEAGUE_ID, SEASON, history_store.odds_rows(2, _odds({"Pinnacle": (1.9, 3.5, 4.1)}), captured_at=5))
+        self.store.flush()
+        self.assertEqual(os.path.getsize(self._column_file("odds", "bookmaker")), 6 * np.dtype("i4").itemsize)
+
+        reopened = history_store.HistoryStore(path=self.tmp.name)
+        rows = reopened.read("odds", LEAGUE_ID, SEASON)
+        self.assertEqual(rows["bookmaker"].tolist(), [0, 0, 0, 1, 1, 1])
+        self.assertEqual(rows.text("bookmaker").tolist(), ["Bet365"] * 3 + ["Pinnacle"] * 3)
+        self.assertEqual(rows.text("value").tolist()[:3], ["Home", "Draw", "Away"])
+
+        # Known words keep their codes; new ones extend the vocabulary
+        reopened.append("odds", LEAGUE_ID, SEASON, history_store.odds_rows(3, _odds({"Pinnacle": (2, 3, 4), "Betfair": (2, 3, 4)}), captured_at=5))
+        reopened.flush()
+        rows = history_store.HistoryStore(path=self.tmp.name).read("odds", LEAGUE_ID, SEASON)
+        self.assertEqual(rows["bookmaker"].tolist()[6:], [1, 1, 1, 2, 2, 2])
+        self.assertEqual(rows.text("bookmaker").tolist()[-1], "Betfair")
+
+    def test_interrupted_flush_is_ignored_and_trimmed(self):
+        self.store.append("fixtures", LEAGUE_ID, SEASON, history_store.fixture_rows([{"fixture_id": 1, "timestamp": 10}]))
+        self.store.flush()
+        with open(self._column_file("fixtures", "fixture_id"), "ab") as f:
+            np.array([2], dtype="<i8").tofile(f) # Only the first column of a second row reached the disk
+
+        store = history_store.HistoryStore(path=self.tmp.name)
+        self.assertEqual(store.read("fixtures", LEAGUE_ID, SEASON)["fixture_id"].tolist(), [1])
+        store.append("fixtures", LEAGUE_ID, SEASON, history_store.fixture_rows([{"fixture_id": 3, "timestamp": 30}]))
+        store.flush()
+        rows = history_store.HistoryStore(path=self.tmp.name).read("fixtures", LEAGUE_ID, SEASON)
+        self.assertEqual(rows["fixture_id"].tolist(), [1, 3])
+        self.assertEqual(rows["timestamp"].tolist(), [10, 30])
+
+    def test_closing_odds_takes_last_snapshot_before_kickoff(self):
+        self.store.append("fixtures", LEAGUE_ID, SEASON, history_store.fixture_rows([
+            {"fixture_id": 1, "timestamp": 100, "home_goals": 1, "away_goals": 0},
+            {"fixture_id": 2, "timestamp": 200, "home_goals": 0, "away_goals": 0},
+        ]))
+        for fixture_id, captured_at, home in [(1, 50, 2.0), (1, 90, 2.1), (1, 120, 5.0), # The last one is in-play
+                                              (2, 150, 1.8), (3, 999, 3.0), (4, 300, 9.9)]: # 3 and 4: no kickoff known
+            self.store.append("odds", LEAGUE_ID, SEASON, history_store.odds_rows(fixture_id, _odds({"Bet365": (home, 3.3, 4.0)}), captured_at))
+        self.store.append("odds", LEAGUE_ID, SEASON, history_store.odds_rows(3, _odds({"Bet365": (3.1, 3.3, 4.0)}), 500))
+        self.store.flush()
+
+        closing = history_store.HistoryStore(path=self.tmp.name).closing_odds(LEAGUE_ID, SEASON)
+        self.assertEqual(sorted(closing), [1, 2, 3, 4])
+        self.assertEqual(closing[1]["captured_at"].tolist(), [90, 90, 90])
+        self.assertEqual(closing[1]["price"].tolist()[0], 2.1)
+        self.assertEqual(closing[2]["price"].tolist()[0], 1.8)
+        self.assertEqual(closing[3]["captured_at"].tolist(), [999, 999, 999])
+        self.assertEqual(closing[1].text("value").tolist(), ["Home", "Draw", "Away"])
+        self.assertIsNotNone(history_store.odds_table(closing[1]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import logging
+import time
+import unittest
+
+import numpy as np
+
+import analysis
+import league_model
+
+N_TEAMS = 20
+MU, HOME_ADV = 0.1, 0.25
+
+def _simulate(seed, rounds=1):
+    """Double round robin(s) drawn from a known Poisson strength model. Returns (attack, defence, matches)."""
+    rng = np.random.default_rng(seed)
+    attack = rng.normal(0, 0.3, N_TEAMS)
+    defence = rng.normal(0, 0.3, N_TEAMS)
+    attack -= attack.mean()
+    defence -= defence.mean()
+    pairs = [(h, a) for h in range(N_TEAMS) for a in range(N_TEAMS) if h != a] * rounds
+    rng.shuffle(pairs)
+    matches = []
+    for n, (h, a) in enumerate(pairs):
+        lambda_casa, lambda_fora = _true_lambdas(attack, defence, h, a)
+        matches.append({"fixture_id": n, "timestamp": 0, "home_id": h, "away_id": a,
+                        "home_goals": int(rng.poisson(lambda_casa)), "away_goals": int(rng.poisson(lambda_fora))})
+    return attack, defence, matches
+
+def _true_lambdas(attack, defence, h, a):
+    return np.exp(MU + HOME_ADV + attack[h] + defence[a]), np.exp(MU + attack[a] + defence[h])
+
+def _probs_1x2(lambdas):
+    lambdas = np.asarray(lambdas)
+    matrices, _ = analysis._get_score_matrices(lambdas[:, 0], lambdas[:, 1])
+    arrays = analysis._calcular_mercados_arrays(matrices, limits=[], handicap_lines=[])
+    return np.stack([arrays["casa"], arrays["empate"], arrays["fora"]], axis=1)
+
+class TestLeagueModel(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_recovers_parameters(self):
+        attack, defence, matches = _simulate(seed=0, rounds=2)
+        model = league_model.fit_league_model(1, 2023, matches, weights=np.ones(len(matches)))
+        fitted_attack = np.array([model.attack[model.index[t]] for t in range(N_TEAMS)])
+        fitted_defence = np.array([model.defence[model.index[t]] for t in range(N_TEAMS)])
+        self.assertGreater(np.corrcoef(fitted_attack, attack)[0, 1], 0.85)
+        self.assertGreater(np.corrcoef(fitted_defence, defence)[0, 1], 0.85)
+        self.assertLess(np.sqrt(np.mean((fitted_attack - attack) ** 2)), 0.15)
+        self.assertLess(np.sqrt(np.mean((fitted_defence - defence) ** 2)), 0.15)
+        self.assertAlmostEqual(model.home_adv, HOME_ADV, delta=0.05)
+
+    def test_calibrated_early_in_season(self):
+        """After ~12 matches per team, predictions beat a flat 1/3 and aren't overconfident (scored on true probabilities)."""
+        predicted, true = [], []
+        for seed in range(5):
+            attack, defence, matches = _simulate(seed)
+            model = league_model.fit_league_model(1, 2023, matches[:120], weights=np.ones(120))
+            pairs = [(h, a) for h in range(N_TEAMS) for a in range(N_TEAMS) if h != a and model.lambdas(h, a) is not None]
+            q = _probs_1x2([model.lambdas(h, a) for h, a in pairs])
+            p = _probs_1x2([_true_lambdas(attack, defence, h, a) for h, a in pairs])
+            # Expected Brier score under the true probabilities; a flat 1/3 forecast scores 2/3
+            brier = np.mean((q ** 2).sum(axis=1) - 2 * (q * p).sum(axis=1) + 1)
+            self.assertLess(brier, 2 / 3)
+            predicted.append(q)
+            true.append(p)
+        q, p = np.concatenate(predicted), np.concatenate(true)
+        favourite = q.argmax(axis=1)
+        confident = q.max(axis=1) > 0.6
+        rows = np.flatnonzero(confident)
+        self.assertGreater(len(rows), 50)
+        self.assertGreater(p[rows, favourite[rows]].mean(), q[rows, favourite[rows]].mean() - 0.08)
+
+    def test_few_matches_shrink_towards_league_average(self):
+        attack, defence, matches = _simulate(seed=1)
+        model = league_model.fit_league_model(1, 2023, matches[:40], weights=np.ones(40))
+        self.assertLess(np.std(model.attack), np.std(attack))
+        self.assertLess(np.std(model.defence), np.std(defence))
+
+    def test_old_season_fits_like_a_current_one(self):
+        """Decay is measured from the newest match, so the age of the whole season doesn't matter."""
+        attack, _, matches = _simulate(seed=2)
+        end = time.time()
+        fitted = []
+        for offset_days in (0, 900):
+            dated = [dict(m, timestamp=end - offset_days * 86400 - (len(matches) - n) * 86400 * 250 / len(matches))
+                     for n, m in enumerate(matches)]
+            model = league_model.fit_league_model(1, 2020, dated)
+            fitted.append(np.array([model.attack[model.index[t]] for t in range(N_TEAMS)]))
+        np.testing.assert_allclose(fitted[1], fitted[0], atol=1e-6)
+        self.assertGreater(np.std(fitted[1]), 0.5 * np.std(attack)) # Not swamped by the prior
+
+    def test_prior_scales_with_the_weights(self):
+        _, _, matches = _simulate(seed=3)
+        models = [league_model.fit_league_model(1, 2023, matches, weights=np.full(len(matches), w)) for w in (1.0, 0.01)]
+        np.testing.assert_allclose(models[1].attack, models[0].attack, atol=1e-4)
+        np.testing.assert_allclose(models[1].defence, models[0].defence, atol=1e-4)
+
+    def test_blend_weights_model_by_team_matches(self):
+        model, stats = (2.0, 1.0), (1.0, 1.0)
+        self.assertEqual(league_model.blend_lambdas(model, stats, 0), stats)
+        k = league_model.LEAGUE_MODEL_BLEND_MATCHES
+        half = league_model.blend_lambdas(model, stats, k)
+        self.assertAlmostEqual(half[0], np.sqrt(2.0))
+        self.assertGreater(league_model.blend_lambdas(model, stats, 10 * k)[0], half[0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import unittest
+from unittest import mock
+
+import main
+
+def _api_data():
+    return {"fixture_id": 1001, "home_team_id": 42, "away_team_id": 49, "league_id": 39, "season": 2023,
+            "raw_odds": [{"bookmaker": "Bet365", "bets": [{"name": "Match Winner", "values": [{"value": "Home", "odd": "2.10"}]}]}],
+            "raw_home_stats": {"goals": {"for": 30}}, "raw_away_stats": {"goals": {"for": 25}},
+            "lambda_casa": 1.6, "lambda_fora": 1.1, "avg_corners_home": 5.5, "avg_corners_away": 4.2}
+
+class TestReportCacheKey(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_same_snapshot_same_key(self):
+        self.assertEqual(main._report_cache_key(_api_data()), main._report_cache_key(_api_data()))
+        reordered = dict(reversed(list(_api_data().items())))
+        self.assertEqual(main._report_cache_key(reordered), main._report_cache_key(_api_data()))
+
+    def test_key_changes_with_odds_stats_or_model_inputs(self):
+        key = main._report_cache_key(_api_data())
+        changes = {
+            "odds": lambda d: d["raw_odds"][0]["bets"][0]["values"][0].update(odd="2.05"),
+            "home stats": lambda d: d["raw_home_stats"]["goals"].update({"for": 31}),
+            "away stats": lambda d: d.update(raw_away_stats=None),
+            "lambda": lambda d: d.update(lambda_casa=1.65),
+            "corners": lambda d: d.update(avg_corners_away=4.3),
+            "fixture": lambda d: d.update(fixture_id=1002),
+        }
+        for name, change in changes.items():
+            api_data = _api_data()
+            change(api_data)
+            self.assertNotEqual(main._report_cache_key(api_data), key, name)
+
+    def test_teams_identify_a_fixture_without_id(self):
+        api_data = _api_data()
+        api_data["fixture_id"] = None
+        self.assertEqual(main._report_cache_key(api_data)[0], (42, 49, 39, 2023))
+
+class TestReportCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = main._ReportCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1) # "b" is now the least recently used
+        cache.set("c", 3)
+        self.assertNotIn("b", cache)
+        self.assertIn("a", cache)
+        self.assertIn("c", cache)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_overwrite_refreshes_and_zero_size_disables(self):
+        cache = main._ReportCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.set("a", 10)
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 10)
+        self.assertNotIn("b", cache)
+
+        disabled = main._ReportCache(max_size=0)
+        disabled.set("a", 1)
+        self.assertNotIn("a", disabled)
+
+class TestAnalysisRequest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.patches = [mock.patch.object(main, "get_processed_fixture_data", return_value=_api_data()),
+                        mock.patch.object(main, "_report_cache", main._ReportCache(8))]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        logging.disable(logging.NOTSET)
+
+    def test_empty_predictions_answer_with_the_reason(self):
+        with mock.patch.object(main, "analisar_jogo_completo", return_value=({}, "Dados insuficientes")):
+            reply = asyncio.run(main.process_analysis_request("Arsenal x Chelsea, Premier League"))
+        self.assertEqual(reply, "Desculpe, ocorreu um erro durante a análise: Dados insuficientes")
+        self.assertNotIn(main._report_cache_key(_api_data()), main._report_cache) # Nothing to serve again
+
+        with mock.patch.object(main, "analisar_jogo_completo", return_value=({}, None)):
+            reply = asyncio.run(main.process_analysis_request("Arsenal x Chelsea, Premier League"))
+        self.assertIn("nenhuma previsão gerada", reply)
+
+if __name__ == '__main__':
+    unittest.main()
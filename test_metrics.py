@@ -0,0 +1,83 @@
+import logging
+import unittest
+from unittest import mock
+
+import metrics
+
+class TestRendering(unittest.TestCase):
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram("latencia", "Latência.", ["stage"], buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 3.0):
+            histogram.observe(value, stage="api")
+        self.assertEqual(histogram.render(), [
+            "# HELP latencia Latência.",
+            "# TYPE latencia histogram",
+            'latencia_bucket{stage="api",le="0.1"} 1',
+            'latencia_bucket{stage="api",le="1"} 3',
+            'latencia_bucket{stage="api",le="+Inf"} 4',
+            'latencia_sum{stage="api"} 4.050000',
+            'latencia_count{stage="api"} 4',
+        ])
+
+    def test_label_values_are_escaped(self):
+        counter = metrics.Counter("erros", "Erros.", ["status"])
+        counter.inc(status='a "b"\\c\nd')
+        counter.inc(2, status='a "b"\\c\nd')
+        self.assertEqual(counter.render()[-1], 'erros{status="a \\"b\\"\\\\c\\nd"} 3')
+        self.assertEqual(metrics.Counter("total", "Total.").render()[-1], "# TYPE total counter")
+
+    def test_render_skips_a_collector_that_raises(self):
+        def _broken():
+            raise RuntimeError("falhou")
+
+        def _working():
+            return [("palpitepro_cache_entries", "gauge", "Entradas.", [({"cache": "api"}, 7)])]
+
+        logging.disable(logging.CRITICAL)
+        try:
+            with mock.patch.object(metrics, "_collectors", []):
+                metrics.register_collector(_broken)
+                metrics.register_collector(_working)
+                text = metrics.render()
+        finally:
+            logging.disable(logging.NOTSET)
+        self.assertIn('palpitepro_cache_entries{cache="api"} 7\n', text)
+        self.assertIn("# TYPE palpitepro_requests_total counter", text)
+
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.histogram = metrics.Histogram("palpitepro_stage_seconds", "Etapas.", ["stage"])
+        self.patch = mock.patch.object(metrics, "STAGE_SECONDS", self.histogram)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        logging.disable(logging.NOTSET)
+
+    def _stages(self):
+        return {dict(key)["stage"] for key in self.histogram._series}
+
+    def test_sampled_request_times_its_stages(self):
+        with mock.patch.object(metrics, "METRICS_SAMPLE_RATE", 1.0):
+            with metrics.trace_request("analise") as trace:
+                self.assertEqual(metrics.timed("odds", sum, [1, 2]), 3)
+        self.assertIsNotNone(trace)
+        self.assertEqual(set(trace.stages), {"odds"})
+        self.assertEqual(self._stages(), {"odds", "total"})
+        self.assertIsNone(metrics._current_trace.get())
+
+    def test_unsampled_request_records_nothing(self):
+        with mock.patch.object(metrics, "METRICS_SAMPLE_RATE", 0.0):
+            with metrics.trace_request("analise") as trace:
+                with metrics.stage("odds"):
+                    pass
+        self.assertIsNone(trace)
+        with mock.patch.object(metrics, "METRICS_SAMPLE_RATE", 0.5), mock.patch.object(metrics.random, "random", return_value=0.7):
+            with metrics.trace_request("analise") as trace:
+                metrics.timed("odds", sum, [])
+        self.assertIsNone(trace)
+        self.assertEqual(self._stages(), set())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import logging
+import unittest
+from unittest import mock
+
+import name_index
+from name_index import NameIndex, normalize_name
+
+def _leagues():
+    index = NameIndex("ligas", aliases=name_index.LEAGUE_ALIASES)
+    index.replace_all([
+        (39, "Premier League", "England", 2023),
+        (135, "Serie A", "Italy", 2023),
+        (71, "Serie A", "Brazil", 2023),
+        (72, "Serie B", "Brazil", 2023),
+        (2, "UEFA Champions League", "World", 2023),
+    ])
+    return index
+
+def _teams():
+    index = NameIndex("times", aliases=name_index.TEAM_ALIASES)
+    index.replace_all([
+        (126, "São Paulo", "Brazil", 2023),
+        (127, "Flamengo", "Brazil", 2023),
+        (121, "Palmeiras", "Brazil", 2023),
+        (168, "Bayer Leverkusen", "Germany", 2023),
+        (157, "Bayern Munich", "Germany", 2023),
+        (50, "Manchester City", "England", 2023),
+        (33, "Manchester United", "England", 2023),
+    ])
+    return index
+
+class TestNormalizeName(unittest.TestCase):
+    def test_folds_accents_case_and_punctuation(self):
+        self.assertEqual(normalize_name("São Paulo"), "sao paulo")
+        self.assertEqual(normalize_name("  ATLÉTICO-MG!! "), "atletico mg")
+        self.assertEqual(normalize_name("Grêmio  F.B.P.A."), "gremio f b p a")
+        self.assertEqual(normalize_name(None), "")
+
+class TestNameIndex(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.leagues = _leagues()
+        self.teams = _teams()
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_exact_match_ignores_accents(self):
+        self.assertEqual(self.teams.lookup("Sao Paulo"), (126, "São Paulo", "exact"))
+        self.assertEqual(self.teams.lookup("SÃO PAULO"), (126, "São Paulo", "exact"))
+
+    def test_country_picks_between_same_names(self):
+        self.assertEqual(self.leagues.lookup("Serie A", country="Italy")[0], 135)
+        self.assertEqual(self.leagues.lookup("Serie A", country="Brazil")[0], 71)
+
+    def test_alias_resolves_name_and_country(self):
+        self.assertEqual(self.leagues.lookup("Brasileirão"), (71, "Serie A", "exact"))
+        self.assertEqual(self.leagues.lookup("Brasileirão Série B"), (72, "Serie B", "exact"))
+        self.assertEqual(self.leagues.lookup("Champions"), (2, "UEFA Champions League", "exact"))
+        self.assertEqual(self.teams.lookup("Man City"), (50, "Manchester City", "exact"))
+        self.assertEqual(self.teams.lookup("Mengão"), (127, "Flamengo", "exact"))
+
+    def test_prefix_match_takes_the_shortest_name(self):
+        self.assertEqual(self.teams.lookup("Bayer Lev"), (168, "Bayer Leverkusen", "prefix"))
+        self.assertEqual(self.teams.lookup("Manchester"), (50, "Manchester City", "prefix"))
+        self.assertEqual(self.leagues.lookup("Premier"), (39, "Premier League", "exact")) # Alias wins over prefix
+
+    def test_fuzzy_match_respects_threshold(self):
+        self.assertEqual(self.teams.lookup("Palmeras"), (121, "Palmeiras", "fuzzy"))
+        self.assertEqual(self.teams.lookup("Flamenco"), (127, "Flamengo", "fuzzy"))
+        self.assertIsNone(self.teams.lookup("Corinthians"))
+        with mock.patch.object(name_index, "FUZZY_MIN_SIMILARITY", 0.95):
+            self.assertIsNone(self.teams.lookup("Palmeras"))
+
+    def test_marker_tokens_keep_serie_a_and_b_apart(self):
+        only_a = NameIndex("ligas")
+        only_a.add(71, "Serie A", "Brazil", 2023)
+        self.assertIsNone(only_a.lookup("Serie B"))
+        self.assertIsNone(only_a.lookup("Série C"))
+        self.assertEqual(only_a.lookup("Seri A"), (71, "Serie A", "fuzzy"))
+        self.assertEqual(self.leagues.lookup("Serie B"), (72, "Serie B", "exact"))
+
+    def test_season_scope_prefers_entries_of_that_season(self):
+        index = NameIndex("ligas")
+        index.add(1, "Copa", "Brazil", 2019)
+        index.add(2, "Copa", "Brazil", 2023)
+        self.assertEqual(index.lookup("Copa", season=2023)[0], 2)
+        self.assertEqual(index.lookup("Copa", season=2019)[0], 1)
+        self.assertIsNone(NameIndex("vazio").lookup("Copa"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import logging
+import unittest
+
+import numpy as np
+
+import odds
+
+def _book(name, bets):
+    return {"id": len(name), "name": name, "bets": [{"id": bet_id, "name": bet_name, "values": [{"value": v, "odd": o} for v, o in values]}
+                                                   for bet_id, bet_name, values in bets]}
+
+RAW_ODDS = {"bookmakers": [
+    _book("Bet365", [(1, "Match Winner", [("Home", "2.10"), ("Draw", "3.40"), ("Away", "3.50")]),
+                     (5, "Goals Over/Under", [("Over 2.5", "1.90"), ("Under 2.5", "1.90")])]),
+    _book("Pinnacle", [(1, "Match Winner", [("Home", "2.05"), ("Draw", "3.60"), ("Away", "3.80")]),
+                       (5, "Goals Over/Under", [("Over 2.5", "1.95"), ("Under 2.5", "1.88")]),
+                       (4, "Asian Handicap", [("Home -0.5", "2.08"), ("Away +0.5", "1.82")])]),
+    # Quotes only the home win: it can offer the best price but can't be de-vigged
+    _book("Betfair", [(1, "Match Winner", [("Home", "2.25")]),
+                      (45, "Corners Over/Under", [("Over 9.5", "1.85")])]),
+]}
+
+def _no_vig(prices):
+    implied = [1 / p for p in prices]
+    return [q / sum(implied) for q in implied]
+
+class TestOddsTable(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.table = odds.parse_odds_table(RAW_ODDS)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_best_price_and_bookmaker(self):
+        self.assertEqual(self.table.detalhes("1X2", "casa")[:2], (2.25, "Betfair"))
+        self.assertEqual(self.table.detalhes("1X2", "empate")[:2], (3.60, "Pinnacle"))
+        self.assertEqual(self.table.detalhes("1X2", "fora")[:2], (3.80, "Pinnacle"))
+        self.assertEqual(self.table.detalhes("OverUnderGols", "Under2.5")[:2], (1.90, "Bet365"))
+        self.assertIsNone(self.table.detalhes("BTTS", "Sim"))
+        melhores = self.table.melhores_odds()
+        self.assertEqual(set(melhores), set(odds.MERCADOS))
+        self.assertEqual(melhores["1X2"], {"casa": 2.25, "empate": 3.60, "fora": 3.80})
+        self.assertEqual(melhores["AH"], {"-0.5_home": 2.08, "+0.5_away": 1.82})
+        self.assertEqual(melhores["OverUnderCantos"], {"Over9.5": 1.85})
+
+    def test_no_vig_consensus_averages_complete_books(self):
+        bet365 = _no_vig([2.10, 3.40, 3.50])
+        pinnacle = _no_vig([2.05, 3.60, 3.80])
+        for i, key in enumerate(("casa", "empate", "fora")):
+            esperado = round((bet365[i] + pinnacle[i]) / 2 * 100, 1)
+            self.assertEqual(self.table.detalhes("1X2", key)[2], esperado, key)
+        soma = sum(self.table.detalhes("1X2", key)[2] for key in ("casa", "empate", "fora"))
+        self.assertAlmostEqual(soma, 100, delta=0.15)
+        # Over/Under 2.5 and the AH pair are their own groups
+        over = (_no_vig([1.90, 1.90])[0] + _no_vig([1.95, 1.88])[0]) / 2
+        self.assertEqual(self.table.detalhes("OverUnderGols", "Over2.5")[2], round(over * 100, 1))
+        self.assertEqual(self.table.detalhes("AH", "-0.5_home")[2], round(_no_vig([2.08, 1.82])[0] * 100, 1))
+        # A one-sided quote has no consensus
+        self.assertIsNone(self.table.detalhes("OverUnderCantos", "Over9.5")[2])
+
+    def test_level_handicap_pairs_home_and_away(self):
+        raw = {"bookmakers": [_book("A", [(4, "Asian Handicap", [("Home 0", "1.95"), ("Away 0", "1.90")])]),
+                              _book("B", [(4, "Asian Handicap", [("Home +0", "1.92"), ("Away -0", "1.93")])])]}
+        table = odds.parse_odds_table(raw)
+        self.assertEqual(table.melhores_odds()["AH"], {"+0.0_home": 1.95, "+0.0_away": 1.93})
+        casa = (_no_vig([1.95, 1.90])[0] + _no_vig([1.92, 1.93])[0]) / 2
+        self.assertEqual(table.detalhes("AH", "+0.0_home")[2], round(casa * 100, 1))
+        self.assertAlmostEqual(table.detalhes("AH", "+0.0_home")[2] + table.detalhes("AH", "+0.0_away")[2], 100, delta=0.15)
+
+    def test_duplicate_quote_keeps_the_best_price(self):
+        raw = {"bookmakers": [_book("A", [(8, "Both Teams Score", [("Yes", "1.70"), ("No", "2.10")]),
+                                          (8, "Both Teams Score", [("Yes", "1.75")])])]}
+        table = odds.parse_odds_table(raw)
+        self.assertEqual(table.detalhes("BTTS", "Sim")[0], 1.75)
+        self.assertEqual(table.detalhes("BTTS", "Sim")[2], round(_no_vig([1.75, 2.10])[0] * 100, 1))
+
+    def test_single_book_shape_and_stored_rows_build_the_same_table(self):
+        bet365 = RAW_ODDS["bookmakers"][0]
+        single = odds.parse_odds_table({"bookmaker": {"id": 8, "name": "Bet365"}, "bets": bet365["bets"]})
+        rows = odds.tabela_de_registros(["1X2", "1X2", "1X2", "OverUnderGols", "OverUnderGols"],
+                                        ["Home", "Draw", "Away", "Over 2.5", "Under 2.5"], ["Bet365"] * 5,
+                                        [2.10, 3.40, 3.50, 1.90, 1.90])
+        self.assertEqual(single.selecoes, rows.selecoes)
+        np.testing.assert_array_equal(single.melhor_preco, rows.melhor_preco)
+        np.testing.assert_allclose(single.prob_consenso, rows.prob_consenso)
+
+    def test_alignment_and_empty_input(self):
+        np.testing.assert_array_equal(self.table.alinhar([("1X2", "fora"), ("BTTS", "Nao")]), [self.table.indice[("1X2", "fora")], -1])
+        vazia = odds.parse_odds_table(None)
+        self.assertEqual(len(vazia), 0)
+        self.assertEqual(vazia.melhores_odds(), {mercado: {} for mercado in odds.MERCADOS})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import logging
+import threading
+import unittest
+from unittest import mock
+
+import prefetch
+import rate_limiter
+
+def _fixture(fixture_id, timestamp, league_id=39):
+    return {"fixture_id": fixture_id, "timestamp": timestamp, "league_id": league_id, "season": 2023,
+            "home_id": fixture_id * 10, "away_id": fixture_id * 10 + 1,
+            "home_name": f"Casa {fixture_id}", "away_name": f"Fora {fixture_id}", "league_name": "Liga"}
+
+class TestRunPrefetch(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.limiter = rate_limiter.RateLimiter(per_minute=60000, per_day=100)
+        self.upcoming = {39: [_fixture(3, 3000), _fixture(1, 1000)], 140: [_fixture(2, 2000, 140), _fixture(4, 4000, 140)]}
+        self.priorities = []
+        self.warmed = []
+        self.patches = [mock.patch.object(rate_limiter, "get_limiter", return_value=self.limiter),
+                        mock.patch.object(prefetch, "get_upcoming_fixtures", side_effect=self._upcoming),
+                        mock.patch.object(prefetch, "get_processed_fixture_data_by_ids", side_effect=self._process)]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        logging.disable(logging.NOTSET)
+
+    def _spend(self, calls):
+        for _ in range(calls):
+            self.limiter.acquire()
+
+    def _upcoming(self, league_id, season, hours_ahead):
+        self.priorities.append(rate_limiter.endpoint_priority("fixtures"))
+        self._spend(1)
+        return list(self.upcoming[league_id]), None
+
+    def _process(self, home_id, away_id, league_id, season, **names):
+        self.priorities.append(rate_limiter.endpoint_priority("odds"))
+        self._spend(prefetch.CALLS_PER_FIXTURE)
+        self.warmed.append(home_id // 10)
+        return {"error": False, "home_team_id": home_id}
+
+    def test_warms_soonest_fixtures_first_up_to_the_limit(self):
+        warmed = prefetch.run_prefetch([39, 140], 2023, hours_ahead=48, max_fixtures=3)
+        self.assertEqual(self.warmed, [1, 2, 3])
+        self.assertEqual([data["home_team_id"] for data in warmed], [10, 20, 30])
+
+    def test_every_call_runs_at_low_priority(self):
+        prefetch.run_prefetch([39, 140], 2023, hours_ahead=48, max_fixtures=10)
+        self.assertEqual(len(self.priorities), 2 + 4)
+        self.assertEqual(set(self.priorities), {rate_limiter.PRIORIDADE_BAIXA})
+        self.assertEqual(rate_limiter.endpoint_priority("odds"), rate_limiter.ENDPOINT_PRIORITIES.get("odds", rate_limiter.PRIORIDADE_NORMAL)) # Restored afterwards
+
+    def test_stops_before_the_users_quota_reserve(self):
+        # 100/day with a 50% reserve: 2 listing calls + 9 fixtures * 5 calls = 47 spent, a 10th fixture would cross 50
+        self.upcoming = {39: [_fixture(n, n * 100) for n in range(1, 21)], 140: []}
+        with mock.patch.object(prefetch, "PREFETCH_QUOTA_RESERVE", 0.5):
+            warmed = prefetch.run_prefetch([39, 140], 2023, hours_ahead=48, max_fixtures=20)
+        self.assertEqual(len(warmed), 9)
+        self.assertGreaterEqual(self.limiter.stats()["day_remaining"], 50)
+
+        self._spend(self.limiter.stats()["day_remaining"] - 50)
+        self.warmed, self.priorities = [], []
+        self.assertEqual(prefetch.run_prefetch([39, 140], 2023, hours_ahead=48, max_fixtures=20), [])
+        self.assertEqual(self.priorities, []) # Not even the fixture listing is fetched
+
+    def test_overlapping_runs_are_skipped(self):
+        started, release = threading.Event(), threading.Event()
+
+        def _slow(league_id, season, hours_ahead):
+            started.set()
+            release.wait(5)
+            return [], None
+
+        with mock.patch.object(prefetch, "get_upcoming_fixtures", side_effect=_slow):
+            first = threading.Thread(target=prefetch.run_prefetch, args=([39], 2023, 48, 5))
+            first.start()
+            self.assertTrue(started.wait(5))
+            self.assertEqual(prefetch.run_prefetch([39], 2023, 48, 5), [])
+            release.set()
+            first.join(5)
+        self.assertEqual(prefetch.get_upcoming_fixtures.call_count, 0) # The skipped run never reached the API
+        prefetch.run_prefetch([39], 2023, 48, 5)
+        self.assertEqual(self.warmed, [1, 3]) # The lock is released once the slow run ends
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+import json
+import logging
+import threading
+import time
+import unittest
+from unittest import mock
+
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+import api_handler
+import rate_limiter
+
+def _response(status, body, headers=None):
+    response = Response()
+    response.status_code = status
+    response._content = json.dumps(body).encode()
+    response.headers = CaseInsensitiveDict(headers or {})
+    response.url = "https://v3.football.api-sports.io/teams"
+    return response
+
+class TestTokenBucket(unittest.TestCase):
+    def test_wait_time_follows_refill_rate(self):
+        bucket = rate_limiter.TokenBucket(10, 60)
+        now = bucket.updated
+        for _ in range(10):
+            self.assertEqual(bucket.wait_time(now), 0.0)
+            bucket.take(now)
+        self.assertAlmostEqual(bucket.wait_time(now), 6.0)
+        self.assertAlmostEqual(bucket.wait_time(now + 4.5), 1.5)
+        self.assertEqual(bucket.wait_time(now + 6.0), 0.0)
+        # Refill never goes above capacity
+        bucket.wait_time(now + 3600)
+        self.assertEqual(bucket.tokens, 10)
+
+    def test_resync_and_drain(self):
+        bucket = rate_limiter.TokenBucket(10, 60)
+        now = bucket.updated
+        bucket.resync(3, limit=30, now=now)
+        self.assertEqual((bucket.capacity, bucket.tokens), (30, 3))
+        bucket.drain(now)
+        self.assertAlmostEqual(bucket.wait_time(now), 2.0)
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_rejects_when_wait_exceeds_max_wait(self):
+        limiter = rate_limiter.RateLimiter(per_minute=2, per_day=100, max_wait=0.5)
+        self.assertTrue(limiter.acquire())
+        self.assertTrue(limiter.acquire())
+        started = time.monotonic()
+        self.assertFalse(limiter.acquire()) # The next token is 30s away: give up at once instead of sleeping
+        self.assertLess(time.monotonic() - started, 0.2)
+        stats = limiter.stats()
+        self.assertEqual((stats["granted"], stats["rejected"], stats["queued"]), (2, 1, 0))
+
+    def test_day_bucket_also_limits(self):
+        limiter = rate_limiter.RateLimiter(per_minute=100, per_day=1, max_wait=0)
+        self.assertTrue(limiter.acquire())
+        self.assertFalse(limiter.acquire())
+
+    def test_waiters_are_served_by_priority_then_arrival(self):
+        limiter = rate_limiter.RateLimiter(per_minute=100, per_day=1000, max_wait=10)
+        limiter.minute_bucket = rate_limiter.TokenBucket(1, 0.3) # One token every 0.3s
+        self.assertTrue(limiter.acquire())
+        order = []
+        order_lock = threading.Lock()
+
+        def _call(name, priority):
+            self.assertTrue(limiter.acquire(priority))
+            with order_lock:
+                order.append(name)
+
+        threads = []
+        for name, priority in [("baixa", rate_limiter.PRIORIDADE_BAIXA), ("normal-1", rate_limiter.PRIORIDADE_NORMAL),
+                               ("alta", rate_limiter.PRIORIDADE_ALTA), ("normal-2", rate_limiter.PRIORIDADE_NORMAL)]:
+            thread = threading.Thread(target=_call, args=(name, priority))
+            thread.start()
+            threads.append(thread)
+            while limiter.stats()["queued"] < len(threads):
+                time.sleep(0.005)
+        for thread in threads:
+            thread.join(timeout=5)
+        self.assertEqual(order, ["alta", "normal-1", "normal-2", "baixa"])
+        self.assertEqual(limiter.stats()["throttled"], 4)
+
+    def test_headers_resync_but_never_raise_minute_budget(self):
+        limiter = rate_limiter.RateLimiter(per_minute=10, per_day=100)
+        limiter.sync_from_headers({"x-ratelimit-requests-limit": "7500", "x-ratelimit-requests-remaining": "42",
+                                   "X-RateLimit-Limit": "300", "X-RateLimit-Remaining": "299"})
+        stats = limiter.stats()
+        self.assertEqual((stats["day_limit"], stats["day_remaining"]), (7500, 42))
+        self.assertEqual((stats["minute_limit"], stats["minute_remaining"]), (300, 10))
+
+    def test_priority_context_overrides_endpoint_priority(self):
+        self.assertEqual(rate_limiter.endpoint_priority("teams"), rate_limiter.PRIORIDADE_ALTA)
+        with rate_limiter.prioridade(rate_limiter.PRIORIDADE_BAIXA):
+            self.assertEqual(rate_limiter.endpoint_priority("teams"), rate_limiter.PRIORIDADE_BAIXA)
+        self.assertEqual(rate_limiter.endpoint_priority("odds"), rate_limiter.PRIORIDADE_NORMAL)
+
+class TestBackoff(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        # Plenty of per-minute quota so a penalized (drained) bucket refills in milliseconds
+        self.limiter = rate_limiter.RateLimiter(per_minute=60000, per_day=1000, max_wait=5)
+        self.patches = [mock.patch.object(rate_limiter, "get_limiter", return_value=self.limiter),
+                        mock.patch.object(api_handler, "API_KEY", "chave-de-teste"),
+                        mock.patch.object(api_handler.time, "sleep")]
+        self.sleep = self.patches[-1].start()
+        for patch in self.patches[:-1]:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        logging.disable(logging.NOTSET)
+
+    def test_delay_grows_exponentially_with_jitter_and_honours_retry_after(self):
+        with mock.patch.object(rate_limiter.random, "uniform", side_effect=lambda a, b: b):
+            self.assertEqual([rate_limiter.backoff_delay(a) for a in range(7)], [1.5, 3.0, 6.0, 12.0, 24.0, 45.0, 45.0])
+            self.assertEqual(rate_limiter.backoff_delay(0, retry_after="7"), 7 + rate_limiter.API_BACKOFF_BASE)
+            self.assertEqual(rate_limiter.backoff_delay(0, retry_after="não-numérico"), 1.5)
+        with mock.patch.object(rate_limiter.random, "uniform", side_effect=lambda a, b: a):
+            self.assertEqual(rate_limiter.backoff_delay(2), 2.0)
+
+    def test_429_is_retried_after_backoff(self):
+        responses = [_response(429, {}, {"Retry-After": "2"}),
+                     _response(200, {"errors": {"rateLimit": "Too many requests"}, "response": []}),
+                     _response(200, {"errors": [], "response": [{"team": {"id": 33}}]})]
+        with mock.patch.object(api_handler, "_http_get", side_effect=responses) as http_get:
+            result = api_handler._request_api("teams", {"search": "Manchester"}, None)
+        self.assertEqual(result, [{"team": {"id": 33}}])
+        self.assertEqual(http_get.call_count, 3)
+        delays = [c.args[0] for c in self.sleep.call_args_list]
+        self.assertEqual(len(delays), 2)
+        self.assertTrue(2 <= delays[0] <= 2 + rate_limiter.API_BACKOFF_BASE)
+        stats = self.limiter.stats()
+        self.assertEqual((stats["server_rate_limited"], stats["granted"]), (2, 3))
+
+    def test_gives_up_after_max_retries(self):
+        with mock.patch.object(api_handler, "_http_get", return_value=_response(429, {})) as http_get:
+            result = api_handler._request_api("teams", {"search": "Manchester"}, None)
+        self.assertTrue(result["error"])
+        self.assertIn("429", result["message"])
+        self.assertEqual(http_get.call_count, rate_limiter.API_MAX_RETRIES + 1)
+        self.assertEqual(self.sleep.call_count, rate_limiter.API_MAX_RETRIES)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import logging
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import score_models
+
+MAX_GOALS = 15
+MARGINAL_MAX_GOALS = 25 # Wide enough that the truncated tail is negligible in the marginal checks
+
+class TestScoreModels(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        rng = np.random.default_rng(5)
+        self.lambdas_casa = rng.uniform(0.2, 3.5, 50)
+        self.lambdas_fora = rng.uniform(0.2, 3.0, 50)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def _matrices(self, nome, parametro, max_goals=MAX_GOALS):
+        n = len(self.lambdas_casa)
+        matrices, valid = score_models.score_matrices(self.lambdas_casa, self.lambdas_fora, max_goals, [nome] * n, [parametro] * n)
+        self.assertTrue(valid.all())
+        return matrices
+
+    def test_every_model_sums_to_one(self):
+        for nome, parametro in [("poisson", 0.0), ("dixon_coles", -0.1), ("dixon_coles", 0.1), ("bivariate_poisson", 0.2)]:
+            matrices = self._matrices(nome, parametro)
+            np.testing.assert_allclose(matrices.sum(axis=(1, 2)), 1.0, err_msg=nome)
+            self.assertTrue((matrices >= 0).all(), nome)
+
+    def test_dixon_coles_tau_keeps_the_raw_mass(self):
+        """The tau correction only moves mass between 0-0, 0-1, 1-0 and 1-1; it adds or removes none."""
+        goals = MAX_GOALS
+        independent = score_models._matrizes_poisson(self.lambdas_casa, self.lambdas_fora, None, goals)
+        corrected = score_models._matrizes_dixon_coles(self.lambdas_casa, self.lambdas_fora, np.full(50, -0.1), goals)
+        np.testing.assert_allclose(corrected.sum(axis=(1, 2)), independent.sum(axis=(1, 2)), rtol=1e-12)
+        self.assertTrue((corrected[:, 0, 0] > independent[:, 0, 0]).all()) # rho < 0 inflates 0-0
+        np.testing.assert_array_equal(corrected[:, 2:, :], independent[:, 2:, :])
+
+    def test_dixon_coles_with_zero_rho_is_independent_poisson(self):
+        np.testing.assert_allclose(self._matrices("dixon_coles", 0.0), self._matrices("poisson", 0.0), rtol=0, atol=1e-15)
+
+    def test_bivariate_poisson_keeps_marginals_and_covariance(self):
+        lambda3 = 0.15
+        matrices = self._matrices("bivariate_poisson", lambda3, MARGINAL_MAX_GOALS)
+        goals = np.arange(MARGINAL_MAX_GOALS + 1)
+        home = matrices.sum(axis=2)
+        away = matrices.sum(axis=1)
+        np.testing.assert_allclose(home @ goals, self.lambdas_casa, rtol=1e-6)
+        np.testing.assert_allclose(away @ goals, self.lambdas_fora, rtol=1e-6)
+        covariance = np.einsum("nij,i,j->n", matrices, goals, goals) - (home @ goals) * (away @ goals)
+        np.testing.assert_allclose(covariance, lambda3, atol=1e-6)
+        # With no shared component it's independent Poisson
+        np.testing.assert_allclose(self._matrices("bivariate_poisson", 0.0), self._matrices("poisson", 0.0), atol=1e-15)
+
+    def test_league_override_selects_the_model(self):
+        with mock.patch.object(score_models, "_modelos_por_liga", score_models._parse_leagues("39:dixon_coles, 140:bivariate_poisson, x:y")), \
+             mock.patch.object(score_models, "SCORE_MODEL", "poisson"):
+            self.assertEqual(score_models.modelo_da_liga(39), "dixon_coles")
+            self.assertEqual(score_models.modelo_da_liga(140), "bivariate_poisson")
+            self.assertEqual(score_models.modelo_da_liga(71), "poisson")
+            self.assertEqual(score_models.modelo_do_jogo({"league_id": 39, "rho": -0.123}), ("dixon_coles", -0.123))
+            self.assertEqual(score_models.modelo_do_jogo({"league_id": 39}), ("dixon_coles", score_models.DIXON_COLES_RHO))
+            self.assertEqual(score_models.modelo_do_jogo({"league_id": 140}), ("bivariate_poisson", score_models.BIVARIATE_POISSON_COV))
+            # An explicit model on the fixture wins; an unknown one falls back to Poisson
+            self.assertEqual(score_models.modelo_do_jogo({"league_id": 39, "score_model": "poisson"}), ("poisson", 0.0))
+            self.assertEqual(score_models.modelo_do_jogo({"score_model": "inexistente"}), ("poisson", 0.0))
+
+    def test_mixed_batch_matches_single_model_calls(self):
+        modelos = ["poisson", "dixon_coles", "bivariate_poisson"] * 4
+        parametros = [0.0, -0.08, 0.1] * 4
+        lambdas_casa, lambdas_fora = self.lambdas_casa[:12], self.lambdas_fora[:12]
+        mixed, _ = score_models.score_matrices(lambdas_casa, lambdas_fora, 10, modelos, parametros)
+        for n, (nome, parametro) in enumerate(zip(modelos, parametros)):
+            single, _ = score_models.score_matrices(lambdas_casa[n:n + 1], lambdas_fora[n:n + 1], 10, [nome], [parametro])
+            np.testing.assert_allclose(mixed[n], single[0], err_msg=nome)
+
+if __name__ == '__main__':
+    unittest.main()
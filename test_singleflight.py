@@ -0,0 +1,114 @@
+import asyncio
+import threading
+import unittest
+
+from singleflight import AsyncSingleFlight, SingleFlight
+
+N_CALLERS = 8
+
+class TestSingleFlight(unittest.TestCase):
+    def _run_concurrently(self, flight, key, func):
+        """Starts N_CALLERS threads on flight.do(key, func) while func is held; returns [(result or exception, shared)]."""
+        outcomes = [None] * N_CALLERS
+
+        def _caller(i):
+            try:
+                outcomes[i] = flight.do(key, func)
+            except Exception as e:
+                outcomes[i] = (e, None)
+
+        threads = [threading.Thread(target=_caller, args=(i,)) for i in range(N_CALLERS)]
+        for thread in threads:
+            thread.start()
+        return threads, outcomes
+
+    def _wait_for_followers(self, flight):
+        while flight.stats()["shared"] < N_CALLERS - 1:
+            threading.Event().wait(0.005)
+
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def _work():
+            calls.append(1)
+            release.wait(5)
+            return {"response": [1, 2, 3]}
+
+        threads, outcomes = self._run_concurrently(flight, "teams?search=Arsenal", _work)
+        self._wait_for_followers(flight)
+        release.set()
+        for thread in threads:
+            thread.join(timeout=5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(shared for _, shared in outcomes), [False] + [True] * (N_CALLERS - 1))
+        self.assertTrue(all(result is outcomes[0][0] for result, _ in outcomes))
+        self.assertEqual(flight.stats(), {"executed": 1, "shared": N_CALLERS - 1, "in_flight": 0})
+
+    def test_exception_reaches_every_caller_and_is_not_cached(self):
+        flight = SingleFlight()
+        release = threading.Event()
+
+        def _fail():
+            release.wait(5)
+            raise ValueError("API fora do ar")
+
+        threads, outcomes = self._run_concurrently(flight, "odds?fixture=1", _fail)
+        self._wait_for_followers(flight)
+        release.set()
+        for thread in threads:
+            thread.join(timeout=5)
+        self.assertTrue(all(isinstance(error, ValueError) and str(error) == "API fora do ar" for error, _ in outcomes))
+        # The failed call is forgotten: the next one runs again
+        self.assertEqual(flight.do("odds?fixture=1", lambda: "ok"), ("ok", False))
+        self.assertEqual(flight.stats()["executed"], 2)
+
+    def test_different_keys_and_sequential_calls_run_separately(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.do("a", lambda: 1), (1, False))
+        self.assertEqual(flight.do("a", lambda: 2), (2, False))
+        self.assertEqual(flight.do("b", lambda: 3), (3, False))
+        self.assertEqual(flight.stats(), {"executed": 3, "shared": 0, "in_flight": 0})
+
+class TestAsyncSingleFlight(unittest.TestCase):
+    def test_concurrent_awaits_share_one_task(self):
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def _analysis():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "relatório"
+
+        async def _main():
+            return await asyncio.gather(*(flight.do("Arsenal x Chelsea", _analysis) for _ in range(N_CALLERS)))
+
+        outcomes = asyncio.run(_main())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(outcomes, [("relatório", False)] + [("relatório", True)] * (N_CALLERS - 1))
+        self.assertEqual(flight.stats(), {"executed": 1, "shared": N_CALLERS - 1, "in_flight": 0})
+
+    def test_exception_propagates_and_cancelling_one_caller_keeps_the_task(self):
+        flight = AsyncSingleFlight()
+
+        async def _fail():
+            await asyncio.sleep(0.02)
+            raise RuntimeError("falhou")
+
+        async def _main():
+            first = asyncio.ensure_future(flight.do("k", _fail))
+            second = asyncio.ensure_future(flight.do("k", _fail))
+            await asyncio.sleep(0)
+            first.cancel()
+            with self.assertRaises(RuntimeError):
+                await second
+            with self.assertRaises(asyncio.CancelledError):
+                await first
+            return await flight.do("k", lambda: asyncio.sleep(0, result="de novo"))
+
+        self.assertEqual(asyncio.run(_main()), ("de novo", False))
+        self.assertEqual(flight.stats()["executed"], 2)
+
+if __name__ == '__main__':
+    unittest.main()